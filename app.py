@@ -1,47 +1,103 @@
 from flask import Flask, send_file
 from flask_restful import Api
 from flask_cors import CORS
-from datetime import timedelta
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config import get_config
 from database.db_init import init_db
 from routes.auth_routes import AuthResource
-from routes.product_routes import ProductsResource
+from routes.product_routes import (ProductsResource, RelatedProductsResource, SimilarProductsResource,
+                                   SuggestResource)
 from routes.cart_routes import CartResource
 from routes.order_routes import OrdersResource
 from routes.user_routes import UsersResource
 from routes.wishlist_routes import WishlistResource
 from routes.reviews_routes import ReviewsResource
 from routes.notifications_routes import NotificationsResource
+from routes.admin_routes import CacheStatsResource, AdminStatsResource, DeletionJobsResource, OrphansResource
+from routes.analytics_routes import SalesAnalyticsResource, TopSellersResource, InventoryForecastResource
+from routes.image_routes import ImagesResource, ImageFileResource
+from database.stats import stats_reconciler
+from database.deletion import deletion_reaper
+from database.wishlist_alerts import wishlist_alerter
+from database.recommendations import recommender
+from database.suggest import suggester
+from utils.images import thumbnailer
+from utils.serialization import output_json
+from utils.rate_limit import init_rate_limiting
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-change-this'
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
+def start_background_workers(config):
+    """Start the maintenance threads of this process from an app's config.
 
-# Simplified CORS - like the working minimal server
-CORS(app, origins="*", supports_credentials=True)
+    Under serve.py with PRELOAD_APP they are started after fork in each
+    worker, never in the gunicorn master.
+    """
+    stats_reconciler.start(config['STATS_RECONCILE_INTERVAL'])
+    deletion_reaper.start(config['DELETION_REAPER_INTERVAL'])
+    wishlist_alerter.start(config['WISHLIST_ALERT_INTERVAL'])
+    recommender.start(config['RECOMMENDATIONS_INTERVAL'])
+    suggester.start(config['SUGGEST_INTERVAL'])
+    thumbnailer.start(config['IMAGE_WORKERS'])
 
-api = Api(app)
+def create_app(config_name=None, start_workers=True):
+    """Application factory; config_name defaults to the APP_ENV environment variable.
 
-# Register API Routes with complete CRUD patterns
-api.add_resource(AuthResource, '/api/auth')
-api.add_resource(ProductsResource, '/api/products', '/api/products/<int:product_id>')
-api.add_resource(CartResource, '/api/cart', '/api/cart/<int:cart_id>')
-api.add_resource(WishlistResource, '/api/wishlist', '/api/wishlist/<int:wishlist_id>')
-api.add_resource(ReviewsResource, '/api/reviews', '/api/reviews/<int:review_id>')
-api.add_resource(NotificationsResource, '/api/notifications', '/api/notifications/<int:notification_id>')
-api.add_resource(OrdersResource, '/api/orders', '/api/orders/<int:order_id>')  # Added order_id route
-api.add_resource(UsersResource, '/api/users', '/api/users/<int:user_id>')      # Added user_id route
+    start_workers=False leaves the background threads to the caller
+    (start_background_workers), e.g. for a server that forks afterwards.
+    """
+    app = Flask(__name__)
+    app.config.from_object(get_config(config_name))
+    app.secret_key = app.config['SECRET_KEY']
+    
+    # Behind reverse proxies, remote_addr becomes the client they forwarded for
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
 
-# Serve the main HTML file
-@app.route('/')
-def index():
-    return send_file('index.html')
+    # Simplified CORS - like the working minimal server
+    CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
+
+    init_rate_limiting(app)
+
+    api = Api(app)
+    api.representations['application/json'] = output_json
+
+    # Register API Routes with complete CRUD patterns
+    api.add_resource(AuthResource, '/api/auth')
+    api.add_resource(ProductsResource, '/api/products', '/api/products/<int:product_id>')
+    api.add_resource(SuggestResource, '/api/products/suggest')
+    api.add_resource(RelatedProductsResource, '/api/products/<int:product_id>/related')
+    api.add_resource(SimilarProductsResource, '/api/products/<int:product_id>/similar')
+    api.add_resource(CartResource, '/api/cart', '/api/cart/<int:cart_id>')
+    api.add_resource(WishlistResource, '/api/wishlist', '/api/wishlist/<int:wishlist_id>')
+    api.add_resource(ReviewsResource, '/api/reviews', '/api/reviews/<int:review_id>')
+    api.add_resource(NotificationsResource, '/api/notifications', '/api/notifications/<int:notification_id>')
+    api.add_resource(OrdersResource, '/api/orders', '/api/orders/<int:order_id>')  # Added order_id route
+    api.add_resource(UsersResource, '/api/users', '/api/users/<int:user_id>')      # Added user_id route
+    api.add_resource(CacheStatsResource, '/api/admin/cache')
+    api.add_resource(AdminStatsResource, '/api/admin/stats')
+    api.add_resource(DeletionJobsResource, '/api/admin/deletions', '/api/admin/deletions/<int:job_id>')
+    api.add_resource(OrphansResource, '/api/admin/orphans')
+    api.add_resource(SalesAnalyticsResource, '/api/admin/analytics/sales')
+    api.add_resource(TopSellersResource, '/api/admin/analytics/top')
+    api.add_resource(InventoryForecastResource, '/api/admin/inventory/forecast')
+    api.add_resource(ImagesResource, '/api/images')
+    api.add_resource(ImageFileResource, '/images/<string:name>', '/images/<string:name>/<string:variant>')
+
+    # Serve the main HTML file
+    @app.route('/')
+    def index():
+        return send_file('index.html')
+
+    if app.config['INIT_DB']:
+        init_db(reset_products=app.config['RESET_PRODUCTS'])
+    if start_workers:
+        start_background_workers(app.config)
+
+    return app
 
 if __name__ == '__main__':
-    init_db()
+    app = create_app()
     print("Starting Flask server...")
     print("Backend will be available at: http://localhost:5000")
     print("Make sure to access your HTML file through a local server, not file://")
-    print("\nNew CRUD endpoints available:")
-    print("- GET/PUT/DELETE /api/orders/<id> - View/Update/Cancel specific orders")
-    print("- GET/POST/PUT/DELETE /api/users/<id> - Complete user management")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    print("For production traffic use: APP_ENV=production python serve.py")
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=5000)
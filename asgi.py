@@ -0,0 +1,225 @@
+"""ASGI entry point with an async read path for the hottest GET endpoints.
+
+    uvicorn asgi:app --workers 4
+
+Product listing, product detail, reviews by product and notifications are
+served natively on the event loop, with SQLite work offloaded to the bounded
+pool in database/async_db.py. Notifications support long-polling
+(`?wait=<seconds>&since_id=<id>`) that costs a coroutine instead of a worker
+thread per waiting client.
+
+Routing, query code, serialization, ETags and the session cookie are shared
+with the Flask-RESTful resources: URLs are matched against the Flask app's
+own url_map, and everything else (writes, admin, auth) is handed to the
+Flask app through asgiref's WSGI adapter.
+"""
+import asyncio
+import os
+import time
+from urllib.parse import parse_qsl
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, parse_date, parse_cookie
+from app import create_app
+from database.async_db import async_db
+from database.catalog import get_catalog_version
+from database.listing_cache import listing_cache
+from database.product_cache import get_product
+from routes.product_routes import (parse_listing_args, query_product_listing, with_live_stock,
+                                   stock_affects_listing, listing_validators)
+from routes.reviews_routes import query_product_reviews
+from routes.notifications_routes import query_notifications
+from utils.fields import PRODUCT_FIELDS, REVIEW_FIELDS, NOTIFICATION_FIELDS
+from utils.http_cache import make_etag, parse_db_timestamp, cache_headers, validators_match
+from utils.serialization import dumps
+from utils.images import with_image_for
+from utils.rate_limit import request_cost, client_key, forwarded_client
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # pragma: no cover - optional dependency
+    WsgiToAsgi = None
+
+LONG_POLL_MAX_WAIT = 30.0
+LONG_POLL_INTERVAL = 1.0
+
+
+class Request:
+    def __init__(self, scope, flask_app):
+        self.scope = scope
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'),
+                                        keep_blank_values=True))
+        self._flask_app = flask_app
+        self._session = None
+
+    @property
+    def session(self):
+        """Decode the signed Flask session cookie with the Flask app's own serializer"""
+        if self._session is None:
+            app = self._flask_app
+            self._session = {}
+            cookie = parse_cookie(self.headers.get('cookie', '')).get(app.config['SESSION_COOKIE_NAME'])
+            serializer = app.session_interface.get_signing_serializer(app)
+            if cookie and serializer:
+                try:
+                    max_age = int(app.permanent_session_lifetime.total_seconds())
+                    self._session = serializer.loads(cookie, max_age=max_age)
+                except Exception:
+                    self._session = {}
+        return self._session
+
+    def not_modified(self, etag, last_modified):
+        return validators_match(
+            etag, last_modified,
+            parse_etags(self.headers.get('if-none-match')) if 'if-none-match' in self.headers else None,
+            parse_date(self.headers.get('if-modified-since'))
+        )
+
+
+# Handlers mirror the GET methods of the Flask-RESTful resources -------------
+
+async def products_get(request, product_id=None):
+    try:
+        fields = PRODUCT_FIELDS.parse(request.args.get('fields'))
+    except ValueError as e:
+        return 400, {'message': str(e)}, {}
+    if product_id:
+        product = await async_db.run(get_product, product_id)
+        if not product:
+            return 404, {'message': 'Product not found'}, {}
+        last_modified = parse_db_timestamp(product['updated_at'])
+        etag = make_etag('product', product['id'], product['updated_at'], product['stock'])
+        headers = cache_headers(etag, last_modified)
+        if request.not_modified(etag, last_modified):
+            return 304, None, headers
+        product = with_image_for(product, 'detail')
+        return 200, product if fields is None else fields.project(product), headers
+
+    listing_args = parse_listing_args(request.args)
+    version, version_updated_at = await async_db.run(get_catalog_version)
+    if not await async_db.run(stock_affects_listing, version, fields):
+        etag, last_modified = listing_validators(version, version_updated_at, listing_args, ())
+        if request.not_modified(etag, last_modified):
+            return 304, None, cache_headers(etag, last_modified)
+    result = await async_db.run(
+        listing_cache.get_or_compute, version, listing_args, lambda: query_product_listing(listing_args)
+    )
+    listing, stamp = await async_db.run(with_live_stock, result, fields)
+    etag, last_modified = listing_validators(version, version_updated_at, listing_args, stamp)
+    headers = cache_headers(etag, last_modified)
+    if request.not_modified(etag, last_modified):
+        return 304, None, headers
+    return 200, listing, headers
+
+
+async def reviews_get(request, review_id=None):
+    product_id = request.args.get('product_id', type=int)
+    if review_id or not product_id:
+        return None  # single reviews and the admin-wide list stay on Flask
+    try:
+        fields = REVIEW_FIELDS.parse(request.args.get('fields'))
+    except ValueError as e:
+        return 400, {'message': str(e)}, {}
+    return 200, await async_db.run(query_product_reviews, product_id, fields), {}
+
+
+async def notifications_get(request, notification_id=None):
+    if notification_id:
+        return None
+    user_id = request.session.get('user_id')
+    if not user_id:
+        return 401, {'message': 'Login required'}, {}
+
+    try:
+        fields = NOTIFICATION_FIELDS.parse(request.args.get('fields'))
+    except ValueError as e:
+        return 400, {'message': str(e)}, {}
+    unread_only = request.args.get('unread_only', type=bool)
+    limit = request.args.get('limit', 50, type=int)
+    since_id = request.args.get('since_id', type=int)
+    wait = min(request.args.get('wait', 0, type=float), LONG_POLL_MAX_WAIT)
+
+    deadline = time.monotonic() + wait
+    while True:
+        result = await async_db.run(query_notifications, user_id, unread_only, limit, since_id, fields)
+        if result['total'] or not since_id or time.monotonic() >= deadline:
+            return 200, result, {}
+        await asyncio.sleep(min(LONG_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+
+ASYNC_HANDLERS = {
+    'productsresource': products_get,
+    'reviewsresource': reviews_get,
+    'notificationsresource': notifications_get,
+}
+
+
+class AsyncReadApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app) if WsgiToAsgi else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        response = None
+        if scope['method'] in ('GET', 'HEAD'):
+            try:
+                adapter = self.flask_app.url_map.bind('localhost')
+                endpoint, view_args = adapter.match(scope['path'], method='GET')
+            except HTTPException:
+                endpoint, view_args = None, {}
+            handler = ASYNC_HANDLERS.get(endpoint)
+            if handler:
+                request = Request(scope, self.flask_app)
+                gate = self.flask_app.extensions.get('rate_limit')
+                if gate:
+                    cost = request_cost(endpoint, 'GET', request.args, view_args)
+                    remote_addr = forwarded_client(request.headers.get('x-forwarded-for'),
+                                                   (scope.get('client') or ('',))[0],
+                                                   self.flask_app.config['TRUSTED_PROXIES'])
+                    key = client_key(request.session.get('user_id'), remote_addr)
+                    rejected = gate.limit(key, cost)
+                    if rejected:
+                        return await self._send(scope, request, send, *rejected)
+                response = await handler(request, **view_args)
+                if response is not None:
+                    return await self._send(scope, request, send, *response)
+                if gate:
+                    gate.limiter.refund(key, cost)  # Flask charges it again
+
+        if self.wsgi is None:
+            return await self._send(scope, None, send, 404,
+                                    {'message': 'Not served by the async read path (install asgiref)'}, {})
+        return await self.wsgi(scope, receive, send)
+
+    async def _send(self, scope, request, send, status, data, headers):
+        body = b'' if data is None else dumps(data)
+        raw_headers = [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]
+        if data is not None:
+            raw_headers.append((b'content-type', b'application/json'))
+        raw_headers.append((b'content-length', str(len(body)).encode()))
+        origin = request.headers.get('origin') if request else None
+        if origin and self.flask_app.config['CORS_ORIGINS'] in ('*', origin):
+            # Same policy as Flask-CORS with supports_credentials=True
+            raw_headers.append((b'access-control-allow-origin', origin.encode('latin-1')))
+            raw_headers.append((b'access-control-allow-credentials', b'true'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+# Served processes default to production config (keeps the existing catalog)
+app = AsyncReadApp(create_app(os.environ.get('APP_ENV', 'production')))
@@ -0,0 +1,141 @@
+"""Compare the threaded WSGI server with the ASGI async read path.
+
+Starts each server on a throwaway copy of the databases, drives the hot read
+endpoints with N concurrent keep-alive connections, and reports requests
+per second plus the server's memory growth per concurrent connection.
+
+Usage:
+    python benchmarks/bench_async.py --concurrency 10 100 500 --duration 10
+
+The threaded server is serve.py (gunicorn gthread) with one worker and
+--threads threads; the async server is uvicorn asgi:app with one worker.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ['/api/products', '/api/products?category=Electronics&sort=price_asc',
+         '/api/products/3', '/api/reviews?product_id=1']
+
+
+def rss_kb(pid):
+    """Resident memory of a process and its children, in KiB"""
+    total = 0
+    pids = [pid]
+    try:
+        out = subprocess.run(['pgrep', '-P', str(pid)], capture_output=True, text=True).stdout
+        pids += [int(p) for p in out.split()]
+    except FileNotFoundError:
+        pass
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            continue
+    return total
+
+
+async def connection_loop(port, deadline, counts, index):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    i = index
+    try:
+        while time.monotonic() < deadline:
+            path = PATHS[i % len(PATHS)]
+            i += 1
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line in (b'\r\n', b'\n'):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value.strip())
+            await reader.readexactly(length)
+            counts[0] += 1
+    finally:
+        writer.close()
+
+
+async def drive(port, concurrency, duration, pid):
+    counts = [0]
+    deadline = time.monotonic() + duration
+    tasks = [asyncio.create_task(connection_loop(port, deadline, counts, i)) for i in range(concurrency)]
+    await asyncio.sleep(duration / 2)
+    peak_rss = rss_kb(pid)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    return counts[0] / duration, peak_rss, errors
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            asyncio.run(asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 1))
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def start_server(kind, workdir, port, threads):
+    env = dict(os.environ, APP_ENV='production', PYTHONPATH=ROOT)
+    if kind == 'threaded':
+        env.update(BIND=f'127.0.0.1:{port}', WEB_WORKERS='1', WEB_THREADS=str(threads))
+        cmd = [sys.executable, os.path.join(ROOT, 'serve.py')]
+    else:
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port),
+               '--log-level', 'warning', '--no-access-log']
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return proc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-async-')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    shutil.copy(os.path.join(ROOT, 'index.html'), workdir)
+    from database.db_init import init_db
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+
+    print(f"{'server':<10}{'conns':>7}{'req/s':>10}{'rss MiB':>10}{'KiB/conn':>10}{'errors':>8}")
+    for port, kind in ((5101, 'threaded'), (5102, 'async')):
+        proc = start_server(kind, workdir, port, args.threads)
+        try:
+            asyncio.run(drive(port, 4, 1.0, proc.pid))  # warm caches
+            idle = rss_kb(proc.pid)
+            for concurrency in args.concurrency:
+                rps, peak, errors = asyncio.run(drive(port, concurrency, args.duration, proc.pid))
+                per_conn = max(0, peak - idle) / concurrency
+                print(f"{kind:<10}{concurrency:>7}{rps:>10.0f}{peak / 1024:>10.1f}{per_conn:>10.1f}{errors:>8}")
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
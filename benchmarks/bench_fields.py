@@ -0,0 +1,130 @@
+"""Response size and latency of typical frontend views with and without ?fields=.
+
+Seeds a catalog (the sample products plus N more with realistic
+descriptions) and one customer with a full cart, wishlist, order history and
+notification list, then requests each view through the Flask test client
+twice: the full representation, and the sparse fieldset the view actually
+renders. Product listings are measured with the listing cache cleared, so
+every request runs its queries.
+
+Usage:
+    python benchmarks/bench_fields.py --products 5000 --requests 300
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# view: (full URL, sparse URL)
+VIEWS = {
+    'product grid': ('/api/products?per_page=50',
+                     '/api/products?per_page=50&fields=name,brand,price,stock,image_url,featured'),
+    'product page': ('/api/products/1', '/api/products/1?fields=name,description,price,stock,brand,image_url'),
+    'cart view': ('/api/cart',
+                  '/api/cart?fields=quantity,subtotal,product.name,product.brand,product.price,product.stock'),
+    'cart badge': ('/api/cart', '/api/cart?fields=quantity'),
+    'wishlist': ('/api/wishlist', '/api/wishlist?fields=added_at,product.name,product.price,product.image_url'),
+    'order history': ('/api/orders?page=1&include=items',
+                      '/api/orders?page=1&fields=status,total_amount,created_at,items.product_name,items.quantity'),
+    'notifications': ('/api/notifications', '/api/notifications?fields=title,type,read,created_at'),
+    'product reviews': ('/api/reviews?product_id=1', '/api/reviews?product_id=1&fields=rating,comment,username'),
+}
+
+
+def seed(products, items, orders, seed=0):
+    from database.db_init import get_db_connection, get_products_db_connection
+    rng = random.Random(seed)
+    description = ('Solid build, long battery life and a two-year warranty. Ships in recyclable '
+                   'packaging with a quick-start guide and all cables needed to get going. ') * 4
+    conn = get_products_db_connection(readonly=False)
+    conn.executemany('''
+        INSERT INTO products (name, description, price, stock, category, brand, tags, image_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(f'Product {i:05d}', description, round(rng.uniform(5, 900), 2), rng.randint(0, 200),
+           rng.choice(['Electronics', 'Home', 'Sports', 'Books']), f'Brand {i % 40}', 'sample,bench',
+           f'https://images.example.com/products/{i}.jpg') for i in range(products)])
+    conn.commit()
+    catalog = [row['id'] for row in conn.execute('SELECT id FROM products')]
+    snapshot = {row['id']: row for row in conn.execute('SELECT id, name, price, category, brand, image_url FROM products')}
+    conn.close()
+
+    conn = get_db_connection()
+    user_id = conn.execute("SELECT id FROM users WHERE username = 'bench'").fetchone()[0]
+    picks = rng.sample(catalog, items)
+    conn.executemany('INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)',
+                     [(user_id, pid, rng.randint(1, 3)) for pid in picks])
+    conn.executemany('INSERT INTO wishlist (user_id, product_id) VALUES (?, ?)', [(user_id, pid) for pid in picks])
+    for _ in range(orders):
+        order_id = conn.execute("INSERT INTO orders (user_id, total_amount, status) VALUES (?, 0, 'delivered')",
+                                (user_id,)).lastrowid
+        lines = [snapshot[pid] for pid in rng.sample(catalog, 4)]
+        conn.executemany('''
+            INSERT INTO order_items (order_id, product_id, quantity, price,
+                                     product_name, product_category, product_brand, product_image)
+            VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+        ''', [(order_id, p['id'], p['price'], p['name'], p['category'], p['brand'], p['image_url']) for p in lines])
+        conn.execute("INSERT INTO notifications (user_id, title, message, type) VALUES (?, ?, ?, 'order')",
+                     (user_id, f'Order #{order_id} Delivered', 'Your order has been delivered. ' * 3))
+    conn.executemany('INSERT OR IGNORE INTO reviews (user_id, product_id, rating, comment) VALUES (?, 1, ?, ?)',
+                     [(user_id, 5, 'Works as described, would buy again. ' * 3)])
+    conn.commit()
+    conn.close()
+
+
+def measure(client, urls, requests):
+    """(response size, median ms) per URL; requests alternate between the URLs so drift hits all equally"""
+    from database.listing_cache import listing_cache
+    samples = [[] for _ in urls]
+    sizes = [0] * len(urls)
+    for _ in range(requests):
+        for i, url in enumerate(urls):
+            listing_cache.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            samples[i].append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (url, response.status_code, response.data[:200])
+            sizes[i] = len(response.data)
+    return [(size, statistics.median(times)) for size, times in zip(sizes, samples)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=30, help='cart and wishlist items')
+    parser.add_argument('--orders', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix='bench-fields-'))
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from database.db_init import init_db
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+        app = create_app('testing')
+        client = app.test_client()
+        client.post('/api/auth', json={'action': 'register', 'username': 'bench',
+                                       'email': 'bench@example.com', 'password': 'bench-password'})
+        seed(args.products, args.items, args.orders)
+        client.post('/api/auth', json={'action': 'login', 'username': 'bench', 'password': 'bench-password'})
+
+        rows = []
+        for view, (full_url, sparse_url) in VIEWS.items():
+            (full_size, full_ms), (sparse_size, sparse_ms) = measure(client, (full_url, sparse_url), args.requests)
+            rows.append((view, full_size, sparse_size, full_ms, sparse_ms))
+
+    print(f"{'view':<18}{'full B':>10}{'sparse B':>10}{'saved':>8}{'full ms':>10}{'sparse ms':>11}{'speedup':>9}")
+    for view, full_size, sparse_size, full_ms, sparse_ms in rows:
+        print(f"{view:<18}{full_size:>10,}{sparse_size:>10,}{1 - sparse_size / full_size:>8.0%}"
+              f"{full_ms:>10.3f}{sparse_ms:>11.3f}{full_ms / sparse_ms:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
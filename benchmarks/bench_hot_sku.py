@@ -0,0 +1,113 @@
+"""Orders per second on one hot SKU, with and without sharded stock.
+
+Worker processes repeatedly run the stock step of checkout for the same
+product: either the products.db path (conditional decrement + catalog
+version bump, committed per order) or the sharded path (take_stock on a
+product flagged stock_sharded, settled after the commit). Reports successful decrements per second
+and "database is locked" failures for each mode, then checks that no unit
+was lost or double counted.
+
+Usage:
+    python benchmarks/bench_hot_sku.py --workers 8 --duration 5 --shards 8
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCT_ID = 1
+INITIAL_STOCK = 10_000_000
+
+
+def worker(workdir, sharded, duration, start_at, results):
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    from database.db_init import get_products_db_connection
+    from database.catalog import bump_catalog_version
+    from database.stock_shards import sharded_stock, take_stock
+
+    orders = locked = 0
+    order_ids = itertools.count(os.getpid() * 10**9)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    while time.time() < deadline:
+        conn = get_products_db_connection(readonly=False)
+        order_id = next(order_ids)
+        try:
+            taken = take_stock(conn, PRODUCT_ID, 1, sharded, order_id)
+            if taken == []:
+                bump_catalog_version(conn, [PRODUCT_ID])
+            conn.commit()
+            if taken:
+                sharded_stock.settle(order_id, taken)
+            orders += taken is not None
+        except sqlite3.OperationalError:
+            conn.rollback()
+            locked += 1
+        finally:
+            conn.close()
+    results.put((orders, locked))
+
+
+def run(label, workdir, sharded, workers, duration):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start_at = time.time() + 2  # let every process finish importing
+    procs = [ctx.Process(target=worker, args=(workdir, sharded, duration, start_at, results))
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    totals = [results.get(timeout=duration + 60) for _ in procs]
+    for proc in procs:
+        proc.join()
+    orders = sum(t[0] for t in totals)
+    locked = sum(t[1] for t in totals)
+    print(f"{label:<22}{orders / duration:>12.0f}{locked:>10}")
+    return orders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--shards', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-hot-')
+    os.chdir(workdir)
+    os.environ['STOCK_SHARDS'] = str(args.shards)  # inherited by the spawned workers
+    sys.path.insert(0, ROOT)
+    from database.db_init import init_db, get_products_db_connection
+    from database.stock_shards import sharded_stock, enable_sharding
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+    conn = get_products_db_connection(readonly=False)
+    conn.execute('UPDATE products SET stock = ? WHERE id = ?', (INITIAL_STOCK, PRODUCT_ID))
+    conn.commit()
+
+    print(f"{'mode':<22}{'orders/s':>12}{'locked':>10}")
+    catalog_orders = run('products.db row', workdir, False, args.workers, args.duration)
+    remaining = conn.execute('SELECT stock FROM products WHERE id = ?', (PRODUCT_ID,)).fetchone()[0]
+
+    enable_sharding(conn, PRODUCT_ID)
+    conn.commit()
+    sharded_orders = run(f'{args.shards} stock shards', workdir, True, args.workers, args.duration)
+    left = sharded_stock.totals([PRODUCT_ID])[PRODUCT_ID]
+    conn.close()
+
+    consistent = remaining == INITIAL_STOCK - catalog_orders and left == remaining - sharded_orders
+    print(f"\nStock accounting {'consistent' if consistent else 'INCONSISTENT'} "
+          f"({INITIAL_STOCK - left:,} units sold in total)")
+    return 0 if consistent else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Thumbnail generation and image serving for the local image store.
+
+Makes N synthetic camera-sized JPEGs and measures:
+    generate    time to write every IMAGE_SIZES variant of one image, naive
+                (full decode, each size resized from the original) vs
+                utils.images.make_variants (JPEG draft decode, each size from
+                the next larger one), and images/s on the thumbnailer pool
+    page bytes  what a product grid page of --per-page cards downloads with
+                the originals vs the card-sized variants
+    serving     ms per request through the Flask test client for a full
+                response, a 304 revalidation and a 64 KiB range
+
+Serving times are the app's work per request (routing, stat, open,
+validators); bodies are not read. Under gunicorn the open file is handed to
+sendfile(), so body size adds kernel copy time but no Python time.
+
+Usage:
+    python benchmarks/bench_images.py --images 20 --width 4000 --height 3000
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def photo(width, height, seed):
+    """A JPEG that compresses like a photo: smooth gradients plus sensor-like noise"""
+    from PIL import Image
+    base = Image.radial_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 24 + seed % 8)
+    channels = [Image.blend(base, noise, 0.25 + 0.05 * i).point(lambda v, i=i: (v + 40 * i + seed) % 256)
+                for i in range(3)]
+    out = io.BytesIO()
+    Image.merge('RGB', channels).save(out, 'JPEG', quality=88)
+    return out.getvalue()
+
+
+def naive_variants(path, sizes):
+    from PIL import Image
+    with Image.open(path) as original:
+        original.load()
+        for size in sizes:
+            image = original.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            image.save(io.BytesIO(), 'JPEG', quality=85, optimize=True, progressive=True)
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--per-page', type=int, default=12)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix='bench-images-'))
+    sys.path.insert(0, ROOT)
+    from utils import images
+    if images.Image is None:
+        sys.exit(images.PILLOW_REQUIRED)
+    sizes = sorted(images.VARIANT_SIZES, reverse=True)
+
+    print(f'{args.images} images of {args.width}x{args.height}, sizes {sizes}')
+    stored = []
+    for i in range(args.images):
+        digest, ext, *_ = images.store_image(photo(args.width, args.height, i))
+        stored.append((digest, ext))
+    originals = [images.image_path(digest, ext) for digest, ext in stored]
+
+    naive = statistics.median(median_ms(lambda: naive_variants(path, sizes), 1) for path in originals)
+    store = statistics.median(median_ms(lambda: images.make_variants(digest, ext, sizes), 1)
+                              for digest, ext in stored)
+    print(f"\n{'generate':<28}{'ms/image':>10}{'speedup':>9}")
+    print(f"{'naive':<28}{naive:>10.1f}{1:>8.2f}x")
+    print(f"{'make_variants':<28}{store:>10.1f}{naive / store:>8.2f}x")
+    for workers in sorted({1, args.workers}):
+        with ThreadPoolExecutor(workers) as pool:
+            started = time.perf_counter()
+            list(pool.map(lambda item: images.make_variants(*item, sizes), stored))
+            elapsed = time.perf_counter() - started
+        print(f"{f'pool, {workers} workers':<28}{elapsed * 1000 / len(stored):>10.1f}"
+              f"{'':>9}  {len(stored) / elapsed:.1f} images/s")
+
+    card = images.IMAGE_SIZES.get('card', sizes[-1])
+    page = [stored[i % len(stored)] for i in range(args.per_page)]
+    full = sum(os.path.getsize(images.image_path(digest, ext)) for digest, ext in page)
+    cards = sum(os.path.getsize(images.image_path(digest, ext, card)) for digest, ext in page)
+    print(f"\n{'page bytes':<28}{'originals':>12}{f'{card}px cards':>12}{'saved':>8}")
+    print(f"{f'{args.per_page} product cards':<28}{full:>12,}{cards:>12,}{1 - cards / full:>8.1%}")
+
+    from app import create_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = create_app('testing').test_client()
+    digest, ext = stored[0]
+    url = images.image_url(digest, ext)
+    etag = client.get(url).headers['ETag']
+    cases = {
+        'original, 200': {},
+        'original, 304': {'If-None-Match': etag},
+        'original, 64 KiB range': {'Range': 'bytes=0-65535'},
+        f'{card}px variant, 200': None,
+    }
+    print(f"\n{'serving':<28}{'ms/request':>12}{'bytes':>12}")
+    for label, headers in cases.items():
+        target = images.image_url(digest, ext, card) if headers is None else url
+        response = client.get(target, headers=headers or {})
+        ms = median_ms(lambda: client.get(target, headers=headers or {}).close(), args.requests)
+        print(f"{label:<28}{ms:>12.3f}{len(response.data):>12,}  ({response.status_code})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Inventory forecast throughput on a large synthetic catalog.
+
+Generates N products and M order lines over the forecast window (popularity
+follows a Zipf-like curve), rolls the lines up into sales_daily the way
+checkout does, and times the three phases of the forecast: loading stock,
+loading the daily sales series and the vectorized computation. A plain
+Python per-product loop over a sample of the catalog is timed for
+comparison and extrapolated to the full catalog.
+
+Usage:
+    python benchmarks/bench_inventory.py --products 1000000 --lines 10000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_databases(products, lines, window, seed=0):
+    rng = np.random.default_rng(seed)
+    product_ids = np.arange(1, products + 1, dtype=np.int64)
+    stock = rng.integers(0, 200, size=products)
+
+    # Zipf-like popularity: a few hot products, a long tail
+    weights = 1.0 / np.arange(1, products + 1) ** 0.8
+    line_products = rng.choice(product_ids, size=lines, p=weights / weights.sum())
+    line_days = rng.integers(0, window, size=lines)
+    line_units = rng.integers(1, 4, size=lines)
+
+    # Roll order lines up to one row per (product, day), as sales_daily stores them
+    keys, inverse = np.unique(line_products * window + line_days, return_inverse=True)
+    units = np.bincount(inverse, weights=line_units).astype(np.int64)
+    end = time.strftime('%Y-%m-%d', time.gmtime())
+    start_jd = 2440587.5 + time.time() // 86400 - (window - 1)  # julian day of window start
+
+    conn = sqlite3.connect('products.db')
+    conn.execute('CREATE TABLE products (id INTEGER PRIMARY KEY, stock INTEGER NOT NULL)')
+    conn.executemany('INSERT INTO products VALUES (?, ?)', zip(product_ids.tolist(), stock.tolist()))
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect('store.db')
+    conn.execute('''
+        CREATE TABLE sales_daily (
+            dimension TEXT NOT NULL, day TEXT NOT NULL, key TEXT NOT NULL,
+            revenue REAL NOT NULL DEFAULT 0, units INTEGER NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (dimension, day, key)
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany(
+        "INSERT INTO sales_daily (dimension, day, key, units, orders) "
+        "VALUES ('product', date(? + ?), ?, ?, 1)",
+        zip([start_jd] * len(keys), (keys % window).tolist(), (keys // window).astype(str).tolist(),
+            units.tolist())
+    )
+    conn.commit()
+    conn.close()
+    return end, len(keys)
+
+
+def python_forecast(stock, series, window, short_window, lead_time, review_period):
+    """Per-product loop equivalent of compute_forecast, for comparison"""
+    from database.inventory import SHORT_WEIGHT, SERVICE_Z
+    out = []
+    for product_stock, days in zip(stock, series):
+        total = sum(days.values())
+        velocity = total / window
+        variance = max(sum(u * u for u in days.values()) / window - velocity ** 2, 0.0)
+        short = sum(u for d, u in days.items() if d >= window - short_window)
+        forecast = SHORT_WEIGHT * short / short_window + (1 - SHORT_WEIGHT) * velocity
+        safety = SERVICE_Z * variance ** 0.5 * lead_time ** 0.5
+        reorder_point = forecast * lead_time + safety
+        target = forecast * (lead_time + review_period) + safety
+        out.append(max(target - product_stock, 0) if product_stock <= reorder_point else 0)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--lines', type=int, default=10_000_000)
+    parser.add_argument('--window', type=int, default=28)
+    parser.add_argument('--python-sample', type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix='bench-inventory-'))
+    sys.path.insert(0, ROOT)
+    from database import inventory
+
+    started = time.perf_counter()
+    end, rollup_rows = build_databases(args.products, args.lines, args.window)
+    print(f"Built {args.products:,} products, {args.lines:,} order lines -> "
+          f"{rollup_rows:,} daily rollup rows in {time.perf_counter() - started:.1f}s\n")
+
+    start = time.strftime('%Y-%m-%d', time.gmtime(time.time() - (args.window - 1) * 86400))
+    timings = {}
+    t = time.perf_counter()
+    ids, stock = inventory.load_stock()
+    timings['load stock'] = time.perf_counter() - t
+    t = time.perf_counter()
+    sale_ids, sale_days, sale_units = inventory.load_daily_units(start, end)
+    timings['load daily sales'] = time.perf_counter() - t
+    t = time.perf_counter()
+    metrics = inventory.compute_forecast(ids, stock, sale_ids, sale_days, sale_units, window=args.window)
+    timings['vectorized compute'] = time.perf_counter() - t
+
+    sample = min(args.python_sample, len(ids))
+    series = [dict() for _ in range(sample)]
+    for pid, day, units in zip(sale_ids.tolist(), sale_days.tolist(), sale_units.tolist()):
+        if pid <= sample:
+            series[pid - 1][day] = units
+    t = time.perf_counter()
+    python_forecast(stock[:sample].tolist(), series, args.window, inventory.SHORT_WINDOW_DAYS,
+                    inventory.LEAD_TIME_DAYS, inventory.REVIEW_PERIOD_DAYS)
+    python_time = (time.perf_counter() - t) * len(ids) / max(sample, 1)
+
+    for phase, seconds in timings.items():
+        print(f"{phase:<24}{seconds:>10.3f}s")
+    print(f"{'total':<24}{sum(timings.values()):>10.3f}s")
+    print(f"{'python loop (extrap.)':<24}{python_time:>10.3f}s  "
+          f"({python_time / timings['vectorized compute']:.0f}x the vectorized compute)")
+    print(f"\n{int(np.count_nonzero(metrics['reorder_qty'])):,} products need reordering")
+
+
+if __name__ == '__main__':
+    main()
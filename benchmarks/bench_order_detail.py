@@ -0,0 +1,106 @@
+"""Order-detail read latency before and after order-item snapshots.
+
+"before" is the previous read path: order_items from store.db, then one
+products.db query per item for name, category and brand. "after" is the
+current fetch_order_items(), which reads the snapshot columns written at
+checkout and never touches products.db.
+
+Usage:
+    python benchmarks/bench_order_detail.py --orders 2000 --items 8 --reads 5000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed_orders(orders, items_per_order):
+    from database.db_init import get_db_connection
+    from database.product_cache import get_products
+    products = list(get_products(range(1, 26), fresh=True).values())
+    rng = random.Random(0)
+    conn = get_db_connection()
+    for _ in range(orders):
+        cursor = conn.execute('INSERT INTO orders (user_id, total_amount, status) VALUES (1, 0, ?)', ('pending',))
+        order_id = cursor.lastrowid
+        conn.executemany('''
+            INSERT INTO order_items (order_id, product_id, quantity, price,
+                                     product_name, product_category, product_brand, product_image)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(order_id, p['id'], 1, p['price'], p['name'], p['category'], p['brand'], p['image_url'])
+              for p in rng.sample(products, items_per_order)])
+    conn.commit()
+    order_ids = [row[0] for row in conn.execute('SELECT id FROM orders')]
+    conn.close()
+    return order_ids
+
+
+def detail_before(order_id):
+    from database.db_init import get_db_connection, get_products_db_connection
+    conn = get_db_connection()
+    products_conn = get_products_db_connection(readonly=False)
+    items = []
+    for item in conn.execute('SELECT * FROM order_items WHERE order_id = ?', (order_id,)).fetchall():
+        item_dict = dict(item)
+        product = products_conn.execute(
+            'SELECT name, description, category, brand FROM products WHERE id = ?', (item['product_id'],)
+        ).fetchone()
+        item_dict['product_name'] = product['name']
+        item_dict['product_category'] = product['category']
+        item_dict['product_brand'] = product['brand']
+        items.append(item_dict)
+    conn.close()
+    products_conn.close()
+    return items
+
+
+def detail_after(order_id):
+    from database.db_init import get_db_connection
+    from routes.order_routes import fetch_order_items
+    conn = get_db_connection()
+    items = fetch_order_items(conn, [order_id]).get(order_id, [])
+    conn.close()
+    return items
+
+
+def measure(label, fn, order_ids, reads):
+    rng = random.Random(1)
+    samples = []
+    for _ in range(reads):
+        order_id = rng.choice(order_ids)
+        start = time.perf_counter()
+        fn(order_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<10}{statistics.median(samples):>10.3f}{p95:>10.3f}{reads / (sum(samples) / 1000):>12.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=8, help='items per order (max 25)')
+    parser.add_argument('--reads', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix='bench-orders-'))
+    sys.path.insert(0, ROOT)
+    from database.db_init import init_db
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+    order_ids = seed_orders(args.orders, min(args.items, 25))
+
+    print(f"{'read path':<10}{'p50 ms':>10}{'p95 ms':>10}{'orders/s':>12}")
+    measure('before', detail_before, order_ids, args.reads)
+    measure('after', detail_after, order_ids, args.reads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Per-request overhead of rate limiting and admission control.
+
+Times RequestGate.enter()/leave() on their own (spread over many client
+keys, as in production), the installed before/teardown hooks inside a
+request context (what every API request pays), and for scale a trivial
+Flask view through the test client with and without the hooks.
+
+Usage:
+    python benchmarks/bench_rate_limit.py --calls 1000000 --requests 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_gate(calls, clients):
+    from utils.rate_limit import RateLimiter, AdmissionController, RequestGate
+    gate = RequestGate(RateLimiter(rate=1e9, burst=1e9), AdmissionController(500, 2000))
+    keys = [f'ip:10.0.{i // 256}.{i % 256}' for i in range(clients)]
+    started = time.perf_counter()
+    for i in range(calls):
+        gate.enter(keys[i % clients], 1)
+        gate.leave(0.001)
+    return (time.perf_counter() - started) / calls
+
+
+def bench_hooks(requests, path):
+    """Before/teardown hooks run inside one pushed request context"""
+    from flask import Flask
+    from utils.rate_limit import init_rate_limiting
+    app = Flask(__name__)
+    app.config.update(
+        RATE_LIMIT_ENABLED=True, RATE_LIMIT_RATE=1e9, RATE_LIMIT_BURST=1e9, RATE_LIMIT_DB='',
+        RATE_LIMIT_PERSIST_INTERVAL=0, RATE_LIMIT_WORKERS=1, MAX_QUEUE_MS=500, SHED_LATENCY_MS=2000, SECRET_KEY='bench'
+    )
+    init_rate_limiting(app)
+    app.add_url_rule('/api/products', 'productsresource', lambda: 'ok')
+    admit, = app.before_request_funcs[None]
+    release, = app.teardown_request_funcs[None]
+    with app.test_request_context(path):
+        started = time.perf_counter()
+        for _ in range(requests):
+            admit()
+            release()
+        return (time.perf_counter() - started) / requests
+
+
+def bench_requests(requests, limited):
+    """A trivial view through the test client, best of three runs"""
+    from flask import Flask
+    from utils.rate_limit import init_rate_limiting
+    app = Flask(__name__)
+    app.config.update(
+        RATE_LIMIT_ENABLED=limited, RATE_LIMIT_RATE=1e9, RATE_LIMIT_BURST=1e9, RATE_LIMIT_DB='',
+        RATE_LIMIT_PERSIST_INTERVAL=0, RATE_LIMIT_WORKERS=1, MAX_QUEUE_MS=500, SHED_LATENCY_MS=2000, SECRET_KEY='bench'
+    )
+    init_rate_limiting(app)
+    app.add_url_rule('/ping', 'ping', lambda: 'ok')
+    client = app.test_client()
+    for _ in range(200):
+        client.get('/ping')
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get('/ping')
+        best = min(best, (time.perf_counter() - started) / requests)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=1_000_000)
+    parser.add_argument('--clients', type=int, default=10_000)
+    parser.add_argument('--requests', type=int, default=20_000)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, ROOT)
+
+    print(f"{'gate enter + leave':<32}{bench_gate(args.calls, args.clients) * 1e6:>8.2f} us")
+    print(f"{'hooks, fixed-cost endpoint':<32}{bench_hooks(args.calls, '/api/products') * 1e6:>8.2f} us")
+    print(f"{'hooks, weighted (search)':<32}"
+          f"{bench_hooks(args.calls, '/api/products?search=phone') * 1e6:>8.2f} us")
+    plain = bench_requests(args.requests, False)
+    limited = bench_requests(args.requests, True)
+    print(f"{'flask request, no limiter':<32}{plain * 1e6:>8.2f} us")
+    print(f"{'flask request, limiter':<32}{limited * 1e6:>8.2f} us  (end-to-end, noisy)")
+
+
+if __name__ == '__main__':
+    main()
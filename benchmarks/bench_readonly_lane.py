@@ -0,0 +1,100 @@
+"""Catalog read throughput under concurrent stock writes.
+
+Compares the previous pattern (a fresh read-write connection per request)
+with the read-only lane (persistent mode=ro connection per thread with a
+large mmap and page cache). Reader threads run product lookups and listing
+queries while a writer thread decrements and restores stock the way
+checkout and cancellation do.
+
+Usage:
+    python benchmarks/bench_readonly_lane.py --readers 8 --duration 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reader(get_conn, stop, counts, errors, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        try:
+            conn = get_conn()
+            if rng.random() < 0.8:
+                conn.execute('SELECT * FROM products WHERE id = ?', (rng.randint(1, 25),)).fetchone()
+            else:
+                conn.execute('SELECT * FROM products WHERE category = ? ORDER BY price LIMIT 12',
+                             (rng.choice(['Electronics', 'Clothing']),)).fetchall()
+                conn.execute('SELECT DISTINCT brand FROM products ORDER BY brand').fetchall()
+            conn.close()
+            counts.append(1)
+        except sqlite3.OperationalError:
+            errors.append(1)
+
+
+def writer(stop, counts, errors, write_rate):
+    from database.db_init import get_products_db_connection
+    from database.catalog import bump_catalog_version
+    rng = random.Random(0)
+    delay = 1.0 / write_rate if write_rate else 0
+    while not stop.is_set():
+        pid = rng.randint(1, 25)
+        try:
+            conn = get_products_db_connection(readonly=False)
+            conn.execute('UPDATE products SET stock = stock - 1 WHERE id = ?', (pid,))
+            conn.execute('UPDATE products SET stock = stock + 1 WHERE id = ?', (pid,))
+            bump_catalog_version(conn, [pid])
+            conn.commit()
+            conn.close()
+            counts.append(1)
+        except sqlite3.OperationalError:
+            errors.append(1)
+        if delay:
+            time.sleep(delay)
+
+
+def run(label, get_conn, readers, duration, write_rate):
+    stop = threading.Event()
+    reads, read_errors, writes, write_errors = [], [], [], []
+    threads = [threading.Thread(target=reader, args=(get_conn, stop, reads, read_errors, i))
+               for i in range(readers)]
+    threads.append(threading.Thread(target=writer, args=(stop, writes, write_errors, write_rate)))
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    print(f"{label:<28}{len(reads) / duration:>12.0f}{len(read_errors):>10}"
+          f"{len(writes) / duration:>12.0f}{len(write_errors):>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--write-rate', type=float, default=200.0, help='stock writes per second (0 = flat out)')
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix='bench-ro-'))
+    sys.path.insert(0, ROOT)
+    from database.db_init import init_db, get_products_db_connection, get_products_ro_connection
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+
+    print(f"{'mode':<28}{'reads/s':>12}{'read err':>10}{'writes/s':>12}{'write err':>10}")
+    run('per-request rw connection', lambda: get_products_db_connection(readonly=False),
+        args.readers, args.duration, args.write_rate)
+    run('read-only lane', get_products_ro_connection, args.readers, args.duration, args.write_rate)
+
+
+if __name__ == '__main__':
+    main()
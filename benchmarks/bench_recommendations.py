@@ -0,0 +1,91 @@
+"""Build time and lookup latency of the related-products table.
+
+Generates synthetic order lines (basket sizes 1-8, product popularity
+following a Zipf-like curve), times the co-occurrence count and the top-K
+precomputation separately, then measures Recommender.related() lookups
+against the built table and the cost of recomputing rows after a checkout.
+
+Usage:
+    python benchmarks/bench_recommendations.py --lines 10000000 --products 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_lines(lines, products, seed=7):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 9, size=lines // 4 + 1)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), lines) + 1]
+    order_ids = np.repeat(np.arange(1, len(sizes) + 1), sizes)[:lines]
+    weights = 1.0 / np.arange(1, products + 1) ** 0.8
+    product_ids = rng.choice(np.arange(1, products + 1), size=len(order_ids), p=weights / weights.sum())
+    return order_ids.astype(np.int64), product_ids.astype(np.int64)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def bench_lookups(recommender, product_ids, lookups):
+    samples = []
+    for i in range(lookups):
+        started = time.perf_counter()
+        recommender.related(int(product_ids[i % len(product_ids)]))
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=10_000_000)
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=100_000)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, ROOT)
+    from database.recommendations import Recommender, build_cooccurrence, top_k, np
+    if np is None:
+        sys.exit('NumPy is required for this benchmark')
+
+    order_ids, product_ids = synthetic_lines(args.lines, args.products)
+    print(f"{len(product_ids):,} order lines, {order_ids[-1]:,} orders, {args.products:,} products")
+
+    started = time.perf_counter()
+    ids, order_counts, indptr, cols, counts = build_cooccurrence(order_ids, product_ids)
+    counted = time.perf_counter()
+    top_k(order_counts, indptr, cols, counts)
+    ranked = time.perf_counter()
+    print(f"{'co-occurrence count':<32}{counted - started:>8.2f} s  ({len(cols):,} pairs)")
+    print(f"{'top-K precompute':<32}{ranked - counted:>8.2f} s")
+
+    recommender = Recommender()
+    started = time.perf_counter()
+    recommender.build_from(order_ids, product_ids, {})
+    print(f"{'full build (both)':<32}{time.perf_counter() - started:>8.2f} s")
+
+    probe = np.random.default_rng(1).choice(ids, size=args.lookups)
+    p50, p99 = bench_lookups(recommender, probe, args.lookups)
+    print(f"{'lookup, built table':<32}{p50 * 1e6:>8.2f} us p50 {p99 * 1e6:>8.2f} us p99")
+
+    # Incremental path: a checkout touching popular products recomputes their rows
+    hot = [int(pid) for pid in ids[np.argsort(-order_counts)[:3]]]
+    with recommender._lock:
+        for a in hot:
+            recommender._order_delta[a] += 1
+            recommender._pair_delta[a].update(b for b in hot if b != a)
+    started = time.perf_counter()
+    with recommender._lock:
+        for product_id in hot:
+            recommender._overrides[product_id] = recommender._recompute(recommender._state, product_id, 10)
+    print(f"{'recompute 3 hottest rows':<32}{(time.perf_counter() - started) * 1e3:>8.2f} ms  (background)")
+    p50, p99 = bench_lookups(recommender, hot, args.lookups)
+    print(f"{'lookup, recomputed rows':<32}{p50 * 1e6:>8.2f} us p50 {p99 * 1e6:>8.2f} us p99")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Serialization throughput of large product and order lists.
+
+Fills a products table and an orders-with-username result the way the API
+reads them, then times turning the rows into a response body with:
+    rows -> dicts -> json       the previous path (sqlite3.Row, dict(), json.dumps)
+    dicts -> <backend>          the same dicts through utils.serialization.dumps
+    encode_rows, <backend>      query_json(): tuple rows, precomputed column keys
+for each available backend (json, and orjson when installed). The encode
+columns start from fetched rows; "with query" adds running the query, as
+the resources do.
+
+Usage:
+    python benchmarks/bench_serialization.py --products 50000 --orders 100000
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build(products, orders, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT DEFAULT '', price REAL NOT NULL,
+            stock INTEGER NOT NULL DEFAULT 0, category TEXT DEFAULT '', brand TEXT DEFAULT '', tags TEXT DEFAULT '',
+            image_url TEXT DEFAULT '', featured INTEGER DEFAULT 0, stock_sharded INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    description = 'Solid build, long battery life and a two-year warranty. Ships with all cables. ' * 2
+    conn.executemany(
+        'INSERT INTO products (name, description, price, stock, category, brand, tags, image_url, featured) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f'Product {i:06d}', description, round(rng.uniform(5, 900), 2), rng.randint(0, 200), 'Electronics',
+          f'Brand {i % 40}', 'wireless,gaming', f'https://images.example.com/{i}.jpg', i % 7 == 0)
+         for i in range(products)]
+    )
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT)')
+    conn.executemany('INSERT INTO users (username) VALUES (?)', [(f'user{i}',) for i in range(1000)])
+    conn.execute('''
+        CREATE TABLE orders (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, total_amount REAL NOT NULL,
+            status TEXT DEFAULT 'pending', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany('INSERT INTO orders (user_id, total_amount, status) VALUES (?, ?, ?)',
+                     [(rng.randint(1, 1000), round(rng.uniform(10, 2000), 2),
+                       rng.choice(['pending', 'shipped', 'delivered'])) for _ in range(orders)])
+    conn.commit()
+    return conn
+
+
+QUERIES = {
+    'products': 'SELECT * FROM products',
+    'orders': 'SELECT o.*, u.username FROM orders o JOIN users u ON o.user_id = u.id ORDER BY o.created_at DESC',
+}
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=50_000)
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, ROOT)
+
+    conn = build(args.products, args.orders)
+    backends = ['json']
+    if importlib.util.find_spec('orjson'):
+        backends.append('orjson')
+    else:
+        print('orjson is not installed; only the json backend is measured')
+
+    def fetch(sql, row_factory):
+        conn.row_factory = row_factory
+        cursor = conn.execute(sql)
+        rows = cursor.fetchall()
+        conn.row_factory = None
+        return [column[0] for column in cursor.description], rows
+
+    print(f"{'list':<10}{'path':<24}{'encode ms':>10}{'rows/s':>12}{'MB/s':>7}{'speedup':>9}{'with query ms':>15}")
+    for label, sql in QUERIES.items():
+        _, records = fetch(sql, sqlite3.Row)
+        columns, tuples = fetch(sql, None)
+        baseline = None
+
+        def report(path, encode_only, with_query):
+            nonlocal baseline
+            elapsed, size = timed(encode_only, args.repeat)
+            baseline = baseline or elapsed
+            total, _ = timed(with_query, args.repeat)
+            print(f"{label:<10}{path:<24}{elapsed * 1e3:>10.1f}{len(tuples) / elapsed:>12,.0f}"
+                  f"{size / elapsed / 2 ** 20:>7.0f}{baseline / elapsed:>8.2f}x{total * 1e3:>15.1f}")
+
+        report('rows -> dicts -> json',
+               lambda: (json.dumps([dict(row) for row in records]) + '\n').encode(),
+               lambda: (json.dumps([dict(row) for row in fetch(sql, sqlite3.Row)[1]]) + '\n').encode())
+        for backend in backends:
+            # The backend is chosen at import time
+            os.environ['JSON_BACKEND'] = backend
+            serialization = importlib.reload(importlib.import_module('utils.serialization'))
+            report(f'dicts -> {backend}',
+                   lambda: serialization.dumps([dict(row) for row in records]),
+                   lambda: serialization.dumps([dict(row) for row in fetch(sql, sqlite3.Row)[1]]))
+            report(f'encode_rows, {backend}',
+                   lambda: serialization.dumps(serialization.encode_rows(columns, tuples)),
+                   lambda: serialization.dumps(serialization.query_json(conn, sql)[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Checkout write throughput as the store is split over more user shards.
+
+Seeds --users users with a few orders each in the unsharded store.db, then
+reshards it into generations of 1, 2, 4, ... shards with the online tool
+(timing each move) and, after each step, has worker processes run the
+write transaction of checkout for their users: an order, its items, the
+sales rollup and the cart delete, committed per order on the user's shard.
+Reports orders per second and "database is locked" failures per layout,
+the cost of an admin list (newest orders gathered from every shard), and
+finally checks that no order was lost or duplicated by the moves.
+
+Usage:
+    python benchmarks/bench_store_shards.py --users 400 --workers 8 --duration 5 --shards 1,2,4,8
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_ORDERS = 3
+ITEMS = ((1, 2, 19.99), (2, 1, 5.49))  # product_id, quantity, price
+
+
+def checkout(user_id):
+    from database.store_shards import get_user_db_connection
+    from database.analytics import record_order_sales
+    conn = get_user_db_connection(user_id, write=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO orders (user_id, total_amount, status, created_at) VALUES (?, ?, ?, datetime("now"))',
+            (user_id, sum(quantity * price for _, quantity, price in ITEMS), 'pending')
+        )
+        order_id = cursor.lastrowid
+        cursor.executemany('''
+            INSERT INTO order_items (order_id, product_id, quantity, price, product_name)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(order_id, product_id, quantity, price, f'Product {product_id}')
+              for product_id, quantity, price in ITEMS])
+        record_order_sales(conn, order_id)
+        cursor.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def worker(workdir, user_ids, duration, start_at, results):
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    orders = locked = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    while time.time() < deadline:
+        try:
+            checkout(user_ids[orders % len(user_ids)])
+            orders += 1
+        except sqlite3.OperationalError:
+            locked += 1
+    results.put((orders, locked))
+
+
+def run(workdir, user_ids, workers, duration):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start_at = time.time() + 2  # let every process finish importing
+    procs = [ctx.Process(target=worker, args=(workdir, user_ids[i::workers], duration, start_at, results))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    totals = [results.get(timeout=duration + 60) for _ in procs]
+    for proc in procs:
+        proc.join()
+    return sum(t[0] for t in totals), sum(t[1] for t in totals)
+
+
+def admin_list_ms(store_shards, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        store_shards.gather('''
+            SELECT o.created_at, o.id, o.id, o.user_id, o.total_amount, o.status, u.username
+            FROM orders o JOIN users u ON o.user_id = u.id
+            ORDER BY o.created_at DESC, o.id DESC LIMIT 20
+        ''', sort_columns=2, descending=True, limit=20)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--shards', default='1,2,4,8', help='comma-separated shard counts, in order')
+    args = parser.parse_args(argv)
+    shard_counts = [int(count) for count in args.shards.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='bench-store-shards-')
+    os.chdir(workdir)
+    os.environ.pop('STORE_SHARDS', None)  # start unsharded; the moves are part of the benchmark
+    sys.path.insert(0, ROOT)
+    from database.db_init import init_db, get_db_connection
+    from database.store_shards import store_shards, reshard
+    from database.stats import reconcile_stats
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+    conn = get_db_connection()
+    conn.executemany('INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+                     [(f'bench{i}', f'bench{i}@example.com', 'x') for i in range(args.users)])
+    conn.commit()
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'bench%' ORDER BY id")]
+    conn.close()
+    for _ in range(SEED_ORDERS):
+        for user_id in user_ids:
+            checkout(user_id)
+    expected = store_shards.total('SELECT COUNT(*) FROM orders')
+
+    print(f"{args.users} users, {args.workers} writer processes, {args.duration:g}s per layout\n")
+    print(f"{'layout':<22}{'reshard s':>11}{'orders/s':>11}{'speedup':>9}{'locked':>9}{'admin list ms':>15}")
+    baseline = None
+    layouts = [(None, 'store.db (unsharded)')] + [(count, f'{count} shards') for count in shard_counts]
+    for count, label in layouts:
+        moved_in = ''
+        if count is not None:
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                reshard(count, pause=0)
+            moved_in = f'{time.perf_counter() - started:.2f}'
+            store_shards.generations(refresh=True)
+        orders, locked = run(workdir, user_ids, args.workers, args.duration)
+        expected += orders
+        rate = orders / args.duration
+        baseline = baseline or rate
+        print(f"{label:<22}{moved_in:>11}{rate:>11.0f}{rate / baseline:>8.2f}x{locked:>9}"
+              f"{admin_list_ms(store_shards):>15.2f}")
+
+    found = store_shards.total('SELECT COUNT(*) FROM orders')
+    with contextlib.redirect_stdout(io.StringIO()):
+        drift = reconcile_stats()
+    consistent = found == expected and not drift
+    print(f"\nOrders {'consistent' if consistent else 'INCONSISTENT'}: {found:,} found, {expected:,} written"
+          f"{'' if not drift else f', counter drift {drift}'}")
+    return 0 if consistent else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Suggestion latency and index size on a large synthetic catalog.
+
+Builds products.db with N products (2-5 word names from a synthetic
+vocabulary, brands, categories and tags) and a sales_daily rollup with
+Zipf-like popularity, then times the index build, reports its memory, and
+measures Suggester.suggest() for prefixes of 1-10 characters taken from
+real names, before and after a batch of product writes has gone into the
+delta.
+
+Usage:
+    python benchmarks/bench_suggest.py --products 1000000 --queries 20000
+"""
+import argparse
+import os
+import random
+import resource
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_databases(products, seed=0):
+    from database.tags import ensure_product_tags
+    from database.catalog import ensure_catalog_meta
+    rng = random.Random(seed)
+    words = list({''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(20000)})
+    brands = [f'Brand{i}' for i in range(2000)]
+    categories = [f'Category {i}' for i in range(200)]
+    rows = [(' '.join(rng.choices(words, k=rng.randint(2, 5))).title(), rng.choice(brands),
+             rng.choice(categories), ','.join(rng.sample(words[:3000], 3)))
+            for _ in range(products)]
+
+    conn = sqlite3.connect('products.db')
+    conn.execute('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL, brand TEXT DEFAULT '',
+            category TEXT DEFAULT '', tags TEXT DEFAULT '', stock INTEGER DEFAULT 0
+        )
+    ''')
+    ensure_product_tags(conn)
+    ensure_catalog_meta(conn)
+    conn.executemany('INSERT INTO products (name, brand, category, tags) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    today = time.strftime('%Y-%m-%d', time.gmtime())
+    conn = sqlite3.connect('store.db')
+    conn.execute('''
+        CREATE TABLE sales_daily (
+            dimension TEXT NOT NULL, day TEXT NOT NULL, key TEXT NOT NULL,
+            revenue REAL NOT NULL DEFAULT 0, units INTEGER NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (dimension, day, key)
+        ) WITHOUT ROWID
+    ''')
+    conn.executemany(
+        "INSERT INTO sales_daily (dimension, day, key, units) VALUES ('product', ?, ?, ?)",
+        ((today, str(i), int(10000 / i ** 0.8)) for i in range(1, products + 1, 3))
+    )
+    conn.commit()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], samples[-1]
+
+
+def bench_queries(suggester, names, queries, rng):
+    samples = []
+    for _ in range(queries):
+        words = rng.choice(names).lower().split()
+        start = rng.randrange(len(words))
+        text = ' '.join(words[start:])
+        prefix = text[:rng.randint(1, min(10, len(text)))]
+        started = time.perf_counter()
+        suggester.suggest(prefix)
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=20_000)
+    parser.add_argument('--writes', type=int, default=1000)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, ROOT)
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        names = build_databases(args.products)
+        from database.suggest import suggester, np
+        from database.invalidation import catalog_bus
+        if np is None:
+            sys.exit('NumPy is required for this benchmark')
+        catalog_bus.sync(force=True)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        suggester.build()
+        elapsed = time.perf_counter() - started
+        peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+        stats = suggester.stats()
+        print(f"{stats['products']:,} products, {stats['keys']:,} keys, {stats['terms']:,} terms")
+        print(f"{'build':<28}{elapsed:>9.2f} s   (peak RSS +{peak / 2 ** 20:,.0f} MiB)")
+        print(f"{'index arrays':<28}{stats['bytes'] / 2 ** 20:>9.1f} MiB "
+              f"({stats['bytes'] / stats['products']:.0f} B/product)")
+
+        p50, p99, worst = bench_queries(suggester, names, args.queries, rng)
+        print(f"{'suggest':<28}{p50 * 1e6:>9.1f} us p50 {p99 * 1e6:>9.1f} us p99 {worst * 1e3:>7.2f} ms max")
+
+        conn = sqlite3.connect('products.db')
+        for product_id in rng.sample(range(1, args.products + 1), args.writes):
+            conn.execute("UPDATE products SET name = name || ' Plus' WHERE id = ?", (product_id,))
+            conn.execute('UPDATE catalog_meta SET version = version + 1 WHERE id = 1')
+            conn.execute('INSERT INTO catalog_changes (version, product_id) '
+                         'SELECT version, ? FROM catalog_meta WHERE id = 1', (product_id,))
+        conn.commit()
+        conn.close()
+        catalog_bus.sync(force=True)
+        started = time.perf_counter()
+        suggester.suggest('a')
+        print(f"{'apply ' + format(args.writes, ',') + ' writes':<28}{(time.perf_counter() - started) * 1e3:>9.2f} ms")
+        p50, p99, worst = bench_queries(suggester, names, args.queries, rng)
+        print(f"{'suggest, with delta':<28}{p50 * 1e6:>9.1f} us p50 {p99 * 1e6:>9.1f} us p99 {worst * 1e3:>7.2f} ms max")
+        os.chdir(ROOT)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Tag filtering: indexed product_tags lookups against tags LIKE scans.
+
+Builds a products.db with N products carrying 3-6 tags each from a
+vocabulary with a Zipf-like popularity curve, including near-collisions
+("rgb" / "rgbw") that a substring match confuses. For single-tag, AND and
+OR filters it times a listing page plus its count the way the endpoint runs
+them, with:
+    like       tags LIKE '%rgb%'            (the old search clause)
+    like-exact ',' || tags || ',' LIKE ...  (correct matches, still a scan)
+    index      id IN (SELECT product_id FROM product_tags WHERE tag IN ...)
+It also reports false positives of the plain LIKE, the cost of the sync
+triggers on bulk insert, and the time of tag facets and similar items.
+
+Usage:
+    python benchmarks/bench_tags.py --products 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FILTERS = {
+    'one tag': [('rgb',)],
+    'long-tail tag': [('tag1500',)],
+    'two tags AND': [('gaming',), ('rgb',)],
+    'two tags OR': [('rgb', 'wireless')],
+}
+
+
+def vocabulary(size):
+    base = ['rgb', 'rgbw', 'gaming', 'wireless', 'wireless-charging', 'usb', 'usb-c', '4k', 'hdr']
+    return base + [f'tag{i}' for i in range(size - len(base))]
+
+
+def build_catalog(path, products, vocab, with_triggers, seed=0):
+    from database.tags import ensure_product_tags
+    rng = random.Random(seed)
+    weights = [1.0 / (i + 1) ** 0.7 for i in range(len(vocab))]
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT DEFAULT '',
+            price REAL NOT NULL, tags TEXT DEFAULT ''
+        )
+    ''')
+    if with_triggers:
+        ensure_product_tags(conn)
+    description = 'A product description of about the length the sample catalog uses, ' * 2
+    rows = [(f'Product {i:07d}', description, rng.uniform(1, 500),
+             ','.join(dict.fromkeys(rng.choices(vocab, weights, k=rng.randint(3, 6)))))
+            for i in range(products)]
+    started = time.perf_counter()
+    conn.executemany('INSERT INTO products (name, description, price, tags) VALUES (?, ?, ?, ?)', rows)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    if not with_triggers:
+        ensure_product_tags(conn)
+        conn.commit()
+    return conn, elapsed
+
+
+def like_conditions(groups, exact):
+    conditions, params = [], []
+    for group in groups:
+        column = "',' || tags || ','" if exact else 'tags'
+        conditions.append('(' + ' OR '.join(f'{column} LIKE ?' for _ in group) + ')')
+        params.extend(f'%,{tag},%' if exact else f'%{tag}%' for tag in group)
+    return conditions, params
+
+
+def run_listing(conn, conditions, params):
+    where = 'WHERE ' + ' AND '.join(conditions)
+    page = conn.execute(f'SELECT * FROM products {where} ORDER BY name LIMIT 12', params).fetchall()
+    total = conn.execute(f'SELECT COUNT(*) FROM products {where}', params).fetchone()[0]
+    return page, total
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=200_000)
+    parser.add_argument('--vocabulary', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    sys.path.insert(0, ROOT)
+    from database.tags import tag_filter_sql, tag_facets, similar_products
+
+    vocab = vocabulary(args.vocabulary)
+    with tempfile.TemporaryDirectory() as tmp:
+        plain, plain_insert = build_catalog(os.path.join(tmp, 'plain.db'), args.products, vocab, False)
+        plain.close()
+        conn, synced_insert = build_catalog(os.path.join(tmp, 'products.db'), args.products, vocab, True)
+        tag_rows = conn.execute('SELECT COUNT(*) FROM product_tags').fetchone()[0]
+        print(f"{args.products:,} products, {tag_rows:,} tag rows")
+        print(f"{'bulk insert, no triggers':<28}{plain_insert:>9.2f} s")
+        print(f"{'bulk insert, tag triggers':<28}{synced_insert:>9.2f} s")
+        print()
+        print(f"{'filter':<16}{'like':>10}{'like-exact':>12}{'index':>10}{'matches':>10}{'like false +':>14}")
+        for label, groups in FILTERS.items():
+            like, (_, like_total) = timed(lambda: run_listing(conn, *like_conditions(groups, False)), args.repeat)
+            exact, (_, exact_total) = timed(lambda: run_listing(conn, *like_conditions(groups, True)), args.repeat)
+            index, (_, index_total) = timed(lambda: run_listing(conn, *tag_filter_sql(groups)), args.repeat)
+            assert exact_total == index_total, (exact_total, index_total)
+            print(f"{label:<16}{like * 1e3:>8.2f}ms{exact * 1e3:>10.2f}ms{index * 1e3:>8.2f}ms"
+                  f"{index_total:>10,}{like_total - index_total:>14,}")
+        print()
+        facets, _ = timed(lambda: tag_facets(conn), args.repeat)
+        conditions, params = tag_filter_sql(FILTERS['one tag'])
+        narrowed, _ = timed(lambda: tag_facets(conn, 'WHERE ' + ' AND '.join(conditions), params), args.repeat)
+        similar, _ = timed(lambda: similar_products(1, 10, conn), args.repeat)
+        print(f"{'tag facets, whole catalog':<28}{facets * 1e3:>9.2f} ms")
+        print(f"{'tag facets, tag=rgb':<28}{narrowed * 1e3:>9.2f} ms")
+        print(f"{'similar items (Jaccard)':<28}{similar * 1e3:>9.2f} ms")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Multi-process check that product cache invalidations propagate in bound.
+
+Starts several worker processes that each warm their in-process product
+cache and then keep reading one product through it. The parent commits price
+changes the same way ProductsResource.put does (write + catalog version bump
+in one transaction) and measures how long each worker takes to observe the
+new value. Every observation must land within the configured coherence
+interval plus the workers' own polling period.
+
+Usage:
+    python benchmarks/check_cache_coherence.py --workers 4 --interval 0.5 --rounds 5
+
+Runs against throwaway copies of the databases in a temporary directory.
+Exits 1 if any invalidation exceeded the bound.
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READ_PERIOD = 0.005
+PRODUCT_ID = 1
+
+
+def worker(workdir, interval, rounds, ready, observations):
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    from database.invalidation import catalog_bus
+    from database.product_cache import get_product
+    catalog_bus.interval = interval
+
+    get_product(PRODUCT_ID)  # warm the cache
+    ready.put(os.getpid())
+
+    seen_price = None
+    observed = 0
+    deadline = time.time() + rounds * (interval + 2) + 10
+    while observed < rounds and time.time() < deadline:
+        price = get_product(PRODUCT_ID)['price']
+        if price != seen_price:
+            if seen_price is not None:
+                observations.put((os.getpid(), price, time.time()))
+                observed += 1
+            seen_price = price
+        time.sleep(READ_PERIOD)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--interval', type=float, default=0.5)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='coherence-')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    from database.db_init import init_db, get_products_db_connection
+    from database.catalog import bump_catalog_version
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+
+    ctx = multiprocessing.get_context('spawn')
+    ready, observations = ctx.Queue(), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(workdir, args.interval, args.rounds, ready, observations))
+             for _ in range(args.workers)]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        ready.get(timeout=30)
+
+    bound = args.interval + READ_PERIOD + 0.05  # scheduling slack
+    worst = 0.0
+    failures = 0
+    for round_no in range(args.rounds):
+        time.sleep(args.interval)  # let every worker settle on the old value
+        new_price = 100.0 + round_no
+        conn = get_products_db_connection()
+        conn.execute('UPDATE products SET price = ? WHERE id = ?', (new_price, PRODUCT_ID))
+        bump_catalog_version(conn, [PRODUCT_ID])
+        conn.commit()
+        conn.close()
+        committed_at = time.time()
+
+        for _ in procs:
+            pid, price, seen_at = observations.get(timeout=args.interval + 10)
+            lag = seen_at - committed_at
+            worst = max(worst, lag)
+            ok = price == new_price and lag <= bound
+            failures += 0 if ok else 1
+            print(f"round {round_no}: worker {pid} saw price {price} after {lag * 1000:.1f} ms"
+                  f"{'' if ok else '  <-- FAIL'}")
+
+    for proc in procs:
+        proc.join(timeout=10)
+
+    print(f"\nWorst propagation lag: {worst * 1000:.1f} ms (bound {bound * 1000:.1f} ms)")
+    print('PASS' if failures == 0 else f'FAIL ({failures} late or wrong observations)')
+    return 0 if failures == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
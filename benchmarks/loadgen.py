@@ -0,0 +1,377 @@
+"""Scenario-driven HTTP load generator for the store API.
+
+Runs weighted user journeys (the same flows static/js drives) at a target
+arrival rate against a running server and reports throughput, per-step
+latency percentiles, error rates and "database is locked" rates, then checks
+the results against the configured SLOs.
+
+Usage:
+    python benchmarks/loadgen.py --base-url http://127.0.0.1:5000 --rate 20 --duration 60
+    python benchmarks/loadgen.py --config benchmarks/loadgen_scenarios.json
+
+Every journey comes from this one address, so the server's per-client rate
+limits would throttle it and count the 429s as errors. Start the server
+under test with rate limiting off or well above the target load:
+
+    RATE_LIMIT_ENABLED=0 APP_ENV=production python serve.py
+
+The exit code is 0 when every SLO passes and 1 otherwise, so the tool can be
+used as a gate in CI or before a release.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONFIG = {
+    'base_url': 'http://127.0.0.1:5000',
+    'rate': 10.0,          # journeys started per second (open model, Poisson arrivals)
+    'duration': 30.0,      # seconds of arrivals
+    'max_concurrency': 64, # journeys in flight at once
+    'timeout': 10.0,       # per-request timeout in seconds
+    'admin': {'username': 'admin', 'password': 'admin123'},
+    'shopper_pool': 20,    # shopper accounts registered up front and reused
+    'searches': ['gaming', 'wireless', 'coffee', 'yoga', 'jacket', 'rgb'],
+    'scenarios': {
+        'browse': 50,
+        'search_and_filter': 20,
+        'add_to_cart': 15,
+        'checkout': 10,
+        'admin_dashboard': 5,
+    },
+    'slos': {
+        'p95_ms': 500,
+        'p99_ms': 1500,
+        'error_rate': 0.01,
+        'db_locked_rate': 0.001,
+        'min_throughput_rps': 0,
+    },
+}
+
+
+class Stats:
+    """Thread-safe collector of per-step latencies and outcomes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.db_locked = defaultdict(int)
+        self.journeys = defaultdict(int)
+        self.journey_failures = defaultdict(int)
+
+    def record(self, step, elapsed, ok, locked):
+        with self.lock:
+            self.latencies[step].append(elapsed)
+            self.requests[step] += 1
+            if not ok:
+                self.errors[step] += 1
+            if locked:
+                self.db_locked[step] += 1
+
+    def record_journey(self, name, ok):
+        with self.lock:
+            self.journeys[name] += 1
+            if not ok:
+                self.journey_failures[name] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Client:
+    """One virtual user: keeps its own session cookie like a browser would."""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url.rstrip('/') + '/api'
+        self.stats = stats
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def call(self, step, method, path, body=None, expect=(200, 201)):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        start = time.perf_counter()
+        status, payload = None, None
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                status = resp.status
+                raw = resp.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            raw = e.read()
+        except Exception as e:
+            raw = str(e).encode()
+        elapsed = time.perf_counter() - start
+
+        text = raw.decode('utf-8', errors='replace') if raw else ''
+        try:
+            payload = json.loads(text) if text else None
+        except ValueError:
+            payload = None
+        locked = 'database is locked' in text
+        ok = status in expect
+        self.stats.record(step, elapsed, ok, locked)
+        return ok, payload
+
+    def login(self, username, password):
+        ok, _ = self.call('auth.login', 'POST', '/auth',
+                          {'action': 'login', 'username': username, 'password': password})
+        return ok
+
+
+# User journeys -------------------------------------------------------------
+
+def journey_browse(client, config, rng):
+    ok, result = client.call('products.list', 'GET', '/products')
+    if not ok or not result:
+        return False
+    products = result.get('products') or []
+    page = rng.randint(1, max(1, result.get('pagination', {}).get('total_pages', 1)))
+    ok, _ = client.call('products.page', 'GET', f'/products?page={page}&sort=featured')
+    if products:
+        ok, _ = client.call('products.detail', 'GET', f"/products/{rng.choice(products)['id']}")
+    return ok
+
+
+def journey_search_and_filter(client, config, rng):
+    term = rng.choice(config['searches'])
+    ok, result = client.call('products.search', 'GET', f'/products?search={term}')
+    if not ok or not result:
+        return False
+    categories = result.get('filters', {}).get('categories') or []
+    if categories:
+        category = urllib.request.quote(rng.choice(categories))
+        ok, _ = client.call('products.filter', 'GET',
+                            f'/products?category={category}&min_price=20&max_price=500&sort=price_asc')
+    return ok
+
+
+def _add_random_item(client, rng):
+    ok, result = client.call('products.list', 'GET', '/products?per_page=50')
+    if not ok or not result or not result.get('products'):
+        return False
+    in_stock = [p for p in result['products'] if p.get('stock', 0) > 0]
+    if not in_stock:
+        return False
+    product = rng.choice(in_stock)
+    ok, _ = client.call('cart.add', 'POST', '/cart',
+                        {'product_id': product['id'], 'quantity': 1}, expect=(200, 400))
+    return ok
+
+
+def journey_add_to_cart(client, config, rng):
+    if not _add_random_item(client, rng):
+        return False
+    ok, _ = client.call('cart.get', 'GET', '/cart')
+    return ok
+
+
+def journey_checkout(client, config, rng):
+    for _ in range(rng.randint(1, 3)):
+        _add_random_item(client, rng)
+    ok, cart = client.call('cart.get', 'GET', '/cart')
+    if not ok or not cart or not cart.get('items'):
+        return False
+    ok, _ = client.call('orders.checkout', 'POST', '/orders', expect=(200,))
+    if not ok:
+        return False
+    client.call('orders.list', 'GET', '/orders')
+    ok, _ = client.call('notifications.poll', 'GET', '/notifications?unread_only=1')
+    return ok
+
+
+def journey_admin_dashboard(client, config, rng):
+    ok1, _ = client.call('admin.products', 'GET', '/products?sort=newest')
+    ok2, orders = client.call('admin.orders', 'GET', '/orders')
+    ok3, _ = client.call('admin.users', 'GET', '/users')
+    if ok2 and isinstance(orders, list) and orders:
+        client.call('admin.order_detail', 'GET', f"/orders/{rng.choice(orders)['id']}")
+    return ok1 and ok2 and ok3
+
+
+JOURNEYS = {
+    'browse': (journey_browse, 'shopper'),
+    'search_and_filter': (journey_search_and_filter, 'anonymous'),
+    'add_to_cart': (journey_add_to_cart, 'shopper'),
+    'checkout': (journey_checkout, 'shopper'),
+    'admin_dashboard': (journey_admin_dashboard, 'admin'),
+}
+
+
+# Runner ----------------------------------------------------------------------
+
+def register_shoppers(config, stats):
+    run_id = uuid.uuid4().hex[:8]
+    shoppers = []
+    for i in range(config['shopper_pool']):
+        username = f'loadgen_{run_id}_{i}'
+        password = 'loadgen-pass'
+        client = Client(config['base_url'], stats, config['timeout'])
+        client.call('auth.register', 'POST', '/auth', {
+            'action': 'register', 'username': username,
+            'email': f'{username}@loadgen.local', 'password': password
+        })
+        shoppers.append((username, password))
+    return shoppers
+
+
+def run_journey(name, config, stats, shoppers, seed):
+    rng = random.Random(seed)
+    func, role = JOURNEYS[name]
+    client = Client(config['base_url'], stats, config['timeout'])
+    if role == 'shopper':
+        username, password = rng.choice(shoppers)
+        if not client.login(username, password):
+            stats.record_journey(name, False)
+            return
+    elif role == 'admin':
+        if not client.login(config['admin']['username'], config['admin']['password']):
+            stats.record_journey(name, False)
+            return
+    try:
+        ok = func(client, config, rng)
+    except Exception as e:
+        print(f"Journey {name} crashed: {e}")
+        ok = False
+    stats.record_journey(name, ok)
+
+
+def run(config):
+    stats = Stats()
+    print(f"Registering {config['shopper_pool']} shopper accounts...")
+    shoppers = register_shoppers(config, stats)
+    # Registration traffic is setup, not part of the measured run
+    stats = Stats()
+
+    names = [n for n, w in config['scenarios'].items() if w > 0]
+    weights = [config['scenarios'][n] for n in names]
+    unknown = [n for n in names if n not in JOURNEYS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios in config: {', '.join(unknown)}")
+
+    rng = random.Random(config.get('seed', 1))
+    print(f"Running {config['rate']} journeys/s for {config['duration']}s against {config['base_url']}")
+    start = time.perf_counter()
+    dropped = 0
+    with ThreadPoolExecutor(max_workers=config['max_concurrency']) as pool:
+        in_flight = threading.BoundedSemaphore(config['max_concurrency'])
+        next_arrival = start
+        while True:
+            next_arrival += rng.expovariate(config['rate'])
+            if next_arrival - start > config['duration']:
+                break
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Open model: if the server falls behind we drop arrivals rather
+            # than silently lowering the offered rate
+            if not in_flight.acquire(blocking=False):
+                dropped += 1
+                continue
+            name = rng.choices(names, weights)[0]
+            future = pool.submit(run_journey, name, config, stats, shoppers, rng.random())
+            future.add_done_callback(lambda _: in_flight.release())
+    elapsed = time.perf_counter() - start
+    return stats, elapsed, dropped
+
+
+def report(stats, elapsed, dropped, slos):
+    total_requests = sum(stats.requests.values())
+    total_errors = sum(stats.errors.values())
+    total_locked = sum(stats.db_locked.values())
+    all_latencies = sorted(l for values in stats.latencies.values() for l in values)
+
+    print("\n=== PER-STEP LATENCY (ms) ===")
+    print(f"{'step':<24}{'count':>8}{'err':>6}{'locked':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for step in sorted(stats.latencies):
+        values = sorted(stats.latencies[step])
+        print(f"{step:<24}{stats.requests[step]:>8}{stats.errors[step]:>6}{stats.db_locked[step]:>8}"
+              f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+              f"{percentile(values, 99) * 1000:>9.1f}{values[-1] * 1000:>9.1f}")
+
+    print("\n=== JOURNEYS ===")
+    for name in sorted(stats.journeys):
+        print(f"{name:<24}{stats.journeys[name]:>8} started {stats.journey_failures[name]:>6} failed")
+    if dropped:
+        print(f"Dropped arrivals (concurrency limit reached): {dropped}")
+
+    throughput = total_requests / elapsed if elapsed else 0.0
+    error_rate = total_errors / total_requests if total_requests else 0.0
+    locked_rate = total_locked / total_requests if total_requests else 0.0
+    p95 = percentile(all_latencies, 95) * 1000
+    p99 = percentile(all_latencies, 99) * 1000
+
+    print("\n=== SUMMARY ===")
+    print(f"Requests: {total_requests} in {elapsed:.1f}s ({throughput:.1f} req/s)")
+    print(f"Latency p95: {p95:.1f} ms, p99: {p99:.1f} ms")
+    print(f"Error rate: {error_rate:.2%}, 'database is locked' rate: {locked_rate:.2%}")
+
+    checks = [
+        ('p95_ms', p95, lambda v, limit: v <= limit),
+        ('p99_ms', p99, lambda v, limit: v <= limit),
+        ('error_rate', error_rate, lambda v, limit: v <= limit),
+        ('db_locked_rate', locked_rate, lambda v, limit: v <= limit),
+        ('min_throughput_rps', throughput, lambda v, limit: v >= limit),
+    ]
+    print("\n=== SLO CHECKS ===")
+    passed = True
+    for name, value, check in checks:
+        if name not in slos:
+            continue
+        ok = check(value, slos[name])
+        passed = passed and ok
+        print(f"{'PASS' if ok else 'FAIL'}  {name}: {value:.4g} (limit {slos[name]})")
+    return passed
+
+
+def load_config(args):
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    for key in ('base_url', 'rate', 'duration', 'max_concurrency'):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scenario-driven load generator for the store API')
+    parser.add_argument('--config', help='JSON file overriding scenarios, weights and SLOs')
+    parser.add_argument('--base-url', dest='base_url')
+    parser.add_argument('--rate', type=float, help='journeys started per second')
+    parser.add_argument('--duration', type=float, help='seconds of arrivals')
+    parser.add_argument('--max-concurrency', dest='max_concurrency', type=int)
+    args = parser.parse_args(argv)
+
+    config = load_config(args)
+    stats, elapsed, dropped = run(config)
+    passed = report(stats, elapsed, dropped, config['slos'])
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Environment-based application configuration.
+
+APP_ENV selects the config class (development, production, testing); most
+settings can additionally be overridden with an environment variable of the
+same name.
+"""
+import os
+from datetime import timedelta
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-this')
+    PERMANENT_SESSION_LIFETIME = timedelta(days=1)
+    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*')
+    DEBUG = False
+    # Create missing tables on startup; RESET_PRODUCTS also rebuilds the catalog
+    INIT_DB = env_bool('INIT_DB', True)
+    RESET_PRODUCTS = env_bool('RESET_PRODUCTS', False)
+    # Seconds between background recounts of the dashboard counters (0 = off)
+    STATS_RECONCILE_INTERVAL = env_float('STATS_RECONCILE_INTERVAL', 300.0)
+    # Seconds between runs of the background deletion reaper (0 = off; it is
+    # also woken right after each delete request)
+    DELETION_REAPER_INTERVAL = env_float('DELETION_REAPER_INTERVAL', 30.0)
+    # Seconds between wishlist alert runs (also woken by each product change; 0 = off)
+    WISHLIST_ALERT_INTERVAL = env_float('WISHLIST_ALERT_INTERVAL', 30.0)
+    # Seconds between related-products refreshes from new orders (also woken
+    # by each checkout; 0 = off). Full rebuilds: RECOMMENDATIONS_REBUILD_INTERVAL
+    RECOMMENDATIONS_INTERVAL = env_float('RECOMMENDATIONS_INTERVAL', 60.0)
+    # Seconds between checks for a suggestion index rebuild (0 = off; the index
+    # is then built on first use and updated from product writes only)
+    SUGGEST_INTERVAL = env_float('SUGGEST_INTERVAL', 60.0)
+    # Threads generating image size variants after uploads (0 = during the
+    # upload request); see utils/images.py
+    IMAGE_WORKERS = env_int('IMAGE_WORKERS', 2)
+    # Production server (serve.py)
+    BIND = os.environ.get('BIND', '0.0.0.0:5000')
+    WEB_WORKERS = env_int('WEB_WORKERS', (os.cpu_count() or 1) * 2 + 1)
+    WEB_THREADS = env_int('WEB_THREADS', 4)
+    PRELOAD_APP = env_bool('PRELOAD_APP', True)
+    GRACEFUL_TIMEOUT = env_int('GRACEFUL_TIMEOUT', 30)
+    REQUEST_TIMEOUT = env_int('REQUEST_TIMEOUT', 60)
+    KEEPALIVE = env_int('KEEPALIVE', 5)
+    MAX_REQUESTS = env_int('MAX_REQUESTS', 0)
+    # Seconds the app may take to become ready before startup is flagged
+    STARTUP_BUDGET = env_float('STARTUP_BUDGET', 10.0)
+    STARTUP_BUDGET_STRICT = env_bool('STARTUP_BUDGET_STRICT', False)
+    # Reverse proxies in front of the app that append the client address to
+    # X-Forwarded-For (0 = clients connect directly); rate limits key on it
+    TRUSTED_PROXIES = env_int('TRUSTED_PROXIES', 0)
+    # Keep the X-Request-Start set by the front proxy instead of the worker's
+    # own stamp; only when the proxy always overwrites what clients send
+    TRUST_REQUEST_START = env_bool('TRUST_REQUEST_START', False)
+
+    # Per-client token buckets (tokens/second for the whole server, bucket
+    # size) and load shedding per worker process; see utils/rate_limit.py.
+    # RATE_LIMIT_WORKERS is the number of processes the rate is split over.
+    RATE_LIMIT_ENABLED = env_bool('RATE_LIMIT_ENABLED', True)
+    RATE_LIMIT_RATE = env_float('RATE_LIMIT_RATE', 20.0)
+    RATE_LIMIT_BURST = env_float('RATE_LIMIT_BURST', 60.0)
+    RATE_LIMIT_WORKERS = env_int('RATE_LIMIT_WORKERS', 1)
+    RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', '')
+    RATE_LIMIT_PERSIST_INTERVAL = env_float('RATE_LIMIT_PERSIST_INTERVAL', 10.0)
+    MAX_QUEUE_MS = env_float('MAX_QUEUE_MS', 500.0)
+    SHED_LATENCY_MS = env_float('SHED_LATENCY_MS', 2000.0)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    # `python app.py` has always rebuilt the sample catalog on start
+    RESET_PRODUCTS = env_bool('RESET_PRODUCTS', True)
+
+
+class ProductionConfig(Config):
+    SESSION_COOKIE_HTTPONLY = True
+    # Served by WEB_WORKERS processes, each with its own buckets
+    RATE_LIMIT_WORKERS = env_int('RATE_LIMIT_WORKERS', Config.WEB_WORKERS)
+
+
+class TestingConfig(Config):
+    TESTING = True
+    INIT_DB = False
+    STATS_RECONCILE_INTERVAL = 0
+    DELETION_REAPER_INTERVAL = 0
+    WISHLIST_ALERT_INTERVAL = 0
+    RECOMMENDATIONS_INTERVAL = 0
+    SUGGEST_INTERVAL = 0
+    IMAGE_WORKERS = 0
+    RATE_LIMIT_ENABLED = False
+
+
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(name=None):
+    name = name or os.environ.get('APP_ENV', 'development')
+    try:
+        return config_by_name[name]
+    except KeyError:
+        raise ValueError(f"Unknown APP_ENV '{name}', expected one of: {', '.join(config_by_name)}")
@@ -0,0 +1,228 @@
+"""Daily sales rollups per product, category and brand.
+
+sales_daily holds revenue, units and order count per (dimension, day, key),
+where dimension is 'product' (key = product id), 'category', 'brand' or 'all'
+(key = '', whole-store daily totals). Sales are attributed to the day the
+order was placed.
+
+Checkout adds an order's lines with record_order_sales(conn, order_id, +1)
+inside its own transaction, and cancellation removes them again with -1, so
+reports never scan orders or order_items. Every store shard keeps the rollups
+of its own orders; reports add them up. rebuild_sales_rollups() recomputes
+everything from the base tables in chunks, for first setup or after a manual
+data fix:
+
+    python -m database.analytics rebuild --chunk-size 1000
+"""
+import argparse
+from database.store_shards import store_shards
+
+DIMENSIONS = ('all', 'product', 'category', 'brand')
+REBUILD_CHUNK_SIZE = 1000
+
+DIMENSION_KEYS = {
+    'all': "''",
+    'product': 'CAST(oi.product_id AS TEXT)',
+    'category': "COALESCE(NULLIF(oi.product_category, ''), 'Unknown')",
+    'brand': "COALESCE(NULLIF(oi.product_brand, ''), 'Unknown')",
+}
+
+
+def ensure_sales_rollups(conn):
+    """Create the rollup table (idempotent) and drop an interrupted rebuild's
+    scratch tables; True if the rollups did not exist yet"""
+    drop_rebuild_tables(conn)
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_daily'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            dimension TEXT NOT NULL,
+            day TEXT NOT NULL,
+            key TEXT NOT NULL,
+            revenue REAL NOT NULL DEFAULT 0,
+            units INTEGER NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, day, key)
+        ) WITHOUT ROWID
+    ''')
+    return not exists
+
+
+def _aggregate(conn, table, where, params, sign=1):
+    """Add the order lines matching `where` into `table`, once per dimension.
+
+    While a rebuild is running, changes to sales_daily are applied to its
+    scratch table too for the orders it has already scanned; the rest are
+    picked up when the scan reaches them.
+    """
+    if table == 'sales_daily' and conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_daily_rebuild_progress'"
+    ).fetchone():
+        _aggregate(conn, 'sales_daily_rebuild',
+                   f'({where}) AND o.id <= (SELECT last_id FROM sales_daily_rebuild_progress)', params, sign)
+    for dimension, key_sql in DIMENSION_KEYS.items():
+        conn.execute(f'''
+            INSERT INTO {table} (dimension, day, key, revenue, units, orders)
+            SELECT '{dimension}', date(o.created_at), {key_sql},
+                   ? * SUM(oi.price * oi.quantity), ? * SUM(oi.quantity), ? * COUNT(DISTINCT o.id)
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE {where}
+            GROUP BY date(o.created_at), {key_sql}
+            ON CONFLICT (dimension, day, key) DO UPDATE SET
+                revenue = revenue + excluded.revenue,
+                units = units + excluded.units,
+                orders = orders + excluded.orders
+        ''', (sign, sign, sign, *params))
+
+
+def record_order_sales(conn, order_id, sign=1):
+    """Add (+1) or remove (-1) one order's lines, inside the caller's transaction"""
+    _aggregate(conn, 'sales_daily', 'oi.order_id = ?', (order_id,), sign)
+
+
+def remove_orders_sales(conn, order_ids):
+    """Subtract the lines of several orders (cancelled ones no longer count)"""
+    if order_ids:
+        placeholders = ','.join('?' * len(order_ids))
+        _aggregate(conn, 'sales_daily', f"oi.order_id IN ({placeholders}) AND o.status != 'cancelled'",
+                   tuple(order_ids), -1)
+
+
+def add_orders_sales(conn, order_ids):
+    """Add the lines of several orders that are not cancelled (orders moved into a shard)"""
+    if order_ids:
+        placeholders = ','.join('?' * len(order_ids))
+        _aggregate(conn, 'sales_daily', f"oi.order_id IN ({placeholders}) AND o.status != 'cancelled'",
+                   tuple(order_ids))
+
+
+def rebuild_sales_rollups(chunk_size=REBUILD_CHUNK_SIZE):
+    """Recompute sales_daily from orders and order_items in every store shard.
+
+    Orders are scanned in id ranges of chunk_size into a scratch table, each
+    chunk in its own short transaction. Cancellations and deletions of
+    orders already scanned are applied to the scratch table as they happen
+    (see _aggregate), and the last chunk and the swap into sales_daily run
+    under one write lock, so nothing committed during the scan is lost.
+    Returns the number of orders scanned.
+    """
+    return sum(_rebuild_shard(shard.connect(), chunk_size) for shard in store_shards.live_shards())
+
+
+def drop_rebuild_tables(conn):
+    """Remove a rebuild's scratch tables, so writers stop mirroring into them.
+
+    A rebuild drops them itself, also when it fails; init_db() calls this
+    for one interrupted by the process dying.
+    """
+    conn.execute('DROP TABLE IF EXISTS sales_daily_rebuild_progress')
+    conn.execute('DROP TABLE IF EXISTS sales_daily_rebuild')
+
+
+def _rebuild_shard(conn, chunk_size):
+    conn.isolation_level = None  # explicit transactions
+    try:
+        drop_rebuild_tables(conn)
+        conn.execute('CREATE TABLE sales_daily_rebuild AS SELECT * FROM sales_daily WHERE 0')
+        conn.execute('CREATE UNIQUE INDEX idx_sales_daily_rebuild ON sales_daily_rebuild (dimension, day, key)')
+        # Last order id scanned, read by writers mirroring their changes (created last)
+        conn.execute('CREATE TABLE sales_daily_rebuild_progress (last_id INTEGER NOT NULL)')
+        conn.execute('INSERT INTO sales_daily_rebuild_progress (last_id) VALUES (0)')
+
+        last_id = 0
+        scanned = 0
+        while True:
+            rows = conn.execute(
+                'SELECT id FROM orders WHERE id > ? ORDER BY id LIMIT ?', (last_id, chunk_size)
+            ).fetchall()
+            if len(rows) < chunk_size:
+                break  # finish under the write lock below
+            conn.execute('BEGIN')
+            _aggregate(conn, 'sales_daily_rebuild', "o.id > ? AND o.id <= ? AND o.status != 'cancelled'",
+                       (last_id, rows[-1]['id']))
+            conn.execute('UPDATE sales_daily_rebuild_progress SET last_id = ?', (rows[-1]['id'],))
+            conn.execute('COMMIT')
+            scanned += len(rows)
+            last_id = rows[-1]['id']
+
+        conn.execute('BEGIN IMMEDIATE')
+        scanned += conn.execute('SELECT COUNT(*) FROM orders WHERE id > ?', (last_id,)).fetchone()[0]
+        _aggregate(conn, 'sales_daily_rebuild', "o.id > ? AND o.status != 'cancelled'", (last_id,))
+        conn.execute('DELETE FROM sales_daily')
+        conn.execute('INSERT INTO sales_daily SELECT * FROM sales_daily_rebuild')
+        drop_rebuild_tables(conn)
+        conn.execute('COMMIT')
+        return scanned
+    except BaseException:
+        # Also on Ctrl-C: a leftover progress table keeps every writer mirroring
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        drop_rebuild_tables(conn)
+        raise
+    finally:
+        conn.close()
+
+
+def _merge_totals(rows):
+    """{group: [revenue, units, orders]} summed over (group, revenue, units, orders) rows of every shard"""
+    totals = {}
+    for group, revenue, units, orders in rows:
+        total = totals.setdefault(group, [0.0, 0, 0])
+        total[0] += revenue
+        total[1] += units
+        total[2] += orders
+    return totals
+
+
+def query_sales(dimension, start, end, key=None):
+    """Daily rows for one dimension between start and end (inclusive)"""
+    sql = '''
+        SELECT day, key, revenue, units, orders
+        FROM sales_daily
+        WHERE dimension = ? AND day BETWEEN ? AND ?
+    '''
+    params = [dimension, start, end]
+    if key is not None:
+        sql += ' AND key = ?'
+        params.append(key)
+    _, rows = store_shards.gather(sql, params)
+    totals = _merge_totals(((day, key), revenue, units, orders) for day, key, revenue, units, orders in rows)
+    return [{'day': day, 'key': key, 'revenue': round(revenue, 2), 'units': units, 'orders': orders}
+            for (day, key), (revenue, units, orders) in sorted(totals.items()) if units != 0]
+
+
+def query_top(dimension, start, end, by='revenue', limit=10):
+    """Top keys of a dimension over a date range, ranked by revenue or units"""
+    _, rows = store_shards.gather('''
+        SELECT key, SUM(revenue), SUM(units), SUM(orders)
+        FROM sales_daily
+        WHERE dimension = ? AND day BETWEEN ? AND ?
+        GROUP BY key
+    ''', (dimension, start, end))
+    rank = 1 if by == 'units' else 0
+    totals = sorted(((key, total) for key, total in _merge_totals(rows).items() if total[1] > 0),
+                    key=lambda item: (-item[1][rank], item[0]))
+    return [{'key': key, 'revenue': round(revenue, 2), 'units': units, 'orders': orders}
+            for key, (revenue, units, orders) in totals[:limit]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sales rollup maintenance')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild = sub.add_parser('rebuild', help='recompute sales_daily from orders')
+    rebuild.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        for shard in store_shards.live_shards():
+            conn = shard.connect()
+            ensure_sales_rollups(conn)
+            conn.commit()
+            conn.close()
+        print(f"Rebuilt sales rollups from {rebuild_sales_rollups(args.chunk_size)} orders")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Async access layer for SQLite.
+
+sqlite3 is blocking, so queries run on a dedicated thread pool. An asyncio
+semaphore bounds how many queries are in flight; requests beyond that wait
+in the event loop (costing a coroutine, not a thread), so thousands of slow
+clients or long-polls never need thousands of OS threads.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from database.db_init import register_post_fork, use_readonly_lane
+
+DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', '8'))
+DB_MAX_CONCURRENCY = int(os.environ.get('ASYNC_DB_MAX_CONCURRENCY', str(DB_THREADS * 4)))
+
+
+class AsyncDB:
+    def __init__(self, threads=DB_THREADS, max_concurrency=DB_MAX_CONCURRENCY):
+        self.threads = threads
+        self.max_concurrency = max_concurrency
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure(self):
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            # The async path only serves reads, so its threads use the read-only lane
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix='sqlite', initializer=use_readonly_lane
+            )
+        if self._loop is not loop:
+            # Semaphores bind to the loop they are first used on
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return loop
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking database function on the pool and await its result"""
+        loop = self._ensure()
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def reset(self):
+        """Forget the pool (after fork the parent's threads do not exist)"""
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+
+
+async_db = AsyncDB()
+register_post_fork(async_db.reset)
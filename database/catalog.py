@@ -0,0 +1,78 @@
+"""Catalog-wide version counter for products.db.
+
+Every product write and every stock change bumps a single counter row in the
+same transaction as the write itself, so readers can validate cached catalog
+data (HTTP ETags, in-process caches) with one primary-key lookup instead of
+re-running listing queries. The ids of the products touched by each bump are
+recorded in catalog_changes so other worker processes can invalidate exactly
+those entries (see database/invalidation.py).
+"""
+from database.db_init import get_products_db_connection
+
+# Number of versions of change history kept for other processes to catch up
+# on; a process that falls further behind than this flushes its caches
+CHANGE_LOG_RETENTION = 10000
+
+# Millisecond-resolution timestamp for updated_at columns. Second resolution
+# is too coarse to tell two writes apart when it is used as a validator.
+NOW_MS = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def ensure_catalog_meta(conn):
+    """Create the catalog version table (idempotent)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0)')
+    # product_id NULL means "everything may have changed"
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            version INTEGER NOT NULL,
+            product_id INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_catalog_changes_version ON catalog_changes (version)')
+
+
+def bump_catalog_version(conn, product_ids=None):
+    """Bump the catalog version inside the caller's write transaction.
+
+    product_ids lists the products the write touched; None means the whole
+    catalog may have changed (e.g. after a rebuild).
+    """
+    conn.execute(
+        f'UPDATE catalog_meta SET version = version + 1, updated_at = {NOW_MS} WHERE id = 1'
+    )
+    version = conn.execute('SELECT version FROM catalog_meta WHERE id = 1').fetchone()[0]
+    if product_ids is None:
+        conn.execute('INSERT INTO catalog_changes (version, product_id) VALUES (?, NULL)', (version,))
+    else:
+        conn.executemany(
+            'INSERT INTO catalog_changes (version, product_id) VALUES (?, ?)',
+            [(version, int(pid)) for pid in set(product_ids)]
+        )
+    if version % 1000 == 0:
+        conn.execute(
+            'DELETE FROM catalog_changes WHERE version <= ?', (version - CHANGE_LOG_RETENTION,)
+        )
+    return version
+
+
+def get_catalog_version(conn=None):
+    """Return (version, updated_at) of the product catalog"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_products_db_connection()
+    try:
+        row = conn.execute('SELECT version, updated_at FROM catalog_meta WHERE id = 1').fetchone()
+    finally:
+        if own_conn:
+            conn.close()
+    if not row:
+        return 0, None
+    return row['version'], row['updated_at']
@@ -1,41 +1,114 @@
 import sqlite3
 import hashlib
 import os
+import threading
+
+STORE_DB = 'store.db'
+PRODUCTS_DB = 'products.db'
+
+# Read-only lane tuning for catalog reads
+READONLY_MMAP_SIZE = int(os.environ.get('PRODUCTS_RO_MMAP_SIZE', str(256 * 1024 * 1024)))
+READONLY_CACHE_KIB = int(os.environ.get('PRODUCTS_RO_CACHE_KIB', str(64 * 1024)))
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def get_db_connection():
-    conn = sqlite3.connect('store.db')
+    conn = sqlite3.connect(STORE_DB)
     conn.row_factory = sqlite3.Row
     return conn
 
-def get_products_db_connection():
-    conn = sqlite3.connect('products.db')
+def get_products_db_connection(readonly=None):
+    """Connection to products.db.
+
+    GET/HEAD requests (and threads marked with use_readonly_lane()) are
+    routed to the read-only lane automatically; pass readonly=False to force
+    a read-write connection or readonly=True to force the lane.
+    """
+    if readonly is None:
+        readonly = _prefers_readonly()
+    if readonly:
+        return get_products_ro_connection()
+    conn = sqlite3.connect(PRODUCTS_DB)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    print("Initializing databases...")
-    
-    # Initialize main store database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
+class ReadOnlyConnection(sqlite3.Connection):
+    """Long-lived lane connection; close() is a no-op so callers can keep
+    their usual open/close pattern while the connection is reused"""
+    def close(self):
+        pass
+
+    def really_close(self):
+        super().close()
+
+_ro_local = threading.local()
+# Lane connections inherited across fork; kept referenced (never closed or
+# garbage collected in the child) so the parent's file locks are untouched
+_abandoned_connections = []
+
+def get_products_ro_connection():
+    """Read-only lane for catalog queries: one persistent connection per
+    thread opened with mode=ro, query_only and a large mmap and page cache"""
+    conn = getattr(_ro_local, 'conn', None)
+    if conn is not None and _ro_local.pid == os.getpid():
+        return conn
+    if conn is not None:
+        _abandoned_connections.append(conn)
+
+    conn = sqlite3.connect(
+        f'file:{PRODUCTS_DB}?mode=ro', uri=True, factory=ReadOnlyConnection,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = 1')
+    conn.execute(f'PRAGMA mmap_size = {READONLY_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{READONLY_CACHE_KIB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    _ro_local.conn = conn
+    _ro_local.pid = os.getpid()
+    return conn
+
+def use_readonly_lane():
+    """Mark the current thread as read-only (e.g. async read-path pool threads)"""
+    _ro_local.readonly_thread = True
+
+def _prefers_readonly():
+    if getattr(_ro_local, 'readonly_thread', False):
+        return True
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return False
+    return has_request_context() and request.method in ('GET', 'HEAD')
+
+def reset_readonly_lane():
+    conn = getattr(_ro_local, 'conn', None)
+    if conn is not None:
+        _abandoned_connections.append(conn)
+        _ro_local.conn = None
+
+# Callbacks that drop process-wide connections and state; run in each worker
+# process after fork so nothing opened in the parent is shared
+_post_fork_hooks = []
+
+def register_post_fork(callback):
+    _post_fork_hooks.append(callback)
+
+def reset_connections():
+    """Reinitialize process-wide database state (call after fork)"""
+    reset_readonly_lane()
+    for callback in _post_fork_hooks:
+        callback()
+
+def ensure_user_schema(conn):
+    """Create the per-user tables with their rollups, counters and indexes (idempotent).
+
+    Run on store.db and on every store shard (database/store_shards.py);
+    returns True if the sales rollups did not exist yet.
+    """
     # Create cart table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS cart (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -47,7 +120,7 @@ def init_db():
     ''')
     
     # Create wishlist table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS wishlist (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -59,31 +132,36 @@ def init_db():
     ''')
     
     # Create orders table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS orders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             total_amount REAL NOT NULL,
             status TEXT DEFAULT 'pending',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            idempotency_key TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
         )
     ''')
     
     # Create order_items table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS order_items (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             order_id INTEGER NOT NULL,
             product_id INTEGER NOT NULL,
             quantity INTEGER NOT NULL,
             price REAL NOT NULL,
+            product_name TEXT,
+            product_category TEXT,
+            product_brand TEXT,
+            product_image TEXT,
             FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE
         )
     ''')
     
     # Create reviews table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS reviews (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -98,7 +176,7 @@ def init_db():
     ''')
     
     # Create notifications table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS notifications (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -111,6 +189,75 @@ def init_db():
         )
     ''')
     
+    # Checkout's Idempotency-Key on the order it placed
+    from database.idempotency import ensure_order_keys
+    ensure_order_keys(conn)
+    
+    # Order counters, kept current by triggers on orders
+    from database.stats import ensure_order_stats
+    ensure_order_stats(conn)
+    
+    # Daily sales rollups, filled from existing orders if new
+    from database.analytics import ensure_sales_rollups
+    sales_rollups_created = ensure_sales_rollups(conn)
+    
+    # Lookups of the deletion reaper and the wishlist alerter
+    from database.deletion import ensure_dependent_indexes
+    ensure_dependent_indexes(conn)
+    
+    # What each user was last told about their wishlisted products
+    from database.wishlist_alerts import ensure_wishlist_alerts
+    ensure_wishlist_alerts(conn)
+    
+    # Users moved to another shard by a reshard
+    from database.store_shards import ensure_shard_guard
+    ensure_shard_guard(conn)
+    return sales_rollups_created
+
+def init_db(reset_products=True):
+    """Create all tables and seed data.
+
+    With reset_products=True (the development default) the products table is
+    dropped and re-seeded. With reset_products=False the existing catalog is
+    kept and sample products are only inserted into an empty table.
+    """
+    print("Initializing databases...")
+    
+    # Initialize main store database
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Create users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deleted_at TIMESTAMP
+        )
+    ''')
+    
+    # User counters, kept current by triggers on users
+    from database.stats import ensure_store_stats
+    ensure_store_stats(conn)
+    
+    # Stored responses for Idempotency-Key retries
+    from database.idempotency import ensure_idempotency_keys
+    ensure_idempotency_keys(conn)
+    
+    # Queue for background cascade deletes
+    from database.deletion import ensure_deletion_jobs
+    ensure_deletion_jobs(conn)
+    
+    # Which generation of store shards holds the per-user tables; generation
+    # 0 is store.db itself, so its per-user tables are always created
+    from database.store_shards import ensure_store_layout
+    ensure_store_layout(conn)
+    sales_rollups_created = ensure_user_schema(conn)
+    
     # Check if admin user exists
     admin_exists = cursor.execute(
         'SELECT COUNT(*) FROM users WHERE username = ?', ('admin',)
@@ -126,18 +273,32 @@ def init_db():
     
     conn.commit()
     conn.close()
+    
+    # Shard files of a resharded store get the same per-user schema
+    from database.store_shards import store_shards
+    for shard in store_shards.live_shards():
+        if shard.generation:
+            shard_conn = shard.connect()
+            ensure_user_schema(shard_conn)
+            shard_conn.commit()
+            shard_conn.close()
     print("Main database initialized successfully")
     
     # Initialize products database with complete schema
-    products_conn = get_products_db_connection()
+    products_conn = get_products_db_connection(readonly=False)
     products_cursor = products_conn.cursor()
     
-    # Drop existing products table if it exists (to rebuild with correct schema)
-    products_cursor.execute('DROP TABLE IF EXISTS products')
+    # WAL lets the read-only lane keep reading while checkout writes stock
+    products_cursor.execute('PRAGMA journal_mode = WAL')
+    
+    if reset_products:
+        # Drop existing products table if it exists (to rebuild with correct schema)
+        products_cursor.execute('DROP TABLE IF EXISTS products')
+        products_cursor.execute('DROP TABLE IF EXISTS product_tags')
     
     # Create products table with all required columns
     products_cursor.execute('''
-        CREATE TABLE products (
+        CREATE TABLE IF NOT EXISTS products (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             description TEXT DEFAULT '',
@@ -148,6 +309,7 @@ def init_db():
             tags TEXT DEFAULT '',
             image_url TEXT DEFAULT '',
             featured INTEGER DEFAULT 0,
+            stock_sharded INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -189,16 +351,52 @@ def init_db():
         ('Basketball Official', 'Official size and weight basketball for indoor/outdoor play.', 29.99, 40, 'Sports & Outdoors', 'SportsPro', 'basketball,official,indoor,outdoor', 'https://images.unsplash.com/photo-1546519638-68e109498ffc?w=400', 0),
     ]
     
-    print("Inserting sample products...")
-    for product in sample_products:
-        products_cursor.execute('''
-            INSERT INTO products (name, description, price, stock, category, brand, tags, image_url, featured)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', product)
+    existing_products = products_cursor.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+    seeded = existing_products == 0
+    if seeded:
+        print("Inserting sample products...")
+        for product in sample_products:
+            products_cursor.execute('''
+                INSERT INTO products (name, description, price, stock, category, brand, tags, image_url, featured)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', product)
+    
+    # Catalog version counter used to validate cached catalog responses;
+    # if the catalog was just rebuilt anything cached before is stale
+    from database.catalog import ensure_catalog_meta, bump_catalog_version
+    ensure_catalog_meta(products_conn)
+    from database.stats import ensure_product_stats
+    ensure_product_stats(products_conn)
+    # Normalized tag index kept in sync with products.tags by triggers
+    from database.tags import ensure_product_tags
+    ensure_product_tags(products_conn)
+    if seeded:
+        bump_catalog_version(products_conn)
     
     products_conn.commit()
     products_conn.close()
     
+    # Bring existing store.db files up to the current schema
+    from database.migrations import run_migrations
+    run_migrations()
+    if sales_rollups_created:
+        from database.analytics import rebuild_sales_rollups
+        rebuild_sales_rollups()
+    
+    # A store still in the single store.db is split into STORE_SHARDS files
+    from database.store_shards import STORE_SHARDS, reshard
+    if STORE_SHARDS > 1 and store_shards.active_generation() == 0:
+        reshard(STORE_SHARDS)
+    
+    # Counters start from the rows that existed before their triggers did
+    from database.stats import stats_reconciler
+    stats_reconciler.run_once()
+    
+    if not seeded:
+        print(f"Products database already has {existing_products} products, keeping them")
+        print("\n=== DATABASE INITIALIZATION COMPLETE ===")
+        return
+    
     print(f"Products database initialized successfully with {len(sample_products)} products")
     print("\n=== DATABASE INITIALIZATION COMPLETE ===")
     print("Available test accounts:")
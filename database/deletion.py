@@ -0,0 +1,368 @@
+"""Background cascade deletion of users and products.
+
+Deleting an entity is split in two:
+
+1. The request tombstones it and queues a deletion job, in one short
+   transaction. A user gets users.deleted_at, so it can no longer log in and
+   disappears from user lists. A product's row is removed from products.db
+   right away, because every catalog read already treats a missing row as a
+   deleted product.
+2. The DeletionReaper thread works through the queued jobs. Each job deletes
+   the entity's dependent rows in batches of DELETION_BATCH_SIZE, one short
+   write transaction per batch with a pause in between, so checkouts never
+   wait long for the write lock. Progress (current step and rows deleted)
+   is saved in store.db after each batch, and a job interrupted by a
+   restart resumes where it stopped: every batch is safe to repeat.
+
+    user     cart, wishlist, reviews, notifications, orders with their
+             order_items (and their sales rollups) in the user's store
+             shard, then the users row
+    product  cart, wishlist and reviews rows for the product, in every shard
+
+find_orphans() checks every store shard for rows whose parent is gone (for
+example after a crash between deleting a product and queueing its job, or
+rows left behind before this module existed); repair_orphans() queues jobs
+for the missing parents. Order items keep referencing deleted products on
+purpose: they carry a snapshot of the product as sold.
+
+    python -m database.deletion check | fix | run
+"""
+import argparse
+import os
+import time
+from database.db_init import get_db_connection, PRODUCTS_DB
+from database.store_shards import store_shards, get_user_db_connection
+from database.analytics import remove_orders_sales
+from utils.background import PeriodicWorker
+
+DELETION_BATCH_SIZE = int(os.environ.get('DELETION_BATCH_SIZE', 500))
+DELETION_BATCH_PAUSE = 0.01  # seconds between batches, lets other writers in
+DELETION_MAX_ATTEMPTS = 5
+# A running job whose worker has not reported progress for this long is resumed by another
+DELETION_STALE_AFTER = 300
+
+# entity -> ordered (table, column) steps; 'orders' also removes order_items
+DELETION_STEPS = {
+    'user': [('cart', 'user_id'), ('wishlist', 'user_id'), ('reviews', 'user_id'),
+             ('notifications', 'user_id'), ('orders', 'user_id'), ('users', 'id')],
+    'product': [('cart', 'product_id'), ('wishlist', 'product_id'), ('reviews', 'product_id')],
+}
+
+# Lookups the reaper and the orphan check run per batch
+DEPENDENT_INDEXES = {
+    'idx_cart_product': 'cart (product_id)',
+    'idx_wishlist_product': 'wishlist (product_id, user_id)',  # also walked by wishlist alerts
+    'idx_reviews_product': 'reviews (product_id)',
+    'idx_notifications_user': 'notifications (user_id)',
+    'idx_orders_user': 'orders (user_id)',
+    'idx_order_items_order': 'order_items (order_id)',
+}
+
+# (table, column, parent table, parent database) checked by find_orphans();
+# users and orders are found unqualified (users is attached in shards)
+ORPHAN_CHECKS = [
+    ('cart', 'user_id', 'users', None),
+    ('wishlist', 'user_id', 'users', None),
+    ('reviews', 'user_id', 'users', None),
+    ('notifications', 'user_id', 'users', None),
+    ('orders', 'user_id', 'users', None),
+    ('order_items', 'order_id', 'orders', None),
+    ('cart', 'product_id', 'products', 'catalog'),
+    ('wishlist', 'product_id', 'products', 'catalog'),
+    ('reviews', 'product_id', 'products', 'catalog'),
+]
+
+
+def ensure_deletion_jobs(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS deletion_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            step TEXT,
+            rows_deleted INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            heartbeat REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    # At most one open job per entity
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_deletion_jobs_open ON deletion_jobs (entity, entity_id)
+        WHERE status IN ('pending', 'running')
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_deletion_jobs_status ON deletion_jobs (status, id)')
+
+
+def ensure_dependent_indexes(conn):
+    """Indexes the reaper looks dependent rows up by, in a store shard"""
+    for name, target in DEPENDENT_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+
+def queue_deletion(conn, entity, entity_id):
+    """Queue a job inside the caller's transaction; returns its id (existing open job if any)"""
+    conn.execute('INSERT OR IGNORE INTO deletion_jobs (entity, entity_id) VALUES (?, ?)', (entity, entity_id))
+    return conn.execute('''
+        SELECT id FROM deletion_jobs
+        WHERE entity = ? AND entity_id = ? AND status IN ('pending', 'running')
+    ''', (entity, entity_id)).fetchone()['id']
+
+
+def tombstone_user(conn, user_id):
+    """Mark a user deleted and queue the reaping of their data (caller commits)"""
+    conn.execute('UPDATE users SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND deleted_at IS NULL', (user_id,))
+    return queue_deletion(conn, 'user', user_id)
+
+
+def get_job(job_id):
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM deletion_jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def list_jobs(status=None, limit=50):
+    conn = get_db_connection()
+    try:
+        if status:
+            rows = conn.execute('SELECT * FROM deletion_jobs WHERE status = ? ORDER BY id DESC LIMIT ?',
+                                (status, limit))
+        else:
+            rows = conn.execute('SELECT * FROM deletion_jobs ORDER BY id DESC LIMIT ?', (limit,))
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def _claim_job(conn):
+    """Mark the next runnable job as running; returns it or None"""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        job = conn.execute('''
+            SELECT * FROM deletion_jobs
+            WHERE status = 'pending' OR (status = 'running' AND heartbeat < ?)
+            ORDER BY id LIMIT 1
+        ''', (now - DELETION_STALE_AFTER,)).fetchone()
+        if job:
+            conn.execute(
+                "UPDATE deletion_jobs SET status = 'running', attempts = attempts + 1, heartbeat = ? WHERE id = ?",
+                (now, job['id'])
+            )
+        conn.execute('COMMIT')
+        return job
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _delete_batch(conn, job, table, column, batch_size):
+    """Delete one batch of the job's rows in `table`; returns the number deleted"""
+    entity_id = job['entity_id']
+    if table == 'orders':
+        order_ids = [row['id'] for row in conn.execute(
+            'SELECT id FROM orders WHERE user_id = ? LIMIT ?', (entity_id, batch_size)
+        )]
+        if not order_ids:
+            return 0
+        placeholders = ','.join('?' * len(order_ids))
+        remove_orders_sales(conn, order_ids)
+        items = conn.execute(f'DELETE FROM order_items WHERE order_id IN ({placeholders})', order_ids).rowcount
+        return items + conn.execute(f'DELETE FROM orders WHERE id IN ({placeholders})', order_ids).rowcount
+    if table == 'users':
+        # Only a tombstoned user; a job for an already missing user deletes nothing
+        return conn.execute('DELETE FROM users WHERE id = ? AND deleted_at IS NOT NULL', (entity_id,)).rowcount
+    return conn.execute(
+        f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {column} = ? LIMIT ?)',
+        (entity_id, batch_size)
+    ).rowcount
+
+
+def _step_targets(job, table):
+    """Connection factories a step's batches run on"""
+    if table == 'users':
+        return [get_db_connection]
+    if job['entity'] == 'user':
+        # Routed per batch under the shard's write lock, so a user moved by
+        # a reshard is followed and cannot move mid-batch
+        return [lambda: get_user_db_connection(job['entity_id'], write=True)]
+    return [shard.connect for shard in store_shards.live_shards()]
+
+
+def run_job(job, batch_size=DELETION_BATCH_SIZE, pause=DELETION_BATCH_PAUSE):
+    """Reap every step of a claimed job, one transaction per batch"""
+    conn = get_db_connection()
+    conn.isolation_level = None  # explicit transactions
+    try:
+        for table, column in DELETION_STEPS[job['entity']]:
+            for connect in _step_targets(job, table):
+                while True:
+                    target = connect()
+                    try:
+                        if not target.in_transaction:
+                            target.execute('BEGIN IMMEDIATE')
+                        try:
+                            deleted = _delete_batch(target, job, table, column, batch_size)
+                            target.commit()
+                        except Exception:
+                            target.rollback()
+                            raise
+                    finally:
+                        target.close()
+                    conn.execute('''
+                        UPDATE deletion_jobs
+                        SET step = ?, rows_deleted = rows_deleted + ?, heartbeat = ?
+                        WHERE id = ?
+                    ''', (table, deleted, time.time(), job['id']))
+                    if deleted < batch_size or table == 'users':
+                        break
+                    time.sleep(pause)
+        conn.execute('''
+            UPDATE deletion_jobs SET status = 'done', step = NULL, error = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (job['id'],))
+    finally:
+        conn.close()
+
+
+def run_pending_jobs(batch_size=DELETION_BATCH_SIZE):
+    """Run queued jobs until none are left; returns the number completed"""
+    completed = 0
+    while True:
+        conn = get_db_connection()
+        conn.isolation_level = None
+        try:
+            job = _claim_job(conn)
+        finally:
+            conn.close()
+        if job is None:
+            return completed
+        try:
+            run_job(job, batch_size)
+            completed += 1
+        except Exception as e:
+            status = 'failed' if job['attempts'] + 1 >= DELETION_MAX_ATTEMPTS else 'pending'
+            conn = get_db_connection()
+            try:
+                conn.execute('UPDATE deletion_jobs SET status = ?, error = ? WHERE id = ?', (status, str(e), job['id']))
+                conn.commit()
+            finally:
+                conn.close()
+            print(f"Deletion job {job['id']} ({job['entity']} {job['entity_id']}) failed: {e}")
+            if status == 'pending':
+                return completed  # retry on the next run rather than spinning now
+
+
+def _attach_catalog(conn):
+    conn.execute('ATTACH DATABASE ? AS catalog', (PRODUCTS_DB,))
+
+
+def _orphan_sql(select, table, column, parent, database):
+    source = parent if database is None else f'{database}.{parent}'
+    return f'''
+        SELECT {select} FROM main.{table} t
+        WHERE NOT EXISTS (SELECT 1 FROM {source} p WHERE p.id = t.{column})
+    '''
+
+
+def find_orphans():
+    """{'table.column': count} of rows whose parent row no longer exists, over all store shards"""
+    orphans = {}
+    for shard in store_shards.live_shards():
+        conn = shard.connect()
+        try:
+            _attach_catalog(conn)
+            for table, column, parent, database in ORPHAN_CHECKS:
+                count = conn.execute(_orphan_sql('COUNT(*)', table, column, parent, database)).fetchone()[0]
+                if count:
+                    orphans[f'{table}.{column}'] = orphans.get(f'{table}.{column}', 0) + count
+        finally:
+            conn.close()
+    return orphans
+
+
+def repair_orphans(batch_size=DELETION_BATCH_SIZE):
+    """Queue deletion jobs for missing users and products and drop orphaned order items.
+
+    Returns {'jobs': n queued, 'order_items': n deleted}; the reaper does the rest.
+    """
+    missing = set()
+    removed = 0
+    for shard in store_shards.live_shards():
+        conn = shard.connect()
+        conn.isolation_level = None
+        try:
+            _attach_catalog(conn)
+            for table, column, parent, database in ORPHAN_CHECKS:
+                if parent == 'orders':
+                    continue
+                entity = 'user' if parent == 'users' else 'product'
+                missing.update((entity, row[0]) for row in conn.execute(
+                    _orphan_sql(f'DISTINCT t.{column}', table, column, parent, database)
+                ))
+            conn.execute('DETACH DATABASE catalog')
+
+            # Items of orders that no longer exist belong to no job; reap them directly
+            while True:
+                conn.execute('BEGIN IMMEDIATE')
+                deleted = conn.execute('''
+                    DELETE FROM order_items WHERE rowid IN (
+                        SELECT oi.rowid FROM order_items oi
+                        WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = oi.order_id)
+                        LIMIT ?
+                    )
+                ''', (batch_size,)).rowcount
+                conn.execute('COMMIT')
+                removed += deleted
+                if deleted < batch_size:
+                    break
+                time.sleep(DELETION_BATCH_PAUSE)
+        finally:
+            conn.close()
+
+    conn = get_db_connection()
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for entity, entity_id in missing:
+            queue_deletion(conn, entity, entity_id)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return {'jobs': len(missing), 'order_items': removed}
+
+
+class DeletionReaper(PeriodicWorker):
+    """Runs queued deletion jobs every `interval` seconds, or when woken"""
+    name = 'deletion-reaper'
+
+    def __init__(self):
+        super().__init__()
+        self.last_run = None
+
+    def run_once(self):
+        completed = run_pending_jobs()
+        self.last_run = time.strftime('%Y-%m-%d %H:%M:%S')
+        return completed
+
+
+deletion_reaper = DeletionReaper()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deletion jobs and orphan checks')
+    parser.add_argument('command', choices=['check', 'fix', 'run'])
+    args = parser.parse_args()
+    if args.command == 'check':
+        print(f"Orphaned rows: {find_orphans() or 'none'}")
+    elif args.command == 'fix':
+        print(f"Repair: {repair_orphans()}")
+        print(f"Completed {run_pending_jobs()} deletion jobs")
+    else:
+        print(f"Completed {run_pending_jobs()} deletion jobs")
@@ -0,0 +1,142 @@
+"""Stored responses for Idempotency-Key request deduplication.
+
+idempotency_keys holds one row per (scope, key), where scope identifies the
+user and endpoint. A row without a status code is a request still in
+flight; once the handler finishes, its status code and JSON body are stored
+and replayed to every retry that carries the same key until expires_at.
+
+    claim(scope, key, fingerprint)  -> (CLAIMED, None) for the first request,
+                                       (REPLAY, (code, body)) once it finished,
+                                       (IN_FLIGHT, None) / (MISMATCH, None)
+    complete(scope, key, code, body)
+    release(scope, key)             forget a key whose request failed
+
+Expired rows are removed by purge_expired(), which claim() runs at most
+once every IDEMPOTENCY_PURGE_INTERVAL seconds per process.
+
+The stored response is written after the handler's own commit, so a worker
+that dies in between leaves the key in flight until it is reclaimed. Checkout
+therefore also records the key on the order row (ensure_order_keys), and a
+retry with a reclaimed key finds the order already placed instead of placing
+it again.
+"""
+import os
+import threading
+import time
+from config import Config
+from database.db_init import get_db_connection
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+# A request still in flight after this long is presumed dead (worker killed).
+# Always longer than REQUEST_TIMEOUT, which a live request may run for.
+IDEMPOTENCY_LOCK_TIMEOUT = max(int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 2 * Config.REQUEST_TIMEOUT)),
+                               Config.REQUEST_TIMEOUT + 1)
+IDEMPOTENCY_PURGE_INTERVAL = 60
+
+CLAIMED, REPLAY, IN_FLIGHT, MISMATCH = 'claimed', 'replay', 'in_flight', 'mismatch'
+
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def ensure_idempotency_keys(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status_code INTEGER,
+            response TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)')
+
+
+def ensure_order_keys(conn):
+    """Idempotency-Key column on orders, unique per user (idempotent; store shards)"""
+    # Older files have orders without the column
+    if 'idempotency_key' not in {row[1] for row in conn.execute('PRAGMA table_info(orders)')}:
+        conn.execute('ALTER TABLE orders ADD COLUMN idempotency_key TEXT')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key
+        ON orders (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL
+    ''')
+
+
+def purge_expired(now=None):
+    """Delete expired keys; returns the number removed"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('DELETE FROM idempotency_keys WHERE expires_at < ?', (now or time.time(),))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def _maybe_purge(now):
+    global _last_purge
+    with _purge_lock:
+        if now - _last_purge < IDEMPOTENCY_PURGE_INTERVAL:
+            return
+        _last_purge = now
+    purge_expired(now)
+
+
+def claim(scope, key, fingerprint, ttl=IDEMPOTENCY_TTL):
+    """Register a request under its key, or report what happened to the first one"""
+    now = time.time()
+    _maybe_purge(now)
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            'SELECT fingerprint, status_code, response, created_at, expires_at '
+            'FROM idempotency_keys WHERE scope = ? AND key = ?', (scope, key)
+        ).fetchone()
+        stale = row is not None and (
+            row['expires_at'] < now
+            or (row['status_code'] is None and now - row['created_at'] > IDEMPOTENCY_LOCK_TIMEOUT)
+        )
+        if row is None or stale:
+            conn.execute('''
+                INSERT OR REPLACE INTO idempotency_keys (scope, key, fingerprint, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (scope, key, fingerprint, now, now + ttl))
+            conn.commit()
+            return CLAIMED, None
+        conn.rollback()
+        if row['fingerprint'] != fingerprint:
+            return MISMATCH, None
+        if row['status_code'] is None:
+            return IN_FLIGHT, None
+        return REPLAY, (row['status_code'], row['response'])
+    finally:
+        conn.close()
+
+
+def complete(scope, key, status_code, response):
+    """Store the finished response for replay"""
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            'UPDATE idempotency_keys SET status_code = ?, response = ? WHERE scope = ? AND key = ?',
+            (status_code, response, scope, key)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def release(scope, key):
+    """Drop an in-flight key so the request can be retried from scratch"""
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND status_code IS NULL',
+                     (scope, key))
+        conn.commit()
+    finally:
+        conn.close()
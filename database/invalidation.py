@@ -0,0 +1,139 @@
+"""Cross-process cache invalidation for multi-worker deployments.
+
+Each worker process keeps its own in-memory caches, so a product write
+handled by one worker must reach the others. No external service is needed:
+writers already bump catalog_meta.version and log the touched product ids in
+catalog_changes in the same transaction (database/catalog.py). Each process
+polls that log, first checking SQLite's `PRAGMA data_version` - which only
+changes when another connection commits to products.db - and then reading
+the changes since the last version it saw.
+
+Polling happens lazily on cache access, at most once per `interval`
+seconds, so the staleness bound holds no matter how threads are scheduled:
+a cache read never reflects a state older than the writes committed more
+than `interval` seconds before it started.
+"""
+import os
+import sqlite3
+import threading
+import time
+from database.catalog import CHANGE_LOG_RETENTION
+from database.db_init import register_post_fork
+
+DEFAULT_INTERVAL = float(os.environ.get('CACHE_COHERENCE_INTERVAL', '0.5'))
+
+
+class CatalogInvalidationBus:
+    def __init__(self, db_path='products.db', interval=DEFAULT_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._conn = None
+        self._pid = None
+        self._data_version = None
+        self._last_version = None
+        self._last_check = 0.0
+        self.checks = 0
+        self.invalidations = 0
+        self.full_flushes = 0
+
+    def subscribe(self, callback):
+        """Register callback(product_ids) - product_ids None means flush everything"""
+        self._subscribers.append(callback)
+
+    def reset(self):
+        """Drop the polling connection (e.g. after fork); the next sync reopens it"""
+        with self._lock:
+            self._conn = None
+            self._pid = None
+            self._data_version = None
+            self._last_check = 0.0
+
+    def sync(self, force=False):
+        """Apply invalidations from other processes if the interval has elapsed"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.interval:
+            return
+        with self._lock:
+            if not force and now - self._last_check < self.interval:
+                return
+            try:
+                self._poll()
+            except sqlite3.Error as e:
+                # Fail safe: if we cannot tell what changed, flush everything
+                print(f"Cache invalidation poll failed, flushing caches: {e}")
+                self._conn = None
+                self._notify(None)
+            self._last_check = now
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        self._conn = conn
+        self._pid = os.getpid()
+        self._data_version = None
+
+    def _poll(self):
+        # A connection inherited across fork must not be reused
+        if self._conn is None or self._pid != os.getpid():
+            self._connect()
+        self.checks += 1
+
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version and self._last_version is not None:
+            return
+        self._data_version = data_version
+
+        self._conn.execute('BEGIN')
+        try:
+            version = self._conn.execute(
+                'SELECT version FROM catalog_meta WHERE id = 1'
+            ).fetchone()[0]
+            if self._last_version is None:
+                # First poll in this process: caches are filled after this
+                # point, so there is nothing older to invalidate
+                self._last_version = version
+                return
+            if version == self._last_version:
+                return
+            changes = self._conn.execute(
+                'SELECT product_id FROM catalog_changes WHERE version > ? AND version <= ?',
+                (self._last_version, version)
+            ).fetchall()
+        finally:
+            self._conn.execute('COMMIT')
+
+        if version < self._last_version or self._last_version < version - CHANGE_LOG_RETENTION:
+            # Catalog was rebuilt or the change log was pruned past us
+            self._notify(None)
+        else:
+            product_ids = set()
+            for change in changes:
+                if change['product_id'] is None:
+                    product_ids = None
+                    break
+                product_ids.add(change['product_id'])
+            self._notify(product_ids)
+        self._last_version = version
+
+    def _notify(self, product_ids):
+        if product_ids is None:
+            self.full_flushes += 1
+        else:
+            self.invalidations += len(product_ids)
+        for callback in self._subscribers:
+            callback(product_ids)
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'last_version': self._last_version,
+            'checks': self.checks,
+            'invalidations': self.invalidations,
+            'full_flushes': self.full_flushes,
+        }
+
+
+catalog_bus = CatalogInvalidationBus()
+register_post_fork(catalog_bus.reset)
@@ -0,0 +1,176 @@
+"""Vectorized inventory analytics and reorder suggestions.
+
+The whole catalog is handled in one pass over NumPy arrays: current stock
+comes from products.db (live shard totals for products with sharded stock,
+see database/stock_shards.py), and daily unit sales per product from the
+sales_daily rollups (see database/analytics.py), which hold the order_items
+time series already grouped to one row per product per day.
+
+For every product this computes
+    velocity        mean units sold per day over the window
+    forecast        daily demand: blend of the short and long moving averages
+    days_of_cover   stock / forecast (None when nothing is selling)
+    reorder_point   forecast over the lead time plus safety stock
+    reorder_qty     units to order to cover lead time + review period
+
+NumPy is optional; without it forecast_inventory() raises RuntimeError.
+"""
+import itertools
+from datetime import date, datetime, timedelta, timezone
+from database.db_init import get_products_db_connection
+from database.stock_shards import sharded_stock
+from database.store_shards import store_shards
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+WINDOW_DAYS = 28
+SHORT_WINDOW_DAYS = 7
+SHORT_WEIGHT = 0.6  # weight of the short moving average in the forecast
+LEAD_TIME_DAYS = 7
+REVIEW_PERIOD_DAYS = 7
+SERVICE_Z = 1.65  # ~95% cycle service level
+
+
+def _int_matrix(rows, width):
+    """Rows of integers -> (len(rows), width) int64 array without per-row arrays"""
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width)
+    return flat.reshape(-1, width)
+
+
+def load_stock(conn=None):
+    """(ids, stock) arrays for every product, sorted by id"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_products_db_connection()
+    try:
+        rows = conn.execute(
+            'SELECT id, stock, COALESCE(stock_sharded, 0) FROM products ORDER BY id'
+        ).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    data = _int_matrix(rows, 3)
+    ids, stock = data[:, 0], data[:, 1]
+    # products.stock of sharded products only catches up when the reconciler
+    # syncs it; their live stock is the sum over the shards
+    sharded = data[:, 2] != 0
+    if sharded.any():
+        sharded_ids = ids[sharded].tolist()
+        totals = sharded_stock.totals(sharded_ids)
+        stock[sharded] = [totals.get(product_id, 0) for product_id in sharded_ids]
+    return ids, stock
+
+
+def load_daily_units(start, end, conn=None):
+    """(product_id, day_offset, units) arrays of product sales between start and end"""
+    sql = '''
+        SELECT CAST(key AS INTEGER), CAST(julianday(day) - julianday(?) AS INTEGER), units
+        FROM sales_daily
+        WHERE dimension = 'product' AND day BETWEEN ? AND ? AND units > 0
+    '''
+    if conn is not None:
+        rows = conn.execute(sql, (start, start, end)).fetchall()
+    else:
+        # Every store shard has its own rollups; one row per product and day
+        _, shard_rows = store_shards.gather(sql, (start, start, end))
+        units = {}
+        for product_id, day, sold in shard_rows:
+            units[product_id, day] = units.get((product_id, day), 0) + sold
+        rows = [(product_id, day, sold) for (product_id, day), sold in units.items()]
+    data = _int_matrix(rows, 3)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def compute_forecast(ids, stock, sale_ids, sale_days, sale_units, window=WINDOW_DAYS,
+                     short_window=SHORT_WINDOW_DAYS, lead_time=LEAD_TIME_DAYS,
+                     review_period=REVIEW_PERIOD_DAYS):
+    """Per-product demand statistics from sparse daily sales; all arrays aligned with ids.
+
+    sale_days are offsets from the window start (0 .. window - 1).
+    """
+    n = len(ids)
+    if n:
+        index = np.minimum(np.searchsorted(ids, sale_ids), n - 1)
+        known = ids[index] == sale_ids  # drops sales of deleted products
+    else:
+        index = np.zeros(len(sale_ids), dtype=np.int64)
+        known = np.zeros(len(sale_ids), dtype=bool)
+    index, days, units = index[known], sale_days[known], sale_units[known].astype(np.float64)
+
+    total = np.bincount(index, weights=units, minlength=n)
+    total_sq = np.bincount(index, weights=units * units, minlength=n)
+    recent = days >= window - short_window
+    short_total = np.bincount(index[recent], weights=units[recent], minlength=n)
+
+    velocity = total / window
+    variance = np.maximum(total_sq / window - velocity ** 2, 0.0)
+    forecast = SHORT_WEIGHT * (short_total / short_window) + (1 - SHORT_WEIGHT) * velocity
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(forecast > 0, stock / forecast, np.inf)
+    safety_stock = SERVICE_Z * np.sqrt(variance) * np.sqrt(lead_time)
+    reorder_point = forecast * lead_time + safety_stock
+    target = forecast * (lead_time + review_period) + safety_stock
+    reorder_qty = np.where(stock <= reorder_point, np.ceil(np.maximum(target - stock, 0)), 0)
+    return {
+        'units_sold': total,
+        'velocity': velocity,
+        'forecast': forecast,
+        'days_of_cover': days_of_cover,
+        'reorder_point': reorder_point,
+        'reorder_qty': reorder_qty,
+    }
+
+
+def forecast_inventory(window=WINDOW_DAYS, lead_time=LEAD_TIME_DAYS, end=None):
+    """Load stock and sales in bulk and run compute_forecast over the catalog.
+
+    Returns (ids, stock, metrics) with NumPy arrays.
+    """
+    if np is None:
+        raise RuntimeError('NumPy is required for inventory analytics (pip install numpy)')
+    end = end or datetime.now(timezone.utc).date().isoformat()
+    start = (date.fromisoformat(end) - timedelta(days=window - 1)).isoformat()
+    ids, stock = load_stock()
+    sale_ids, sale_days, sale_units = load_daily_units(start, end)
+    metrics = compute_forecast(ids, stock, sale_ids, sale_days, sale_units,
+                               window=window, short_window=min(SHORT_WINDOW_DAYS, window),
+                               lead_time=lead_time)
+    return ids, stock, metrics
+
+
+def reorder_report(window=WINDOW_DAYS, lead_time=LEAD_TIME_DAYS, limit=50, only_reorder=True):
+    """JSON-ready summary plus the products with the least days of cover"""
+    ids, stock, m = forecast_inventory(window, lead_time)
+    needs_reorder = m['reorder_qty'] > 0
+    candidates = np.flatnonzero(needs_reorder) if only_reorder else np.arange(len(ids))
+    # lowest cover first; products that are not selling sort last
+    order = candidates[np.argsort(m['days_of_cover'][candidates], kind='stable')][:limit]
+
+    def number(value, digits=2):
+        return None if not np.isfinite(value) else round(float(value), digits)
+
+    return {
+        'window_days': window,
+        'lead_time_days': lead_time,
+        'summary': {
+            'products': int(len(ids)),
+            'selling': int(np.count_nonzero(m['velocity'] > 0)),
+            'needs_reorder': int(np.count_nonzero(needs_reorder)),
+            'out_of_stock': int(np.count_nonzero(stock <= 0)),
+            'units_to_order': int(m['reorder_qty'].sum())
+        },
+        'products': [{
+            'product_id': int(ids[i]),
+            'stock': int(stock[i]),
+            'units_sold': int(m['units_sold'][i]),
+            'velocity': number(m['velocity'][i], 3),
+            'forecast_daily': number(m['forecast'][i], 3),
+            'days_of_cover': number(m['days_of_cover'][i], 1),
+            'reorder_point': number(m['reorder_point'][i], 1),
+            'reorder_qty': int(m['reorder_qty'][i])
+        } for i in order]
+    }
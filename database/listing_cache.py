@@ -0,0 +1,92 @@
+"""Response cache for product listing and search queries.
+
+/api/products is requested with a small set of popular parameter
+combinations (default sort, featured, per-category views, common searches),
+and each one runs the listing, count and both facet queries. Results are
+cached under (catalog version, normalized parameters), so any product write
+or stock change - which bumps the catalog version - makes old entries
+unreachable. A cache miss is computed once even if many requests for the
+same key arrive together (single-flight).
+"""
+import os
+import threading
+from database.product_cache import LRUCache
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution"""
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class ListingCache:
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.flight = SingleFlight()
+
+    def get_or_compute(self, version, key, compute):
+        """Return the cached result for key at this catalog version, computing it once on a miss"""
+        cache_key = (version, key)
+        found, result = self.cache.get(cache_key)
+        if found:
+            return result
+
+        def load():
+            # Another request may have filled the entry while we waited
+            found, result = self.cache.get(cache_key)
+            if found:
+                return result
+            result = compute()
+            self.cache.set(cache_key, result)
+            return result
+
+        return self.flight.do(cache_key, load)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['coalesced'] = self.flight.coalesced
+        return stats
+
+
+listing_cache = ListingCache(
+    maxsize=int(os.environ.get('LISTING_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('LISTING_CACHE_TTL', '60')),
+)
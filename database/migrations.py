@@ -0,0 +1,115 @@
+"""In-place schema migrations for existing store.db, store shard and products.db files.
+
+init_db() creates new databases with the current schema; the functions here
+bring older files up to date. Every migration is idempotent and safe to run
+on each start.
+"""
+from database.db_init import get_db_connection, get_products_db_connection
+from database.product_cache import get_products
+from database.store_shards import store_shards
+
+BACKFILL_BATCH_SIZE = 500
+
+ORDER_ITEM_SNAPSHOT_COLUMNS = {
+    'product_name': 'TEXT',
+    'product_category': 'TEXT',
+    'product_brand': 'TEXT',
+    'product_image': 'TEXT',
+}
+
+USER_COLUMNS = {
+    'deleted_at': 'TIMESTAMP',
+}
+
+PRODUCT_COLUMNS = {
+    'stock_sharded': 'INTEGER DEFAULT 0',
+}
+
+
+def add_missing_columns(conn, table, columns):
+    """ALTER TABLE ... ADD COLUMN for each of {name: type} not yet present"""
+    existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    added = [name for name in columns if name not in existing]
+    for name in added:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {columns[name]}')
+    return added
+
+
+def backfill_order_item_snapshots(batch_size=BACKFILL_BATCH_SIZE):
+    """Copy product name, category, brand and image into old order_items rows.
+
+    Works through each store shard's table in id order, one short
+    transaction per batch, so checkout is never blocked for long. Rows whose
+    product no longer exists get the same "(Deleted)" placeholder order
+    reads used to show.
+    """
+    return sum(_backfill_shard(shard.connect(), batch_size) for shard in store_shards.live_shards())
+
+
+def _backfill_shard(conn, batch_size):
+    last_id = 0
+    updated = 0
+    try:
+        while True:
+            rows = conn.execute('''
+                SELECT id, product_id FROM order_items
+                WHERE product_name IS NULL AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            products = get_products({row['product_id'] for row in rows}, fresh=True)
+            snapshots = []
+            for row in rows:
+                product = products.get(row['product_id'])
+                if product:
+                    snapshot = (product['name'], product['category'], product['brand'], product['image_url'])
+                else:
+                    snapshot = (f'Product #{row["product_id"]} (Deleted)', 'Unknown', 'Unknown', '')
+                snapshots.append(snapshot + (row['id'],))
+            conn.executemany('''
+                UPDATE order_items
+                SET product_name = ?, product_category = ?, product_brand = ?, product_image = ?
+                WHERE id = ?
+            ''', snapshots)
+            conn.commit()
+            updated += len(rows)
+            last_id = rows[-1]['id']
+    finally:
+        conn.close()
+    return updated
+
+
+def run_migrations():
+    conn = get_db_connection()
+    try:
+        added = add_missing_columns(conn, 'users', USER_COLUMNS)
+        conn.commit()
+    finally:
+        conn.close()
+    for shard in store_shards.live_shards():
+        conn = shard.connect()
+        try:
+            added += add_missing_columns(conn, 'order_items', ORDER_ITEM_SNAPSHOT_COLUMNS)
+            conn.commit()
+        finally:
+            conn.close()
+    if added:
+        print(f"Added store columns: {', '.join(added)}")
+
+    products_conn = get_products_db_connection(readonly=False)
+    try:
+        added = add_missing_columns(products_conn, 'products', PRODUCT_COLUMNS)
+        products_conn.commit()
+    finally:
+        products_conn.close()
+    if added:
+        print(f"Added products columns: {', '.join(added)}")
+
+    backfilled = backfill_order_item_snapshots()
+    if backfilled:
+        print(f"Backfilled product snapshots for {backfilled} order items")
+
+
+if __name__ == '__main__':
+    run_migrations()
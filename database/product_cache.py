@@ -0,0 +1,175 @@
+"""Bounded in-process read-through cache for product rows.
+
+Product rows are read far more often than they change, and the cart,
+wishlist and order resources each look them up one by one. This module keeps
+recently used rows in memory (LRU with a size limit and TTL) and is
+invalidated explicitly by every write path that touches products.db.
+
+Checkout must validate stock against the database, so it uses
+get_products(..., fresh=True) which always reads from disk. Writes made by
+other worker processes arrive through the catalog invalidation bus.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from database.db_init import get_products_db_connection
+from database.invalidation import catalog_bus
+from database.stock_shards import apply_sharded_stock
+
+
+class LRUCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss/eviction stats"""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a read-through load that raced a
+        # write can detect it and skip populating the cache with stale data
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value, generation=None):
+        """Store a value; ignored if the cache was invalidated since `generation`"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+product_cache = LRUCache(
+    maxsize=int(os.environ.get('PRODUCT_CACHE_SIZE', '2048')),
+    ttl=float(os.environ.get('PRODUCT_CACHE_TTL', '300')),
+)
+
+
+def _on_catalog_change(product_ids):
+    if product_ids is None:
+        product_cache.clear()
+    else:
+        product_cache.invalidate(product_ids)
+
+
+catalog_bus.subscribe(_on_catalog_change)
+
+
+def _load_products(product_ids, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_products_db_connection()
+    products = {}
+    try:
+        # Chunked to stay well below SQLite's bound-parameter limit
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT * FROM products WHERE id IN ({placeholders})', chunk
+            ).fetchall()
+            for row in rows:
+                products[row['id']] = dict(row)
+    finally:
+        if own_conn:
+            conn.close()
+    return products
+
+
+def get_products(product_ids, conn=None, fresh=False):
+    """Get many products at once as {id: product_dict}.
+
+    Missing products are simply absent from the result. Cached rows are
+    served from memory and all misses are fetched with a single query.
+    With fresh=True the cache is bypassed entirely (authoritative reads).
+    Sharded (hot) products always carry their live stock total.
+    """
+    ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+    if not ids:
+        return {}
+    if fresh:
+        result = _load_products(ids, conn)
+        apply_sharded_stock(result.values())
+        return result
+
+    catalog_bus.sync()
+    result = {}
+    missing = []
+    for pid in ids:
+        found, product = product_cache.get(pid)
+        if found:
+            result[pid] = dict(product)
+        else:
+            missing.append(pid)
+
+    if missing:
+        generation = product_cache.generation
+        loaded = _load_products(missing, conn)
+        for pid, product in loaded.items():
+            product_cache.set(pid, product, generation)
+            result[pid] = dict(product)
+    apply_sharded_stock(result.values())
+    return result
+
+
+def get_product(product_id, conn=None, fresh=False):
+    """Get a single product dict, or None if it does not exist"""
+    return get_products([product_id], conn, fresh).get(int(product_id))
+
+
+def invalidate_products(product_ids):
+    """Drop products from the cache; call after committing a product write"""
+    product_cache.invalidate([int(pid) for pid in product_ids])
@@ -0,0 +1,250 @@
+"""Incrementally maintained counters for the admin dashboard.
+
+Each database keeps a small stats_counters table (name -> value). Triggers on
+products, orders and users adjust the affected counters in the same
+transaction as every insert, update and delete, whichever code path makes the
+write, so reading the dashboard is a handful of primary-key lookups. Order
+counters live in each store shard next to its orders and are summed.
+
+reconcile_stats() recomputes every counter from the base tables and corrects
+any drift (e.g. rows changed with triggers disabled, or float rounding in the
+revenue total). StatsReconciler runs it periodically in the background.
+Users soft-deleted by a deletion job (deleted_at set) no longer count.
+"""
+import time
+from database.db_init import get_db_connection, get_products_db_connection
+from database.stock_shards import settle_pending_takes, sync_catalog_stock
+from database.store_shards import store_shards
+from utils.background import PeriodicWorker
+
+LOW_STOCK_THRESHOLD = 10
+
+# counter name SQL -> value SQL, evaluated against the NEW / OLD row
+PRODUCT_COUNTERS = [
+    ("'products_total'", '1'),
+    ("'products_featured'", '{row}.featured != 0'),
+    ("'products_low_stock'", f'{{row}}.stock > 0 AND {{row}}.stock < {LOW_STOCK_THRESHOLD}'),
+    ("'products_out_of_stock'", '{row}.stock <= 0'),
+]
+ORDER_COUNTERS = [
+    ("'orders_total'", '1'),
+    ("'orders_status:' || {row}.status", '1'),
+    ("'revenue_total'", "CASE WHEN {row}.status != 'cancelled' THEN {row}.total_amount ELSE 0 END"),
+]
+USER_COUNTERS = [
+    ("'users_total'", '{row}.deleted_at IS NULL'),
+    ("'users_admin'", '{row}.is_admin != 0 AND {row}.deleted_at IS NULL'),
+]
+
+# The same counters computed from scratch, as (name, value) rows
+PRODUCT_RECOUNT = f'''
+    SELECT 'products_total', COUNT(*) FROM products
+    UNION ALL SELECT 'products_featured', COUNT(*) FROM products WHERE featured != 0
+    UNION ALL SELECT 'products_low_stock', COUNT(*) FROM products
+        WHERE stock > 0 AND stock < {LOW_STOCK_THRESHOLD}
+    UNION ALL SELECT 'products_out_of_stock', COUNT(*) FROM products WHERE stock <= 0
+'''
+ORDER_RECOUNT = '''
+    SELECT 'orders_total', COUNT(*) FROM orders
+    UNION ALL SELECT 'orders_status:' || status, COUNT(*) FROM orders GROUP BY status
+    UNION ALL SELECT 'revenue_total', COALESCE(SUM(total_amount), 0) FROM orders WHERE status != 'cancelled'
+'''
+USER_RECOUNT = '''
+    SELECT 'users_total', COUNT(*) FROM users WHERE deleted_at IS NULL
+    UNION ALL SELECT 'users_admin', COUNT(*) FROM users WHERE is_admin != 0 AND deleted_at IS NULL
+'''
+# Counter names each recount owns (store.db holds both kinds before sharding)
+PRODUCT_PREFIXES = ('products_',)
+ORDER_PREFIXES = ('orders_', 'revenue_')
+USER_PREFIXES = ('users_',)
+
+
+def _adjust(name_sql, value_sql, row, sign):
+    value = value_sql.format(row=row)
+    return (f"INSERT INTO stats_counters (name, value) VALUES ({name_sql.format(row=row)}, {sign}({value})) "
+            f"ON CONFLICT(name) DO UPDATE SET value = value {sign} ({value});")
+
+
+def _create_counter_triggers(conn, table, counters, update_columns):
+    statements = {
+        'insert': [_adjust(n, v, 'NEW', '+') for n, v in counters],
+        'delete': [_adjust(n, v, 'OLD', '-') for n, v in counters],
+        'update': [_adjust(n, v, 'OLD', '-') for n, v in counters]
+                  + [_adjust(n, v, 'NEW', '+') for n, v in counters],
+    }
+    for event, body in statements.items():
+        # Updates only matter when a column the counters depend on changes
+        when = f"UPDATE OF {', '.join(update_columns)}" if event == 'update' else event.upper()
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_{event} AFTER {when} ON {table}
+            BEGIN
+                {' '.join(body)}
+            END
+        ''')
+
+
+def _ensure_counter_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def ensure_product_stats(conn):
+    """Create the counter table and triggers in products.db (idempotent)"""
+    _ensure_counter_table(conn)
+    _create_counter_triggers(conn, 'products', PRODUCT_COUNTERS, ('stock', 'featured'))
+
+
+def ensure_store_stats(conn):
+    """Create the counter table and user triggers in store.db (idempotent)"""
+    _ensure_counter_table(conn)
+    # Older triggers counted deleted users too: replace them and recount
+    outdated = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'users_stats_update' "
+        "AND sql NOT LIKE '%deleted_at%'"
+    ).fetchone()
+    if outdated:
+        for event in ('insert', 'delete', 'update'):
+            conn.execute(f'DROP TRIGGER IF EXISTS users_stats_{event}')
+    _create_counter_triggers(conn, 'users', USER_COUNTERS, ('is_admin', 'deleted_at'))
+    if outdated:
+        conn.execute(f"DELETE FROM stats_counters WHERE name IN ({', '.join(name for name, _ in USER_COUNTERS)})")
+        conn.execute(f'INSERT INTO stats_counters (name, value) {USER_RECOUNT}')
+
+
+def ensure_order_stats(conn):
+    """Create the counter table and order triggers in a store shard (idempotent)"""
+    _ensure_counter_table(conn)
+    _create_counter_triggers(conn, 'orders', ORDER_COUNTERS, ('status', 'total_amount'))
+
+
+def _reconcile(conn, recount_sql, prefixes):
+    """Replace the counters named with `prefixes` by freshly computed values; returns the drift"""
+    conn.execute('BEGIN IMMEDIATE')  # no trigger may run between count and write
+    try:
+        actual = {name: value for name, value in conn.execute(recount_sql)}
+        stored = {row['name']: row['value'] for row in conn.execute('SELECT name, value FROM stats_counters')
+                  if row['name'].startswith(prefixes)}
+        drift = {name: actual.get(name, 0) - stored.get(name, 0)
+                 for name in set(actual) | set(stored)
+                 if abs(actual.get(name, 0) - stored.get(name, 0)) > 1e-6}
+        if drift:
+            conn.executemany('DELETE FROM stats_counters WHERE name = ?', [(name,) for name in stored])
+            conn.executemany('INSERT INTO stats_counters (name, value) VALUES (?, ?)', actual.items())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return drift
+
+
+def reconcile_stats():
+    """Recompute all counters from the base tables; returns {name: correction}"""
+    # Sharded products keep live stock outside products.db; fold it in first,
+    # after returning units held by checkouts that never finished
+    products_conn = get_products_db_connection(readonly=False)
+    try:
+        settle_pending_takes(products_conn)
+        sync_catalog_stock(products_conn)
+        products_conn.commit()
+    finally:
+        products_conn.close()
+
+    drift = {}
+    recounts = [(get_db_connection, USER_RECOUNT, USER_PREFIXES),
+                (lambda: get_products_db_connection(readonly=False), PRODUCT_RECOUNT, PRODUCT_PREFIXES)]
+    recounts += [(shard.connect, ORDER_RECOUNT, ORDER_PREFIXES) for shard in store_shards.live_shards()]
+    for connect, recount_sql, prefixes in recounts:
+        conn = connect()
+        conn.isolation_level = None  # explicit BEGIN/COMMIT
+        try:
+            for name, correction in _reconcile(conn, recount_sql, prefixes).items():
+                drift[name] = drift.get(name, 0) + correction
+        finally:
+            conn.close()
+    return drift
+
+
+def _read_counters(conn):
+    return {row['name']: row['value'] for row in conn.execute('SELECT name, value FROM stats_counters')}
+
+
+def get_dashboard_stats():
+    """Dashboard numbers straight from the counter tables"""
+    conn = get_db_connection()
+    try:
+        store = {name: value for name, value in _read_counters(conn).items() if name.startswith(USER_PREFIXES)}
+    finally:
+        conn.close()
+    for shard in store_shards.live_shards():
+        conn = shard.connect()
+        try:
+            for name, value in _read_counters(conn).items():
+                if name.startswith(ORDER_PREFIXES):
+                    store[name] = store.get(name, 0) + value
+        finally:
+            conn.close()
+    products_conn = get_products_db_connection()
+    try:
+        products = _read_counters(products_conn)
+    finally:
+        products_conn.close()
+
+    total_products = int(products.get('products_total', 0))
+    out_of_stock = int(products.get('products_out_of_stock', 0))
+    total_users = int(store.get('users_total', 0))
+    admins = int(store.get('users_admin', 0))
+    generation = store_shards.active_generation()
+    return {
+        'products': {
+            'total': total_products,
+            'featured': int(products.get('products_featured', 0)),
+            'in_stock': total_products - out_of_stock,
+            'low_stock': int(products.get('products_low_stock', 0)),
+            'out_of_stock': out_of_stock,
+            'low_stock_threshold': LOW_STOCK_THRESHOLD
+        },
+        'orders': {
+            'total': int(store.get('orders_total', 0)),
+            'by_status': {name.split(':', 1)[1]: int(value) for name, value in store.items()
+                          if name.startswith('orders_status:') and value},
+            'revenue': round(store.get('revenue_total', 0), 2)
+        },
+        'users': {
+            'total': total_users,
+            'admins': admins,
+            'regular': total_users - admins
+        },
+        'store_shards': {
+            'generation': generation,
+            'shards': len(store_shards.shards(generation))
+        },
+        'reconciled_at': stats_reconciler.last_run
+    }
+
+
+class StatsReconciler(PeriodicWorker):
+    """Calls reconcile_stats() every `interval` seconds"""
+    name = 'stats-reconciler'
+
+    def __init__(self):
+        super().__init__()
+        self.last_run = None
+        self.last_drift = {}
+
+    def run_once(self):
+        self.last_drift = reconcile_stats()
+        self.last_run = time.strftime('%Y-%m-%d %H:%M:%S')
+        if self.last_drift:
+            print(f"Stats reconciliation corrected drift: {self.last_drift}")
+        return self.last_drift
+
+
+stats_reconciler = StatsReconciler()
+
+
+if __name__ == '__main__':
+    print(f"Corrections: {stats_reconciler.run_once() or 'none'}")
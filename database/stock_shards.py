@@ -0,0 +1,427 @@
+"""Sharded stock counters for hot products (flash sales).
+
+Every checkout normally decrements products.stock, so concurrent orders for
+the same few products queue behind products.db's single writer. A product
+flagged with stock_sharded = 1 instead keeps its stock split across
+STOCK_SHARDS small SQLite files (stock_shards/shard_<n>.db). Each file has
+its own write lock, so checkouts that land on different shards do not wait
+for each other or for products.db.
+
+    take(product_id, qty, order_id)
+                            conditional decrement on one shard, falling back
+                            to the others and finally to splitting the
+                            quantity across several shards
+    settle(order_id, takes) the order committed, the units are sold
+    give_back(...)          the order did not commit, the units return
+    restore(product_id, qty)
+    totals(product_ids)     live stock = sum over the shards
+
+A take commits on its shard before the order commits on the store, so each
+take also writes a pending_takes row in the same shard transaction. The
+checkout settles or gives back its takes when it finishes. If it died in
+between, settle_pending_takes() (run by the stats reconciler) finds the
+takes older than STOCK_TAKE_GRACE seconds. It drops them if their order
+exists and returns their units if it does not.
+
+Product reads (database/product_cache.get_products) and listings overlay
+these totals onto products.stock, which for sharded products is only
+brought up to date by sync_catalog_stock() (run by the stats reconciler)
+and when sharding is turned off again.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+from database.db_init import get_products_db_connection, register_post_fork
+from database.catalog import NOW_MS
+from database.store_shards import store_shards
+
+STOCK_SHARDS = int(os.environ.get('STOCK_SHARDS', 8))
+STOCK_SHARD_DIR = os.environ.get('STOCK_SHARD_DIR', 'stock_shards')
+# A checkout cannot outlive the request timeout; older pending takes are orphans
+STOCK_TAKE_GRACE = max(int(os.environ.get('STOCK_TAKE_GRACE', 2 * Config.REQUEST_TIMEOUT)),
+                       Config.REQUEST_TIMEOUT + 1)
+
+
+@contextmanager
+def _immediate(conn):
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit shard connection, rolled back on error"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+class ShardedStock:
+    def __init__(self, shards=STOCK_SHARDS, directory=STOCK_SHARD_DIR):
+        self.shards = shards
+        self.directory = directory
+        self._local = threading.local()
+
+    def _connections(self):
+        """One autocommit connection per shard, per thread (and per process)"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.pid = os.getpid()
+            local.conns = None
+        if local.conns is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conns = []
+            for index in range(self.shards):
+                conn = sqlite3.connect(os.path.join(self.directory, f'shard_{index}.db'),
+                                       timeout=5, isolation_level=None, check_same_thread=False)
+                conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute('PRAGMA synchronous = NORMAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS stock (
+                        product_id INTEGER PRIMARY KEY,
+                        stock INTEGER NOT NULL CHECK (stock >= 0)
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS pending_takes (
+                        order_id INTEGER NOT NULL,
+                        product_id INTEGER NOT NULL,
+                        units INTEGER NOT NULL,
+                        taken_at REAL NOT NULL,
+                        PRIMARY KEY (order_id, product_id)
+                    )
+                ''')
+                conns.append(conn)
+            local.conns = conns
+        return local.conns
+
+    def reset(self):
+        """Forget this thread's connections (after fork they belong to the parent)"""
+        self._local = threading.local()
+
+    def _rotation(self):
+        start = random.randrange(self.shards)
+        return [(start + i) % self.shards for i in range(self.shards)]
+
+    def distribute(self, product_id, total):
+        """Overwrite a product's shards with `total` units spread evenly"""
+        share, extra = divmod(max(int(total), 0), self.shards)
+        for index, conn in enumerate(self._connections()):
+            conn.execute('INSERT OR REPLACE INTO stock (product_id, stock) VALUES (?, ?)',
+                         (product_id, share + (1 if index < extra else 0)))
+
+    def remove(self, product_id):
+        """Delete a product's shards and return the units they held"""
+        total = 0
+        for conn in self._connections():
+            with _immediate(conn):
+                row = conn.execute('SELECT stock FROM stock WHERE product_id = ?', (product_id,)).fetchone()
+                conn.execute('DELETE FROM stock WHERE product_id = ?', (product_id,))
+            total += row[0] if row else 0
+        return total
+
+    @contextmanager
+    def withdrawn(self, product_id):
+        """Lock every shard and yield the units a product holds; its rows are deleted on exit.
+
+        Checkouts wait on the locks until the block ends, so none of them sees
+        some shards emptied and others not. If the block raises, nothing is
+        deleted.
+        """
+        conns = self._connections()
+        locked = []
+        try:
+            total = 0
+            for conn in conns:
+                conn.execute('BEGIN IMMEDIATE')
+                locked.append(conn)
+                row = conn.execute('SELECT stock FROM stock WHERE product_id = ?', (product_id,)).fetchone()
+                conn.execute('DELETE FROM stock WHERE product_id = ?', (product_id,))
+                total += row[0] if row else 0
+            yield total
+        except BaseException:
+            for conn in locked:
+                conn.execute('ROLLBACK')
+            raise
+        for conn in locked:
+            conn.execute('COMMIT')
+
+    def take(self, product_id, quantity, order_id):
+        """Decrement `quantity` units for an order; returns [(shard, units)] taken, or None if short.
+
+        Tries a single shard first (starting at a random one so concurrent
+        checkouts spread out), then gathers the quantity from several shards.
+        Each decrement is logged in that shard's pending_takes until the order
+        settles or gives it back. A partial gather is put back before
+        returning None.
+        """
+        conns = self._connections()
+        rotation = self._rotation()
+        for index in rotation:
+            with _immediate(conns[index]) as conn:
+                cursor = conn.execute(
+                    'UPDATE stock SET stock = stock - ? WHERE product_id = ? AND stock >= ?',
+                    (quantity, product_id, quantity)
+                )
+                if cursor.rowcount:
+                    self._log_take(conn, order_id, product_id, quantity)
+            if cursor.rowcount:
+                return [(index, quantity)]
+
+        taken, remaining = [], quantity
+        for index in rotation:
+            with _immediate(conns[index]) as conn:
+                row = conn.execute('SELECT stock FROM stock WHERE product_id = ?', (product_id,)).fetchone()
+                units = min(row[0] if row else 0, remaining)
+                if units:
+                    conn.execute('UPDATE stock SET stock = stock - ? WHERE product_id = ?', (units, product_id))
+                    self._log_take(conn, order_id, product_id, units)
+                    taken.append((index, units))
+                    remaining -= units
+            if not remaining:
+                return taken
+        self.give_back(product_id, taken, order_id)
+        return None
+
+    @staticmethod
+    def _log_take(conn, order_id, product_id, units):
+        conn.execute(
+            'INSERT INTO pending_takes (order_id, product_id, units, taken_at) VALUES (?, ?, ?, ?)',
+            (order_id, product_id, units, time.time())
+        )
+
+    def give_back(self, product_id, taken, order_id):
+        """Undo a take() using the [(shard, units)] it returned.
+
+        Units of a product whose shards are gone (sharding was turned off
+        meanwhile) stay logged as pending; settle_pending_takes() returns them
+        to products.stock.
+        """
+        conns = self._connections()
+        for index, units in taken:
+            with _immediate(conns[index]) as conn:
+                cursor = conn.execute('UPDATE stock SET stock = stock + ? WHERE product_id = ?', (units, product_id))
+                if cursor.rowcount:
+                    conn.execute('DELETE FROM pending_takes WHERE order_id = ? AND product_id = ?',
+                                 (order_id, product_id))
+
+    def settle(self, order_id, taken):
+        """Clear the pending log for takes whose order has committed"""
+        conns = self._connections()
+        for index in sorted({index for index, units in taken}):
+            conns[index].execute('DELETE FROM pending_takes WHERE order_id = ?', (order_id,))
+
+    def pending(self, before):
+        """[(shard, order_id, product_id, units)] for takes logged before the `before` timestamp"""
+        return [(index, *row) for index, conn in enumerate(self._connections())
+                for row in conn.execute('SELECT order_id, product_id, units FROM pending_takes WHERE taken_at < ?',
+                                        (before,))]
+
+    def resolve(self, index, order_id, product_id, give_back):
+        """Drop one pending take, first returning its units to the shard if `give_back`.
+
+        Returns the units that could not go back because the product has no
+        shard row any more.
+        """
+        with _immediate(self._connections()[index]) as conn:
+            row = conn.execute('SELECT units FROM pending_takes WHERE order_id = ? AND product_id = ?',
+                               (order_id, product_id)).fetchone()
+            if not row:
+                return 0
+            conn.execute('DELETE FROM pending_takes WHERE order_id = ? AND product_id = ?', (order_id, product_id))
+            if give_back:
+                cursor = conn.execute('UPDATE stock SET stock = stock + ? WHERE product_id = ?', (row[0], product_id))
+                if not cursor.rowcount:
+                    return row[0]
+        return 0
+
+    def restore(self, product_id, quantity):
+        """Return units to a sharded product; False if the product has no shards"""
+        index = random.randrange(self.shards)
+        cursor = self._connections()[index].execute(
+            'UPDATE stock SET stock = stock + ? WHERE product_id = ?', (quantity, product_id)
+        )
+        return cursor.rowcount > 0
+
+    def totals(self, product_ids=None):
+        """{product_id: live stock} summed over the shards; all sharded products if ids is None"""
+        totals = {}
+        ids = None if product_ids is None else [int(pid) for pid in product_ids]
+        if ids is not None and not ids:
+            return totals
+        for conn in self._connections():
+            if ids is None:
+                rows = conn.execute('SELECT product_id, stock FROM stock')
+            else:
+                placeholders = ','.join('?' * len(ids))
+                rows = conn.execute(f'SELECT product_id, stock FROM stock WHERE product_id IN ({placeholders})', ids)
+            for product_id, stock in rows:
+                totals[product_id] = totals.get(product_id, 0) + stock
+        return totals
+
+
+sharded_stock = ShardedStock()
+register_post_fork(sharded_stock.reset)
+
+
+def apply_sharded_stock(products):
+    """Replace `stock` with the live shard total on sharded product dicts (in place)"""
+    sharded = [product for product in products if product.get('stock_sharded')]
+    if sharded:
+        totals = sharded_stock.totals(product['id'] for product in sharded)
+        for product in sharded:
+            product['stock'] = totals.get(product['id'], 0)
+    return products
+
+
+_sharded_at_version = (None, False)  # (catalog version, any product sharded)
+
+
+def catalog_has_sharded_stock(version):
+    """True if any product keeps its stock in the shards at catalog `version`.
+
+    Turning sharding on or off bumps the catalog version, so the answer is
+    remembered per version and costs one query per catalog write.
+    """
+    global _sharded_at_version
+    if _sharded_at_version[0] == version:
+        return _sharded_at_version[1]
+    conn = get_products_db_connection()
+    try:
+        # One statement, so the version and the flag come from the same snapshot
+        current, sharded = conn.execute('''
+            SELECT (SELECT version FROM catalog_meta WHERE id = 1),
+                   EXISTS (SELECT 1 FROM products WHERE stock_sharded = 1)
+        ''').fetchone()
+    finally:
+        conn.close()
+    _sharded_at_version = (current, bool(sharded))
+    # Written since `version` was read: the flag may not apply to it
+    return bool(sharded) if current == version else True
+
+
+def _take_catalog_stock(products_conn, product_id, quantity):
+    cursor = products_conn.execute(
+        f'UPDATE products SET stock = stock - ?, updated_at = {NOW_MS} WHERE id = ? AND stock_sharded = 0',
+        (quantity, product_id)
+    )
+    return cursor.rowcount > 0
+
+
+def take_stock(products_conn, product_id, quantity, sharded, order_id):
+    """Decrement stock for `order_id` wherever the product's stock lives.
+
+    Returns the shard takes for a sharded product, [] when products.stock was
+    decremented (inside the caller's transaction), or None when a sharded
+    product ran out. A product that became sharded since it was read is
+    caught by the stock_sharded = 0 guard and handled through the shards; one
+    whose shards were folded back meanwhile falls back to products.stock.
+    """
+    if not sharded and _take_catalog_stock(products_conn, product_id, quantity):
+        return []
+    taken = sharded_stock.take(product_id, quantity, order_id)
+    if taken is None:
+        # Read first: the write lock is only wanted if sharding was turned off
+        row = products_conn.execute('SELECT stock_sharded FROM products WHERE id = ?', (product_id,)).fetchone()
+        if row and not row[0] and _take_catalog_stock(products_conn, product_id, quantity):
+            return []
+    return taken
+
+
+def restore_stock(products_conn, product_id, quantity, sharded):
+    """Put cancelled units back; True if products.db was written (bump + invalidate)"""
+    if sharded and sharded_stock.restore(product_id, quantity):
+        return False
+    products_conn.execute(
+        f'UPDATE products SET stock = stock + ?, updated_at = {NOW_MS} WHERE id = ?',
+        (quantity, product_id)
+    )
+    return True
+
+
+def enable_sharding(products_conn, product_id):
+    """Move a product's stock into the shards, inside the caller's products.db transaction"""
+    # Flag first: the write lock keeps checkouts off products.stock until commit
+    cursor = products_conn.execute(
+        'UPDATE products SET stock_sharded = 1 WHERE id = ? AND stock_sharded = 0', (product_id,)
+    )
+    if not cursor.rowcount:
+        return
+    stock = products_conn.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+    sharded_stock.distribute(product_id, stock)
+
+
+def disable_sharding(products_conn, product_id):
+    """Fold the shards back into products.stock and commit the caller's transaction.
+
+    products.db's write lock is taken first, then every shard's. products.db
+    commits while the shards are still locked, so a checkout waiting on a
+    shard finds the rows gone only after the stock is back in products.stock
+    (take_stock falls back to it), instead of failing on a half-folded
+    product.
+    """
+    if not products_conn.in_transaction:
+        products_conn.execute('BEGIN IMMEDIATE')
+    row = products_conn.execute('SELECT stock_sharded FROM products WHERE id = ?', (product_id,)).fetchone()
+    if not row or not row['stock_sharded']:
+        products_conn.commit()
+        return
+    with sharded_stock.withdrawn(product_id) as total:
+        products_conn.execute('UPDATE products SET stock = ?, stock_sharded = 0 WHERE id = ?', (total, product_id))
+        products_conn.commit()
+
+
+def settle_pending_takes(products_conn):
+    """Resolve shard takes left pending by checkouts that died; returns the units given back.
+
+    A take older than STOCK_TAKE_GRACE whose order exists was sold and is
+    dropped from the log. One without an order goes back to its shard, or to
+    products.stock (inside the caller's transaction) if the product is no
+    longer sharded.
+    """
+    stale = sharded_stock.pending(time.time() - STOCK_TAKE_GRACE)
+    if not stale:
+        return 0
+    order_ids = sorted({order_id for _, order_id, _, _ in stale})
+    placed = set()
+    for start in range(0, len(order_ids), 500):
+        batch = order_ids[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        _, rows = store_shards.gather(f'SELECT o.id FROM orders o WHERE o.id IN ({placeholders})', batch)
+        placed.update(row[0] for row in rows)
+
+    returned = 0
+    for index, order_id, product_id, units in stale:
+        unsharded = sharded_stock.resolve(index, order_id, product_id, give_back=order_id not in placed)
+        if unsharded:
+            products_conn.execute(
+                f'UPDATE products SET stock = stock + ?, updated_at = {NOW_MS} WHERE id = ?',
+                (unsharded, product_id)
+            )
+        if order_id not in placed:
+            returned += units
+    return returned
+
+
+def sync_catalog_stock(products_conn):
+    """Copy live shard totals into products.stock; returns the product ids changed.
+
+    Keeps aggregate consumers that read products.stock directly (dashboard
+    counters, inventory forecasts) close to reality. Runs in the caller's
+    transaction; one products.db write per sync instead of per checkout.
+    """
+    sharded = [row['id'] for row in products_conn.execute('SELECT id FROM products WHERE stock_sharded = 1')]
+    if not sharded:
+        return []
+    totals = sharded_stock.totals(sharded)
+    changed = []
+    for product_id in sharded:
+        cursor = products_conn.execute(
+            'UPDATE products SET stock = ? WHERE id = ? AND stock != ?',
+            (totals.get(product_id, 0), product_id, totals.get(product_id, 0))
+        )
+        if cursor.rowcount:
+            changed.append(product_id)
+    return changed
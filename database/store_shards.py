@@ -0,0 +1,518 @@
+"""User-sharded store database.
+
+store.db has one write lock, so every cart change, checkout and
+notification in the shop waits for every other. The tables that belong to
+one user live instead in one of several SQLite files, chosen by a hash of
+the user id:
+
+    cart, wishlist, orders + order_items,    the user's shard
+    reviews, notifications, wishlist_alerts
+    sales_daily, stats_counters (orders)     every shard, for its own orders
+    users, deletion_jobs, idempotency_keys,  store.db
+    store_layout
+
+Writes of users on different shards commit in parallel. Everything a user
+does touches one file (get_user_db_connection); shop-wide reads (admin
+order and review lists, a product's reviews, sales rollups) go through
+gather(), which runs a query on every shard and merges the rows, and
+lookups by id through locate(). Shards attach store.db read-only as
+`accounts`, so their queries can still join users.
+
+The layout is a sequence of generations in store.db's store_layout table.
+Generation 0 is store.db itself as the only shard, so a store that was
+never resharded works exactly as before; generation g > 0 keeps its files
+at STORE_SHARD_DIR/g<g>_<i>.db. Ids stay unique across files: the
+AUTOINCREMENT sequences of shard i of generation g start at
+(g * MAX_STORE_SHARDS + i) * SHARD_ID_SPACE (0 for store.db), and moved
+rows keep their ids.
+
+Resharding runs while the shop is up:
+
+    python -m database.store_shards reshard --shards 8
+    python -m database.store_shards status
+    python -m database.store_shards cleanup
+
+reshard creates the next generation in state 'filling' and moves the users
+of each shard of the active generation over in batches of
+RESHARD_BATCH_USERS. A batch holds the source shard's write lock, copies
+the users' rows into the new shards and commits there, then records the
+users in the source's moved_users and deletes their rows. Connections
+opened on the old shard for a moved user follow that marker. Writes open
+theirs with write=True, which takes the shard's write lock before reading
+the marker, so no move can come between routing and commit; an UPDATE or
+DELETE would otherwise match nothing on the old shard and report success.
+Triggers also reject inserts, updates and deletes of moved users' rows
+(the request fails and can be retried). A last pass moves the rest under the lock and seals the
+shard (marker for user -1); then the new generation becomes active and the
+old one retired. Sales rollups and order counters move with the orders.
+An interrupted reshard picks up where it stopped when run again; until
+then, and while a batch is in flight, admin lists may show its users' rows
+twice. cleanup deletes the files of retired generations.
+"""
+import argparse
+import heapq
+import itertools
+import operator
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+from database.db_init import STORE_DB, get_db_connection, ensure_user_schema
+
+# Shards of a store still in store.db alone; init_db reshards it on start
+STORE_SHARDS = int(os.environ.get('STORE_SHARDS', 1))
+STORE_SHARD_DIR = os.environ.get('STORE_SHARD_DIR', 'store_shards')
+MAX_STORE_SHARDS = 256
+SHARD_ID_SPACE = 2 ** 32  # ids per shard; generations stay below 2 ** 53 (safe in JavaScript)
+LAYOUT_TTL = 1.0  # seconds a process trusts its cached layout
+RESHARD_BATCH_USERS = 100
+RESHARD_BATCH_PAUSE = 0.01  # seconds between batches, lets other writers in
+SEALED = -1  # moved_users.user_id marking a whole shard as moved
+
+# Tables moved with their user; order_items follow their orders
+USER_TABLES = ('cart', 'wishlist', 'reviews', 'notifications', 'wishlist_alerts', 'orders')
+SEQUENCE_TABLES = ('cart', 'wishlist', 'orders', 'order_items', 'reviews', 'notifications')
+
+Generation = namedtuple('Generation', 'generation shards state')
+
+
+def shard_index(user_id, shards):
+    return zlib.crc32(str(int(user_id)).encode()) % shards
+
+
+class Shard(namedtuple('Shard', 'generation index')):
+    @property
+    def path(self):
+        if self.generation == 0:
+            return STORE_DB
+        return os.path.join(STORE_SHARD_DIR, f'g{self.generation}_{self.index}.db')
+
+    @property
+    def id_base(self):
+        return (self.generation * MAX_STORE_SHARDS + self.index) * SHARD_ID_SPACE
+
+    def connect(self):
+        """Connection with sqlite3.Row rows; users is reachable from every shard"""
+        if self.generation == 0:
+            return get_db_connection()
+        # mode=rw: a removed generation is an error, not a new empty file
+        conn = sqlite3.connect(f'file:{self.path}?mode=rw', uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute('ATTACH DATABASE ? AS accounts', (f'file:{STORE_DB}?mode=ro',))
+        return conn
+
+
+def ensure_store_layout(conn):
+    """Create store_layout in store.db, starting at generation 0 (idempotent)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS store_layout (
+            generation INTEGER PRIMARY KEY,
+            shards INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO store_layout (generation, shards, state)
+        SELECT 0, 1, 'active' WHERE NOT EXISTS (SELECT 1 FROM store_layout)
+    ''')
+
+
+def ensure_shard_guard(conn):
+    """moved_users and the triggers that keep moved users' rows from coming back (idempotent)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS moved_users (
+            user_id INTEGER PRIMARY KEY,
+            generation INTEGER NOT NULL
+        )
+    ''')
+    # Row triggers only see rows still here; a write that matches nothing
+    # after a move is caught by write=True connections instead. The move
+    # deletes its rows before it writes the markers, so the delete trigger
+    # does not stop it.
+    for table in USER_TABLES:
+        for event, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_moved_{event} BEFORE {event.upper()} ON {table}
+                WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id IN ({row}.user_id, {SEALED}))
+                BEGIN
+                    SELECT RAISE(ABORT, 'user moved to another store shard');
+                END
+            ''')
+
+
+class StoreShards:
+    def __init__(self):
+        self._generations = None
+        self._loaded_at = 0.0
+
+    def generations(self, refresh=False):
+        """{generation: Generation} from store_layout, cached for LAYOUT_TTL seconds"""
+        if refresh or self._generations is None or time.monotonic() - self._loaded_at > LAYOUT_TTL:
+            conn = get_db_connection()
+            try:
+                rows = conn.execute('SELECT generation, shards, state FROM store_layout').fetchall()
+            except sqlite3.OperationalError as e:
+                if 'no such table' not in str(e):
+                    raise
+                rows = []  # store.db from before sharding
+            finally:
+                conn.close()
+            self._generations = {row[0]: Generation(*row) for row in rows} or {0: Generation(0, 1, 'active')}
+            self._loaded_at = time.monotonic()
+        return self._generations
+
+    def active_generation(self):
+        return max(g.generation for g in self.generations().values() if g.state == 'active')
+
+    def shards(self, generation):
+        generations = self.generations()
+        if generation not in generations:
+            generations = self.generations(refresh=True)
+        return [Shard(generation, index) for index in range(generations[generation].shards)]
+
+    def live_shards(self):
+        """Shards of the active generation and of one being filled by a reshard"""
+        return [Shard(g.generation, index) for g in sorted(self.generations().values())
+                if g.state in ('active', 'filling') for index in range(g.shards)]
+
+    def shard_for(self, user_id, generation=None):
+        if generation is None:
+            generation = self.active_generation()
+        shards = self.shards(generation)
+        return shards[shard_index(user_id, len(shards))]
+
+    def connect(self, user_id, write=False):
+        """Connection to the shard holding user_id's rows, following reshard moves.
+
+        write=True returns it inside BEGIN IMMEDIATE, checked under that
+        lock, so the user cannot move away before the caller's commit().
+        """
+        generation = self.active_generation()
+        for _ in range(len(self.generations()) + 1):
+            conn = self.shard_for(user_id, generation).connect()
+            try:
+                if write:
+                    conn.execute('BEGIN IMMEDIATE')
+                moved = conn.execute('SELECT generation FROM moved_users WHERE user_id IN (?, ?) LIMIT 1',
+                                     (user_id, SEALED)).fetchone()
+            except Exception:
+                conn.close()
+                raise
+            if moved is None:
+                return conn
+            conn.close()
+            generation = moved[0]
+        raise RuntimeError(f'No store shard found for user {user_id}')
+
+    def gather(self, sql, params=(), sort_columns=0, descending=False, limit=None, offset=0):
+        """Run a query on every live shard; returns (column names, rows as tuples).
+
+        With sort_columns=k the first k columns are a sort key that each
+        shard's query already orders by (ORDER BY those columns, DESC if
+        descending); the rows are merged in that order and the key columns
+        dropped. limit/offset then cut the merged rows, so for deep pages
+        each shard's query needs LIMIT offset + limit itself.
+        """
+        parts, columns = [], []
+        for shard in self.live_shards():
+            conn = shard.connect()
+            try:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                parts.append(cursor.execute(sql, params).fetchall())
+                columns = [column[0] for column in cursor.description]
+            finally:
+                conn.close()
+        if sort_columns:
+            rows = heapq.merge(*parts, key=operator.itemgetter(*range(sort_columns)), reverse=descending)
+            rows = (row[sort_columns:] for row in rows)
+            columns = columns[sort_columns:]
+        else:
+            rows = itertools.chain.from_iterable(parts)
+        return columns, list(itertools.islice(rows, offset, None if limit is None else offset + limit))
+
+    def total(self, sql, params=()):
+        """Sum of a single-value query (COUNT, SUM) over the live shards"""
+        _, rows = self.gather(sql, params)
+        return sum(row[0] or 0 for row in rows)
+
+    def locate(self, sql, params=(), write=False):
+        """(connection, row) of the first live shard where the query finds a row, else (None, None).
+
+        For lookups by a globally unique id; the caller closes the
+        connection. To write through it pass write=True: each shard is read
+        inside BEGIN IMMEDIATE, so the row cannot be moved before commit().
+        """
+        for shard in self.live_shards():
+            conn = shard.connect()
+            try:
+                if write:
+                    conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute(sql, params).fetchone()
+            except Exception:
+                conn.close()
+                raise
+            if row is not None:
+                return conn, row
+            conn.close()
+        return None, None
+
+
+store_shards = StoreShards()
+
+
+def get_user_db_connection(user_id, write=False):
+    """Connection to the shard with user_id's cart, wishlist, orders, reviews and notifications.
+
+    Pass write=True for requests that write (see StoreShards.connect).
+    """
+    return store_shards.connect(user_id, write)
+
+
+def create_generation(generation):
+    """Create a generation's shard files with the per-user schema (idempotent)"""
+    os.makedirs(STORE_SHARD_DIR, exist_ok=True)
+    for index in range(generation.shards):
+        shard = Shard(generation.generation, index)
+        conn = sqlite3.connect(shard.path)
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            ensure_user_schema(conn)
+            # Ids continue from the shard's own base, never from another file's
+            conn.executemany('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+            ''', [(table, shard.id_base, table) for table in SEQUENCE_TABLES])
+            conn.commit()
+        finally:
+            conn.close()
+    conn = get_db_connection()
+    try:
+        conn.execute('INSERT OR IGNORE INTO store_layout (generation, shards, state) VALUES (?, ?, ?)',
+                     (generation.generation, generation.shards, 'filling'))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _unmoved_users(source):
+    union = ' UNION '.join(f'SELECT user_id FROM {table}' for table in USER_TABLES)
+    return [row[0] for row in source.execute(
+        f'SELECT user_id FROM ({union}) EXCEPT SELECT user_id FROM moved_users ORDER BY 1'
+    )]
+
+
+def _copy_users(source, target, user_ids):
+    """Replace the users' rows in target with the source's, in one target transaction"""
+    from database.analytics import add_orders_sales, remove_orders_sales
+    placeholders = ','.join('?' * len(user_ids))
+    target.execute('BEGIN IMMEDIATE')
+    try:
+        # Copies left by an interrupted attempt go first
+        stale = [row[0] for row in target.execute(f'SELECT id FROM orders WHERE user_id IN ({placeholders})',
+                                                  user_ids)]
+        remove_orders_sales(target, stale)
+        target.execute(f'DELETE FROM order_items WHERE order_id IN '
+                       f'(SELECT id FROM orders WHERE user_id IN ({placeholders}))', user_ids)
+        for table in USER_TABLES:
+            target.execute(f'DELETE FROM {table} WHERE user_id IN ({placeholders})', user_ids)
+
+        copies = [(table, f'SELECT * FROM {table} WHERE user_id IN ({placeholders})') for table in USER_TABLES]
+        copies.append(('order_items', f'SELECT oi.* FROM order_items oi JOIN orders o ON o.id = oi.order_id '
+                                      f'WHERE o.user_id IN ({placeholders})'))
+        order_ids = []
+        for table, sql in copies:
+            cursor = source.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(sql, user_ids).fetchall()
+            columns = [column[0] for column in cursor.description]
+            if rows:
+                target.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+                )
+            if table == 'orders':
+                order_ids = [row[columns.index('id')] for row in rows]
+        add_orders_sales(target, order_ids)
+        target.execute('COMMIT')
+    except Exception:
+        target.execute('ROLLBACK')
+        raise
+
+
+def _move_users(source, user_ids, generation, targets):
+    """Move users out of source, whose write lock the caller holds; returns the number moved"""
+    from database.analytics import remove_orders_sales
+    if user_ids:
+        # Another reshard process may have moved some of them since they were listed
+        placeholders = ','.join('?' * len(user_ids))
+        moved = {row[0] for row in source.execute(
+            f'SELECT user_id FROM moved_users WHERE user_id IN ({placeholders}, ?)', (*user_ids, SEALED)
+        )}
+        user_ids = [] if SEALED in moved else [user_id for user_id in user_ids if user_id not in moved]
+    if not user_ids:
+        return 0
+
+    by_shard = {}
+    for user_id in user_ids:
+        by_shard.setdefault(shard_index(user_id, generation.shards), []).append(user_id)
+    for index, ids in by_shard.items():
+        if index not in targets:
+            targets[index] = Shard(generation.generation, index).connect()
+            targets[index].isolation_level = None
+        _copy_users(source, targets[index], ids)
+
+    # Committed in the new shards; now hand over. Counters follow the
+    # deletes through their triggers, rollups are subtracted here.
+    placeholders = ','.join('?' * len(user_ids))
+    order_ids = [row[0] for row in source.execute(f'SELECT id FROM orders WHERE user_id IN ({placeholders})',
+                                                  user_ids)]
+    remove_orders_sales(source, order_ids)
+    source.execute(f'DELETE FROM order_items WHERE order_id IN '
+                   f'(SELECT id FROM orders WHERE user_id IN ({placeholders}))', user_ids)
+    for table in USER_TABLES:
+        source.execute(f'DELETE FROM {table} WHERE user_id IN ({placeholders})', user_ids)
+    source.executemany('INSERT OR REPLACE INTO moved_users (user_id, generation) VALUES (?, ?)',
+                       [(user_id, generation.generation) for user_id in user_ids])
+    return len(user_ids)
+
+
+def _drain(shard, generation, targets, batch_users, pause):
+    """Move every user of one shard into `generation`, then seal the shard"""
+    source = shard.connect()
+    source.isolation_level = None  # explicit transactions
+    moved = 0
+    try:
+        while True:
+            users = _unmoved_users(source)
+            if len(users) <= batch_users:
+                break  # few enough for the final pass
+            for start in range(0, len(users), batch_users):
+                source.execute('BEGIN IMMEDIATE')
+                try:
+                    moved += _move_users(source, users[start:start + batch_users], generation, targets)
+                    source.execute('COMMIT')
+                except Exception:
+                    source.execute('ROLLBACK')
+                    raise
+                time.sleep(pause)
+
+        # Users that arrived during the passes move under one lock, together
+        # with the seal that sends everyone else to the new generation
+        source.execute('BEGIN IMMEDIATE')
+        try:
+            moved += _move_users(source, _unmoved_users(source), generation, targets)
+            source.execute('INSERT OR REPLACE INTO moved_users (user_id, generation) VALUES (?, ?)',
+                           (SEALED, generation.generation))
+            source.execute('COMMIT')
+        except Exception:
+            source.execute('ROLLBACK')
+            raise
+    finally:
+        source.close()
+    return moved
+
+
+def reshard(shards, batch_users=RESHARD_BATCH_USERS, pause=RESHARD_BATCH_PAUSE):
+    """Move every user into a new generation of `shards` shards; returns the users moved.
+
+    Resumes an interrupted reshard (a generation still 'filling') instead
+    of starting another.
+    """
+    if not 1 <= shards <= MAX_STORE_SHARDS:
+        raise ValueError(f'shards must be between 1 and {MAX_STORE_SHARDS}')
+    generations = store_shards.generations(refresh=True)
+    filling = [g for g in generations.values() if g.state == 'filling']
+    if filling:
+        generation = filling[0]
+        print(f"Resuming reshard into generation {generation.generation} ({generation.shards} shards)")
+    else:
+        generation = Generation(max(generations) + 1, shards, 'filling')
+    if Shard(generation.generation + 1, 0).id_base > 2 ** 53:
+        raise ValueError('Out of id space for another generation')
+    create_generation(generation)
+    source = store_shards.active_generation()
+    print(f"Resharding generation {source} into {generation.generation} ({generation.shards} shards)...")
+
+    moved = 0
+    targets = {}
+    try:
+        for shard in store_shards.shards(source):
+            moved += _drain(shard, generation, targets, batch_users, pause)
+    finally:
+        for conn in targets.values():
+            conn.close()
+
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE store_layout SET state = 'retired' WHERE state = 'active'")
+        conn.execute("UPDATE store_layout SET state = 'active' WHERE generation = ?", (generation.generation,))
+        conn.commit()
+    finally:
+        conn.close()
+    store_shards.generations(refresh=True)
+    print(f"Moved {moved} users; generation {generation.generation} is active")
+    return moved
+
+
+def cleanup():
+    """Delete the files of retired generations (store.db stays); returns the paths removed.
+
+    Run once no process can still be using the old layout (LAYOUT_TTL).
+    """
+    removed = []
+    for generation in store_shards.generations(refresh=True).values():
+        if generation.state != 'retired' or generation.generation == 0:
+            continue
+        for index in range(generation.shards):
+            path = Shard(generation.generation, index).path
+            for name in (path, f'{path}-wal', f'{path}-shm'):
+                if os.path.exists(name):
+                    os.remove(name)
+                    removed.append(name)
+    return removed
+
+
+def status():
+    """Generations, and users and orders per live shard"""
+    shards = []
+    for shard in store_shards.live_shards():
+        conn = shard.connect()
+        try:
+            users, orders = conn.execute(f'''
+                SELECT (SELECT COUNT(*) FROM ({' UNION '.join(f'SELECT user_id FROM {t}' for t in USER_TABLES)})),
+                       (SELECT COUNT(*) FROM orders)
+            ''').fetchone()
+        finally:
+            conn.close()
+        shards.append({'generation': shard.generation, 'index': shard.index, 'path': shard.path,
+                       'users': users, 'orders': orders})
+    return {'generations': [g._asdict() for g in sorted(store_shards.generations().values())],
+            'shards': shards}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Store shard layout and resharding')
+    sub = parser.add_subparsers(dest='command', required=True)
+    move = sub.add_parser('reshard', help='move every user into a new generation of shards')
+    move.add_argument('--shards', type=int, required=True)
+    move.add_argument('--batch-users', type=int, default=RESHARD_BATCH_USERS)
+    sub.add_parser('status', help='show the generations and rows per live shard')
+    sub.add_parser('cleanup', help='delete the files of retired generations')
+    args = parser.parse_args(argv)
+
+    if args.command == 'reshard':
+        reshard(args.shards, args.batch_users)
+    elif args.command == 'cleanup':
+        print(f"Removed: {', '.join(cleanup()) or 'nothing'}")
+    else:
+        layout = status()
+        for g in layout['generations']:
+            print(f"generation {g['generation']}: {g['shards']} shards, {g['state']}")
+        for shard in layout['shards']:
+            print(f"  {shard['path']:<28}{shard['users']:>8} users{shard['orders']:>8} orders")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""Search-as-you-type suggestions from an in-memory prefix index.
+
+The index holds, for every product, one key per word of its name (the rest
+of the name from that word on, lower-cased), so "lap" and "gaming lap" both
+find "Gaming Laptop Pro". Keys live in one sorted NumPy array of fixed-width
+byte strings (SUGGEST_KEY_WIDTH bytes, longer queries are verified against
+the name), with the product index and popularity of each key in parallel
+arrays, and names in a single UTF-8 blob: a handful of bytes per key instead
+of a Python object each. A prefix lookup is two binary searches
+(np.searchsorted) and a top-k by popularity over the matching range; for
+one- and two-character prefixes, whose ranges are the largest, the top
+products are precomputed.
+
+Popularity is units sold over the last SUGGEST_POPULARITY_DAYS days, read
+from the sales_daily rollups that checkout maintains from order_items.
+Brands, categories and tags are suggested too, from a small sorted list.
+
+Product writes arrive through the catalog invalidation bus, from this or any
+other worker process. Changed products are reloaded into a small delta
+(a bisect-sorted list) and their base entries masked, so a write costs a
+few microseconds and never rebuilds the arrays; the Suggester worker folds
+the delta in with a full rebuild once it grows past SUGGEST_DELTA_LIMIT
+products, and refreshes popularity every SUGGEST_REBUILD_INTERVAL seconds.
+
+NumPy is optional; without it suggest() raises RuntimeError.
+"""
+import bisect
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from database.db_init import get_products_db_connection
+from database.store_shards import store_shards
+from database.invalidation import catalog_bus
+from utils.background import PeriodicWorker
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+NUMPY_REQUIRED = 'NumPy is required for suggestions (pip install numpy)'
+SUGGEST_KEY_WIDTH = 16
+SUGGEST_LIMIT = 8
+MAX_QUERY_LENGTH = 100
+SHORT_PREFIX_LENGTH = 2  # prefixes up to this many bytes have precomputed results
+SHORT_PREFIX_DEPTH = 32  # products kept per precomputed prefix
+SUGGEST_POPULARITY_DAYS = int(os.environ.get('SUGGEST_POPULARITY_DAYS', 90))
+SUGGEST_DELTA_LIMIT = int(os.environ.get('SUGGEST_DELTA_LIMIT', 5000))
+SUGGEST_REBUILD_INTERVAL = int(os.environ.get('SUGGEST_REBUILD_INTERVAL', 3600))
+
+
+def normalize(text):
+    return ' '.join(str(text or '').lower().split())
+
+
+def name_keys(name):
+    """The name from each word on: 'Gaming Laptop' -> ['gaming laptop', 'laptop']"""
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+def _encode_key(text):
+    return text.encode('utf-8')[:SUGGEST_KEY_WIDTH]
+
+
+def _prefix_bounds(keys, prefix):
+    """[lo, hi) of the keys starting with the (already truncated) byte prefix"""
+    lo = int(np.searchsorted(keys, prefix, side='left'))
+    hi = int(np.searchsorted(keys, prefix + b'\xff' * (SUGGEST_KEY_WIDTH - len(prefix)), side='right'))
+    return lo, hi
+
+
+def _top(positions, popularity, k):
+    """positions sorted by descending popularity, at most k of them (ties: lower position)"""
+    if len(positions) > k:
+        positions = positions[np.argpartition(-popularity[positions], k - 1)[:k]]
+    return positions[np.lexsort((positions, -popularity[positions]))]
+
+
+def load_popularity(days=SUGGEST_POPULARITY_DAYS, conn=None):
+    """{product id: units sold in the last `days` days} from the sales rollups"""
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+    sql = '''
+        SELECT key, SUM(units) FROM sales_daily
+        WHERE dimension = 'product' AND day >= ?
+        GROUP BY key
+    '''
+    if conn is not None:
+        rows = conn.execute(sql, (since,)).fetchall()
+    else:
+        _, rows = store_shards.gather(sql, (since,))
+    popularity = {}
+    for key, units in rows:
+        popularity[int(key)] = popularity.get(int(key), 0) + units
+    return {product_id: units for product_id, units in popularity.items() if units > 0}
+
+
+class PrefixIndex:
+    """Immutable arrays for one snapshot of the catalog"""
+
+    def __init__(self, products, tags, popularity):
+        """products: [(id, name, brand, category)] sorted by id; tags: [(product_id, tag)]"""
+        count = len(products)
+        self.ids = np.fromiter((row[0] for row in products), dtype=np.int64, count=count)
+        self.popularity = np.fromiter((popularity.get(row[0], 0) for row in products),
+                                      dtype=np.float32, count=count)
+        encoded = [(row[1] or '').encode('utf-8') for row in products]
+        self.name_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=self.name_offsets[1:])
+        self.names = b''.join(encoded)
+        del encoded
+
+        key_list, key_product = [], []
+        for i, row in enumerate(products):
+            words = (row[1] or '').lower().split()
+            for start in range(len(words)):
+                key_list.append(' '.join(words[start:]).encode('utf-8')[:SUGGEST_KEY_WIDTH])
+                key_product.append(i)
+        keys = np.array(key_list, dtype=f'S{SUGGEST_KEY_WIDTH}')
+        del key_list
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.key_product = np.array(key_product, dtype=np.int32)[order]
+        self.key_popularity = self.popularity[self.key_product]
+
+        # Brands, categories and tags: sorted (normalized, kind, display, products, popularity)
+        tag_products = np.searchsorted(self.ids, np.fromiter((row[0] for row in tags), dtype=np.int64,
+                                                             count=len(tags)))
+        terms = self._terms('brand', [row[2] for row in products], np.arange(count))
+        terms += self._terms('category', [row[3] for row in products], np.arange(count))
+        terms += self._terms('tag', [row[1] for row in tags], tag_products.clip(max=max(count - 1, 0)))
+        self.terms = sorted(terms)
+        self.term_keys = [term[0] for term in self.terms]
+
+        self.short = self._precompute_short_prefixes()
+
+    def _terms(self, kind, values, product_index):
+        """One term per distinct normalized value, with its product count and summed popularity"""
+        codes, displays, entries = {}, [], []
+        for position, value in enumerate(values):
+            if value:
+                key = value.strip().lower()
+                code = codes.get(key)
+                if code is None:
+                    code = codes[key] = len(displays)
+                    displays.append(value.strip())
+                entries.append((position, code))
+        if not entries:
+            return []
+        positions = np.fromiter((position for position, _ in entries), dtype=np.int64, count=len(entries))
+        inverse = np.fromiter((code for _, code in entries), dtype=np.int64, count=len(entries))
+        counts = np.bincount(inverse, minlength=len(codes))
+        popularity = np.bincount(inverse, weights=self.popularity[product_index[positions]], minlength=len(codes))
+        return [(key, kind, displays[code], int(counts[code]), float(popularity[code]))
+                for key, code in codes.items()]
+
+    def _precompute_short_prefixes(self):
+        """{prefix: product indexes by popularity} for every 1..SHORT_PREFIX_LENGTH byte prefix"""
+        short = {}
+        for length in range(1, SHORT_PREFIX_LENGTH + 1):
+            prefixes = self.keys.astype(f'S{length}')
+            if not len(prefixes):
+                break
+            starts = np.flatnonzero(np.r_[True, prefixes[1:] != prefixes[:-1]])
+            ends = np.r_[starts[1:], len(prefixes)]
+            for lo, hi in zip(starts.tolist(), ends.tolist()):
+                if hi - lo <= SHORT_PREFIX_DEPTH:
+                    continue  # small enough to scan at query time
+                positions = lo + _top(np.arange(hi - lo), self.key_popularity[lo:hi], SHORT_PREFIX_DEPTH * 2)
+                products = list(dict.fromkeys(self.key_product[positions].tolist()))
+                short[bytes(prefixes[lo])] = products[:SHORT_PREFIX_DEPTH]
+        return short
+
+    def name(self, i):
+        return self.names[self.name_offsets[i]:self.name_offsets[i + 1]].decode('utf-8')
+
+    def candidates(self, query, depth):
+        """Product indexes whose name has a word-aligned suffix starting with query, by popularity"""
+        prefix = _encode_key(query)
+        if len(prefix) <= SHORT_PREFIX_LENGTH and prefix in self.short:
+            found = self.short[prefix]
+            if len(found) >= depth:
+                return found[:depth]
+        lo, hi = _prefix_bounds(self.keys, prefix)
+        positions = lo + _top(np.arange(hi - lo), self.key_popularity[lo:hi], depth * 2)
+        found = list(dict.fromkeys(self.key_product[positions].tolist()))
+        if len(query.encode('utf-8')) > SUGGEST_KEY_WIDTH:
+            # The keys were cut short; confirm against the names
+            found = [i for i in found if f' {query}' in f' {normalize(self.name(i))}']
+        return found[:depth]
+
+    def size(self):
+        arrays = (self.ids, self.popularity, self.name_offsets, self.keys, self.key_product, self.key_popularity)
+        return sum(array.nbytes for array in arrays) + len(self.names)
+
+
+class Suggester(PeriodicWorker):
+    """Prefix index plus a delta of products changed since it was built"""
+    name = 'suggester'
+
+    def __init__(self):
+        super().__init__()
+        self._index = None
+        self._stale = set()  # product ids reported changed, not yet reloaded
+        self._reloaded = None  # ids moved into the delta while a build runs
+        self._needs_build = False
+        self._masked = set()  # base products superseded by the delta
+        self._delta = {}  # product id -> (name, popularity, keys)
+        self._delta_keys = []  # sorted (key, product id)
+        self._delta_terms = []  # sorted (normalized, kind, display)
+        self.built_at = None
+        self._next_build = 0.0
+        catalog_bus.subscribe(self._on_catalog_change)
+
+    def _init_locks(self):
+        super()._init_locks()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def _on_catalog_change(self, product_ids):
+        with self._lock:
+            if product_ids is None:
+                self._needs_build = True
+            else:
+                self._stale.update(product_ids)
+
+    @property
+    def ready(self):
+        return self._index is not None
+
+    def build(self):
+        """Rebuild the arrays from products.db and the sales rollups; swaps in atomically"""
+        if np is None:
+            raise RuntimeError(NUMPY_REQUIRED)
+        with self._build_lock:
+            with self._lock:
+                self._needs_build = False
+                self._reloaded = set()
+            try:
+                conn = get_products_db_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.row_factory = None  # plain tuples: a million Row objects add up
+                    products = cursor.execute('SELECT id, name, brand, category FROM products ORDER BY id').fetchall()
+                    tags = cursor.execute('SELECT product_id, tag FROM product_tags').fetchall()
+                finally:
+                    conn.close()
+                index = PrefixIndex(products, tags, load_popularity())
+                del tags
+            except Exception:
+                with self._lock:
+                    self._reloaded = None
+                raise
+            with self._lock:
+                self._index = index
+                self._masked = set()
+                self._delta = {}
+                self._delta_keys = []
+                self._delta_terms = []
+                # Changes reloaded into the delta during the build may be newer
+                # than what it read: reload them against the new index
+                self._stale.update(self._reloaded)
+                self._reloaded = None
+            self.built_at = time.strftime('%Y-%m-%d %H:%M:%S')
+            return len(products)
+
+    def _apply_changes(self):
+        """Reload products reported by the invalidation bus into the delta"""
+        with self._lock:
+            stale, self._stale = self._stale, set()
+            if self._reloaded is not None:
+                self._reloaded.update(stale)
+        if not stale:
+            return
+        ids = sorted(stale)
+        conn = get_products_db_connection()
+        try:
+            placeholders = ','.join('?' * len(ids))
+            rows = {row['id']: row for row in conn.execute(
+                f'SELECT id, name, brand, category FROM products WHERE id IN ({placeholders})', ids)}
+            tags = {}
+            for row in conn.execute(
+                    f'SELECT product_id, tag FROM product_tags WHERE product_id IN ({placeholders})', ids):
+                tags.setdefault(row['product_id'], []).append(row['tag'])
+        finally:
+            conn.close()
+        with self._lock:
+            index = self._index
+            for product_id in ids:
+                self._masked.add(product_id)
+                old = self._delta.pop(product_id, None)
+                if old:
+                    for key in old[2]:
+                        position = bisect.bisect_left(self._delta_keys, (key, product_id))
+                        del self._delta_keys[position]
+                row = rows.get(product_id)
+                if row is None:
+                    continue  # deleted: masked is enough
+                i = int(np.searchsorted(index.ids, product_id))
+                popularity = float(index.popularity[i]) if i < len(index.ids) and index.ids[i] == product_id else 0.0
+                keys = name_keys(row['name'])
+                self._delta[product_id] = (row['name'], popularity, keys)
+                for key in keys:
+                    bisect.insort(self._delta_keys, (key, product_id))
+                # New terms show up right away; counts catch up at the next build
+                for kind, value in (('brand', row['brand']), ('category', row['category'])):
+                    self._add_delta_term(index, kind, value)
+                for tag in tags.get(product_id, []):
+                    self._add_delta_term(index, 'tag', tag)
+            oversized = len(self._delta) > SUGGEST_DELTA_LIMIT
+        if oversized:
+            self.wake()
+
+    def _add_delta_term(self, index, kind, value):
+        key = (value or '').strip().lower()
+        if not key:
+            return
+        position = bisect.bisect_left(index.term_keys, key)
+        while position < len(index.terms) and index.terms[position][0] == key:
+            if index.terms[position][1] == kind:
+                return
+            position += 1
+        term = (key, kind, value)
+        position = bisect.bisect_left(self._delta_terms, term)
+        if position == len(self._delta_terms) or self._delta_terms[position][:2] != term[:2]:
+            self._delta_terms.insert(position, term)
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """{'products': [{id, name, popularity}], 'terms': [{type, text, products}]} for a prefix"""
+        if np is None:
+            raise RuntimeError(NUMPY_REQUIRED)
+        query = normalize(query)[:MAX_QUERY_LENGTH]
+        catalog_bus.sync()
+        if self._index is None or (self._needs_build and not self.running):
+            self.build()
+        elif self._needs_build:
+            self.wake()
+        if self._stale:
+            self._apply_changes()
+        if not query:
+            return {'products': [], 'terms': []}
+
+        with self._lock:
+            index, masked = self._index, self._masked
+            # Base products, skipping those the delta replaces, merged with the delta
+            depth = limit * 2
+            while True:
+                found = index.candidates(query, depth)
+                scored = [(float(index.popularity[i]), -int(index.ids[i]), index.name(i))
+                          for i in found if int(index.ids[i]) not in masked]
+                # Masked products may have crowded out the ones behind them
+                if len(scored) >= limit or len(found) < depth:
+                    break
+                depth *= 4
+            position = bisect.bisect_left(self._delta_keys, (query,))
+            seen = set()
+            while position < len(self._delta_keys) and self._delta_keys[position][0].startswith(query):
+                product_id = self._delta_keys[position][1]
+                if product_id not in seen:
+                    seen.add(product_id)
+                    name, popularity, _ = self._delta[product_id]
+                    scored.append((popularity, -product_id, name))
+                position += 1
+
+            terms = []
+            lo = bisect.bisect_left(index.term_keys, query)
+            hi = bisect.bisect_left(index.term_keys, query + '\uffff')
+            for key, kind, display, products, popularity in index.terms[lo:hi]:
+                terms.append((popularity, products, kind, display))
+            position = bisect.bisect_left(self._delta_terms, (query,))
+            while position < len(self._delta_terms) and self._delta_terms[position][0].startswith(query):
+                key, kind, display = self._delta_terms[position]
+                terms.append((0.0, 1, kind, display))
+                position += 1
+
+        products = heapq.nlargest(limit, scored)
+        terms = heapq.nlargest(min(limit, 5), terms, key=lambda term: (term[0], term[1]))
+        return {
+            'products': [{'id': -negated_id, 'name': name, 'popularity': int(popularity)}
+                         for popularity, negated_id, name in products],
+            'terms': [{'type': kind, 'text': display, 'products': count}
+                      for _, count, kind, display in terms],
+        }
+
+    def stats(self):
+        index = self._index
+        return {
+            'ready': index is not None,
+            'built_at': self.built_at,
+            'products': 0 if index is None else len(index.ids),
+            'keys': 0 if index is None else len(index.keys),
+            'terms': 0 if index is None else len(index.terms),
+            'bytes': 0 if index is None else index.size(),
+            'delta_products': len(self._delta),
+        }
+
+    def run_once(self):
+        if np is None:
+            return
+        due = time.time() >= self._next_build
+        if self._index is None or due or self._needs_build or len(self._delta) > SUGGEST_DELTA_LIMIT:
+            self._next_build = time.time() + SUGGEST_REBUILD_INTERVAL
+            self.build()
+
+
+suggester = Suggester()
@@ -0,0 +1,149 @@
+"""Normalized product tags.
+
+products.tags stays the comma-separated string the API reads and writes;
+product_tags holds one (tag, product_id) row per tag, lower-cased and
+trimmed, so tag filters are primary-key lookups instead of `tags LIKE` scans
+(which also match "rgb" inside "rgbw"). Triggers on products keep it in sync
+in the same transaction as every insert, update of tags and delete, whichever
+code path makes the write, the same way the stats counters are maintained.
+
+Filters are a list of groups: products must match every group, and a group
+matches if the product has any of its tags. The listing endpoint takes them
+as ?tag=gaming,rgb (AND) and ?tag=mouse|keyboard (OR), combinable.
+"""
+from database.db_init import get_products_db_connection
+
+MAX_TAG_FACETS = 50
+MAX_TAG_FILTERS = 10
+
+# The tags string as a JSON array, so json_each() can split it inside a
+# trigger (SQLite triggers cannot use recursive CTEs). json_quote() escapes
+# quotes, backslashes and control characters and never emits a comma, so
+# splitting the quoted string on commas always yields valid JSON.
+_INSERT_TAGS = '''
+    INSERT OR IGNORE INTO product_tags (tag, product_id)
+    SELECT lower(trim(value)), {row}.id
+    FROM {source}json_each('[' || replace(json_quote({row}.tags), ',', '","') || ']')
+    WHERE trim(value) != ''
+'''
+
+
+def _insert_tags(row):
+    return _INSERT_TAGS.format(row=row, source='') + ';'
+
+
+def ensure_product_tags(conn):
+    """Create product_tags and its sync triggers in products.db, backfilling if empty (idempotent)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS product_tags (
+            tag TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            PRIMARY KEY (tag, product_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_product_tags_product ON product_tags (product_id, tag)')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS products_tags_insert AFTER INSERT ON products
+        BEGIN
+            {_insert_tags('NEW')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS products_tags_update AFTER UPDATE OF tags ON products
+        BEGIN
+            DELETE FROM product_tags WHERE product_id = OLD.id;
+            {_insert_tags('NEW')}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_tags_delete AFTER DELETE ON products
+        BEGIN
+            DELETE FROM product_tags WHERE product_id = OLD.id;
+        END
+    ''')
+    if conn.execute('SELECT 1 FROM product_tags LIMIT 1').fetchone() is None:
+        rebuild_product_tags(conn)
+
+
+def rebuild_product_tags(conn):
+    """Recompute product_tags from products.tags inside the caller's transaction"""
+    conn.execute('DELETE FROM product_tags')
+    conn.execute(_INSERT_TAGS.format(row='products', source='products, '))
+
+
+def normalize_tag(tag):
+    return tag.strip().lower()
+
+
+def parse_tag_filter(values):
+    """?tag= values -> tuple of OR-groups (sorted tuples), ANDed together.
+
+    Commas separate required tags, pipes alternatives: ['gaming,mouse|keyboard']
+    -> (('gaming',), ('keyboard', 'mouse')). The result is hashable and
+    canonical, so it can be part of a cache key.
+    """
+    groups = set()
+    for value in values:
+        for part in value.split(','):
+            group = tuple(sorted({normalize_tag(tag) for tag in part.split('|')} - {''}))
+            if group:
+                groups.add(group)
+    return tuple(sorted(groups))[:MAX_TAG_FILTERS]
+
+
+def tag_filter_sql(groups, column='id'):
+    """(conditions, params) restricting `column` to products matching the tag groups"""
+    conditions, params = [], []
+    for group in groups:
+        conditions.append(
+            f"{column} IN (SELECT product_id FROM product_tags WHERE tag IN ({','.join('?' * len(group))}))"
+        )
+        params.extend(group)
+    return conditions, params
+
+
+def tag_facets(conn, where_clause='', params=(), limit=MAX_TAG_FACETS):
+    """[{'tag', 'count'}] over the products matching an optional WHERE clause, most common first"""
+    if where_clause:
+        # Walk the matching products' tags through the (product_id, tag) index
+        source = f'products JOIN product_tags ON product_tags.product_id = products.id {where_clause}'
+    else:
+        source = 'product_tags'
+    rows = conn.execute(f'''
+        SELECT tag, COUNT(*) AS count FROM {source}
+        GROUP BY tag ORDER BY count DESC, tag LIMIT ?
+    ''', list(params) + [limit]).fetchall()
+    return [{'tag': row['tag'], 'count': row['count']} for row in rows]
+
+
+def similar_products(product_id, limit=10, conn=None):
+    """[(product id, jaccard)] of products sharing tags with product_id, most similar first.
+
+    Jaccard = shared tags / tags in either product. Candidates come from the
+    tag index (every product sharing at least one tag), and each candidate's
+    tag count from the (product_id, tag) index.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_products_db_connection()
+    try:
+        rows = conn.execute('''
+            WITH mine AS (SELECT tag FROM product_tags WHERE product_id = :id),
+            shared AS (
+                SELECT pt.product_id, COUNT(*) AS shared
+                FROM mine JOIN product_tags pt ON pt.tag = mine.tag
+                WHERE pt.product_id != :id
+                GROUP BY pt.product_id
+            )
+            SELECT shared.product_id,
+                   shared.shared * 1.0 / ((SELECT COUNT(*) FROM mine) + (
+                       SELECT COUNT(*) FROM product_tags t WHERE t.product_id = shared.product_id
+                   ) - shared.shared) AS jaccard
+            FROM shared
+            ORDER BY jaccard DESC, shared.product_id
+            LIMIT :limit
+        ''', {'id': product_id, 'limit': limit}).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    return [(row['product_id'], row['jaccard']) for row in rows]
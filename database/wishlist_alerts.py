@@ -0,0 +1,176 @@
+"""Price-drop and back-in-stock notifications for wishlisted products.
+
+Product writes report changes here (price_changed / stock_changed, and
+back_in_stock for stock restored by order cancellations). The request only
+records the event in memory and wakes the WishlistAlerter thread; matching
+and notification inserts happen off the request path.
+
+Events are coalesced per (product, kind) until the alerter runs, and are
+checked against the product's current state then, so a price that dropped
+and went back up in between produces nothing. For each event the alerter
+finds the wishlisting users through the wishlist (product_id, user_id)
+index and inserts their notifications with one INSERT ... SELECT per chunk
+of WISHLIST_ALERT_BATCH_SIZE users, in each store shard (a user's wishlist,
+notifications and alerts share a shard). wishlist_alerts remembers what each
+user was last told:
+    back_in_stock  at most once per WISHLIST_ALERT_COOLDOWN seconds
+    price_drop     also only when the price is below the last one announced
+"""
+import os
+import threading
+import time
+from database.store_shards import store_shards
+from database.product_cache import get_products
+from database.stock_shards import sharded_stock
+from utils.background import PeriodicWorker
+
+WISHLIST_ALERT_COOLDOWN = int(os.environ.get('WISHLIST_ALERT_COOLDOWN', 24 * 3600))
+WISHLIST_ALERT_BATCH_SIZE = 1000
+PRICE_DROP, BACK_IN_STOCK = 'price_drop', 'back_in_stock'
+MAX_USER_ID = 2 ** 63 - 1
+
+# Wishlist rows of one product, chunk of users, not alerted recently enough
+_ELIGIBLE = '''
+    FROM wishlist w
+    LEFT JOIN wishlist_alerts a
+        ON a.product_id = w.product_id AND a.kind = :kind AND a.user_id = w.user_id
+    WHERE w.product_id = :product_id AND w.user_id > :low AND w.user_id <= :high
+      AND (a.user_id IS NULL
+           OR (a.sent_at < :cooldown_start AND (:kind != 'price_drop' OR :price < a.price)))
+'''
+
+
+def ensure_wishlist_alerts(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS wishlist_alerts (
+            product_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            price REAL,
+            sent_at REAL NOT NULL,
+            PRIMARY KEY (product_id, kind, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def out_of_stock_ids(products_conn, product_ids):
+    """Ids among product_ids with no stock left (live shard totals for sharded products)"""
+    ids = list(set(product_ids))
+    if not ids:
+        return []
+    placeholders = ','.join('?' * len(ids))
+    rows = products_conn.execute(
+        f'SELECT id, stock, stock_sharded FROM products WHERE id IN ({placeholders})', ids
+    ).fetchall()
+    sharded = sharded_stock.totals([row['id'] for row in rows if row['stock_sharded']])
+    return [row['id'] for row in rows
+            if (sharded.get(row['id'], 0) if row['stock_sharded'] else row['stock']) <= 0]
+
+
+def _notify(conn, product, kind, reference_price):
+    """Insert notifications for every eligible wishlisting user, chunk by chunk"""
+    if kind == PRICE_DROP:
+        title = 'Price drop on your wishlist'
+        message = f"{product['name']} dropped from ${reference_price:.2f} to ${product['price']:.2f}"
+    else:
+        title = 'Back in stock'
+        message = f"{product['name']} from your wishlist is back in stock"
+    now = time.time()
+    params = {
+        'kind': kind, 'product_id': product['id'], 'price': product['price'],
+        'cooldown_start': now - WISHLIST_ALERT_COOLDOWN, 'title': title, 'message': message, 'now': now,
+    }
+    sent = 0
+    low = 0
+    while low < MAX_USER_ID:
+        row = conn.execute('''
+            SELECT user_id FROM wishlist WHERE product_id = ? AND user_id > ?
+            ORDER BY user_id LIMIT 1 OFFSET ?
+        ''', (product['id'], low, WISHLIST_ALERT_BATCH_SIZE - 1)).fetchone()
+        high = row['user_id'] if row else MAX_USER_ID
+        chunk = dict(params, low=low, high=high)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            sent += conn.execute(f'''
+                INSERT INTO notifications (user_id, title, message, type)
+                SELECT w.user_id, :title, :message, 'wishlist' {_ELIGIBLE}
+            ''', chunk).rowcount
+            conn.execute(f'''
+                INSERT INTO wishlist_alerts (product_id, kind, user_id, price, sent_at)
+                SELECT w.product_id, :kind, w.user_id, :price, :now {_ELIGIBLE}
+                ON CONFLICT (product_id, kind, user_id) DO UPDATE SET
+                    price = excluded.price, sent_at = excluded.sent_at
+            ''', chunk)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        low = high
+    return sent
+
+
+class WishlistAlerter(PeriodicWorker):
+    """Collects product change events and turns them into notifications"""
+    name = 'wishlist-alerter'
+
+    def __init__(self):
+        super().__init__()
+        self._pending = {}  # (product_id, kind) -> reference price
+        self.sent = 0
+
+    def _init_locks(self):
+        super()._init_locks()
+        self._lock = threading.Lock()
+
+    def _add(self, product_id, kind, reference_price=None):
+        with self._lock:
+            key = (product_id, kind)
+            if kind == PRICE_DROP and key in self._pending:
+                # Keep the price from before the first of several drops
+                reference_price = max(self._pending[key], reference_price)
+            self._pending[key] = reference_price
+        self.wake()
+
+    def price_changed(self, product_id, old_price, new_price):
+        if old_price is not None and new_price is not None and float(new_price) < float(old_price):
+            self._add(product_id, PRICE_DROP, float(old_price))
+
+    def stock_changed(self, product_id, old_stock, new_stock):
+        if (old_stock or 0) <= 0 < int(new_stock or 0):
+            self._add(product_id, BACK_IN_STOCK)
+
+    def back_in_stock(self, product_ids):
+        """Products whose stock was just restored from zero"""
+        for product_id in product_ids:
+            self._add(product_id, BACK_IN_STOCK)
+
+    def run_once(self):
+        with self._lock:
+            events, self._pending = self._pending, {}
+        if not events:
+            return 0
+        products = get_products({product_id for product_id, _ in events}, fresh=True)
+        alerts = []
+        for (product_id, kind), reference_price in events.items():
+            product = products.get(product_id)
+            if not product:
+                continue
+            if kind == PRICE_DROP and not product['price'] < reference_price:
+                continue
+            if kind == BACK_IN_STOCK and not product['stock'] > 0:
+                continue
+            alerts.append((product, kind, reference_price))
+        sent = 0
+        for shard in store_shards.live_shards() if alerts else ():
+            conn = shard.connect()
+            conn.isolation_level = None  # explicit transactions per chunk
+            try:
+                for product, kind, reference_price in alerts:
+                    sent += _notify(conn, product, kind, reference_price)
+            finally:
+                conn.close()
+        self.sent += sent
+        return sent
+
+
+wishlist_alerter = WishlistAlerter()
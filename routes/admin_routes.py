@@ -0,0 +1,80 @@
+from flask import request, session
+from flask_restful import Resource
+from database.product_cache import product_cache
+from database.listing_cache import listing_cache
+from database.invalidation import catalog_bus
+from database.stats import get_dashboard_stats, stats_reconciler
+from database.deletion import get_job, list_jobs, find_orphans, repair_orphans, deletion_reaper
+
+class CacheStatsResource(Resource):
+    def get(self):
+        """Hit/miss/eviction stats for the in-process caches (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        return {
+            'products': product_cache.stats(),
+            'listings': listing_cache.stats(),
+            'coherence': catalog_bus.stats()
+        }
+
+    def delete(self):
+        """Flush the in-process caches (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        product_cache.clear()
+        listing_cache.clear()
+        return {'success': True, 'message': 'Caches cleared'}
+
+
+class AdminStatsResource(Resource):
+    def get(self):
+        """Dashboard totals from the incrementally maintained counters (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        return get_dashboard_stats()
+
+    def post(self):
+        """Recount every counter from the base tables now (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        drift = stats_reconciler.run_once()
+        return {'success': True, 'corrections': drift, 'stats': get_dashboard_stats()}
+
+
+class DeletionJobsResource(Resource):
+    def get(self, job_id=None):
+        """Progress of background user/product deletions (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        if job_id:
+            job = get_job(job_id)
+            if not job:
+                return {'message': 'Deletion job not found'}, 404
+            return job
+        return {
+            'jobs': list_jobs(request.args.get('status'), min(request.args.get('limit', 50, type=int), 500)),
+            'reaper': {'running': deletion_reaper.running, 'last_run': deletion_reaper.last_run}
+        }
+
+
+class OrphansResource(Resource):
+    def get(self):
+        """Rows in the store shards whose user, order or product no longer exists (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        return {'orphans': find_orphans()}
+
+    def post(self):
+        """Queue deletion jobs for every missing parent found (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        result = repair_orphans()
+        deletion_reaper.wake()
+        return {'success': True, **result}
@@ -0,0 +1,100 @@
+from datetime import date, datetime, timedelta, timezone
+from flask import request, session
+from flask_restful import Resource
+from database.analytics import DIMENSIONS, query_sales, query_top
+from database.product_cache import get_products
+from database.inventory import WINDOW_DAYS, LEAD_TIME_DAYS, reorder_report
+
+DEFAULT_RANGE_DAYS = 30
+MAX_TOP_LIMIT = 100
+MAX_FORECAST_WINDOW = 365
+
+
+def parse_date_range():
+    """start/end query parameters as ISO dates; defaults to the last 30 days.
+
+    Days are UTC, matching the CURRENT_TIMESTAMP order dates they group.
+    """
+    end = request.args.get('end') or datetime.now(timezone.utc).date().isoformat()
+    start = request.args.get('start') or (date.fromisoformat(end) - timedelta(days=DEFAULT_RANGE_DAYS - 1)).isoformat()
+    date.fromisoformat(start)  # ValueError for malformed dates
+    date.fromisoformat(end)
+    return start, end
+
+
+class SalesAnalyticsResource(Resource):
+    def get(self):
+        """Daily revenue, units and orders for a dimension over a date range (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        dimension = request.args.get('dimension', 'all')
+        if dimension not in DIMENSIONS:
+            return {'message': f"dimension must be one of: {', '.join(DIMENSIONS)}"}, 400
+        try:
+            start, end = parse_date_range()
+        except ValueError:
+            return {'message': 'start and end must be dates (YYYY-MM-DD)'}, 400
+
+        rows = query_sales(dimension, start, end, request.args.get('key'))
+        return {
+            'dimension': dimension,
+            'start': start,
+            'end': end,
+            'days': rows,
+            'totals': {
+                'revenue': round(sum(row['revenue'] for row in rows), 2),
+                'units': sum(row['units'] for row in rows),
+                'orders': sum(row['orders'] for row in rows)
+            }
+        }
+
+
+class TopSellersResource(Resource):
+    def get(self):
+        """Top-N products (or categories / brands) by revenue or units (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        dimension = request.args.get('dimension', 'product')
+        if dimension not in DIMENSIONS or dimension == 'all':
+            return {'message': 'dimension must be one of: product, category, brand'}, 400
+        by = request.args.get('by', 'revenue')
+        if by not in ('revenue', 'units'):
+            return {'message': 'by must be revenue or units'}, 400
+        limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_TOP_LIMIT)
+        try:
+            start, end = parse_date_range()
+        except ValueError:
+            return {'message': 'start and end must be dates (YYYY-MM-DD)'}, 400
+
+        rows = query_top(dimension, start, end, by, limit)
+        if dimension == 'product':
+            products = get_products(int(row['key']) for row in rows)
+            for row in rows:
+                product = products.get(int(row['key']))
+                row['product_id'] = int(row['key'])
+                row['name'] = product['name'] if product else f"Product #{row['key']} (Deleted)"
+        return {'dimension': dimension, 'by': by, 'start': start, 'end': end, 'top': rows}
+
+
+class InventoryForecastResource(Resource):
+    def get(self):
+        """Sales velocity, days of cover and reorder suggestions for the catalog (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        window = min(max(request.args.get('window', WINDOW_DAYS, type=int), 7), MAX_FORECAST_WINDOW)
+        lead_time = max(request.args.get('lead_time', LEAD_TIME_DAYS, type=int), 1)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_TOP_LIMIT)
+        only_reorder = request.args.get('all') not in ('1', 'true')
+        try:
+            report = reorder_report(window, lead_time, limit, only_reorder)
+        except RuntimeError as e:
+            return {'message': str(e)}, 501
+
+        products = get_products(row['product_id'] for row in report['products'])
+        for row in report['products']:
+            product = products.get(row['product_id'])
+            row['name'] = product['name'] if product else None
+        return report
@@ -27,7 +27,7 @@ class AuthResource(Resource):
                 
                 conn = get_db_connection()
                 user = conn.execute(
-                    'SELECT * FROM users WHERE username = ? AND password = ?',
+                    'SELECT * FROM users WHERE username = ? AND password = ? AND deleted_at IS NULL',
                     (username, hash_password(password))
                 ).fetchone()
                 conn.close()
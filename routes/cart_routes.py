@@ -1,9 +1,15 @@
 from flask import request, session
 from flask_restful import Resource
-from database.db_init import get_db_connection, get_products_db_connection
+from database.store_shards import get_user_db_connection
+from database.product_cache import get_product, get_products
 import traceback
+from utils.idempotency import idempotent
+from utils.fields import CART_FIELDS
+from utils.images import with_image_for
 
 class CartResource(Resource):
+    method_decorators = {'post': [idempotent]}
+
     def get(self, cart_id=None):
         try:
             print(f"Cart GET - Session: {dict(session)}, cart_id: {cart_id}")
@@ -15,60 +21,59 @@ class CartResource(Resource):
             user_id = session['user_id']
             print(f"Getting cart for user_id: {user_id}")
             
-            conn = get_db_connection()
-            products_conn = get_products_db_connection()
+            try:
+                fields = CART_FIELDS.parse(request.args.get('fields'))
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            # product_id and quantity are always read: the total needs them
+            columns = CART_FIELDS.sql(fields, extra=('product_id', 'quantity'))
+            
+            conn = get_user_db_connection(user_id)
             
             if cart_id:
                 # Get specific cart item
                 cart_item = conn.execute(
-                    'SELECT * FROM cart WHERE id = ? AND user_id = ?',
+                    f'SELECT {columns} FROM cart WHERE id = ? AND user_id = ?',
                     (cart_id, user_id)
                 ).fetchone()
                 
                 if not cart_item:
                     conn.close()
-                    products_conn.close()
                     return {'message': 'Cart item not found'}, 404
                 
-                # Get product details
-                product = products_conn.execute(
-                    'SELECT * FROM products WHERE id = ?',
-                    (cart_item['product_id'],)
-                ).fetchone()
-                
                 conn.close()
-                products_conn.close()
                 
                 result = dict(cart_item)
-                if product:
-                    result['product'] = dict(product)
+                if fields is None or fields.wants('product'):
+                    # Get product details
+                    product = get_product(cart_item['product_id'])
+                    if product:
+                        result['product'] = with_image_for(product, 'thumb')
                 
-                return result
+                return result if fields is None else fields.project(result)
             
             else:
                 # Get all cart items for user
                 print("Fetching all cart items for user")
                 cart_items = conn.execute(
-                    'SELECT * FROM cart WHERE user_id = ?',
+                    f'SELECT {columns} FROM cart WHERE user_id = ?',
                     (user_id,)
                 ).fetchall()
                 
                 print(f"Found {len(cart_items)} cart items")
                 
+                # Get product details for all cart items in one lookup
+                products = get_products(item['product_id'] for item in cart_items)
+                
                 result = []
                 total = 0
                 
                 for item in cart_items:
-                    # Get product details for each cart item
-                    product = products_conn.execute(
-                        'SELECT * FROM products WHERE id = ?',
-                        (item['product_id'],)
-                    ).fetchone()
+                    product_dict = products.get(item['product_id'])
                     
                     cart_item = dict(item)
-                    if product:
-                        product_dict = dict(product)
-                        cart_item['product'] = product_dict
+                    if product_dict:
+                        cart_item['product'] = with_image_for(product_dict, 'thumb')
                         cart_item['subtotal'] = item['quantity'] * product_dict['price']
                         total += cart_item['subtotal']
                         print(f"  - {product_dict['name']}: qty={item['quantity']}, price=${product_dict['price']}, subtotal=${cart_item['subtotal']}")
@@ -77,10 +82,9 @@ class CartResource(Resource):
                         cart_item['product'] = None
                         cart_item['subtotal'] = 0
                     
-                    result.append(cart_item)
+                    result.append(cart_item if fields is None else fields.project(cart_item))
                 
                 conn.close()
-                products_conn.close()
                 
                 print(f"Cart total: ${total}")
                 return {
@@ -94,7 +98,6 @@ class CartResource(Resource):
             print(f"Traceback: {traceback.format_exc()}")
             try:
                 conn.close()
-                products_conn.close()
             except:
                 pass
             return {'success': False, 'message': 'Server error'}, 500
@@ -124,24 +127,18 @@ class CartResource(Resource):
             
             user_id = session['user_id']
             
-            # Check if product exists and has enough stock
-            products_conn = get_products_db_connection()
-            product = products_conn.execute(
-                'SELECT * FROM products WHERE id = ?', (product_id,)
-            ).fetchone()
+            # Check if product exists and has enough stock (checkout
+            # re-validates stock against the database)
+            product = get_product(product_id)
             
             if not product:
-                products_conn.close()
                 return {'success': False, 'message': 'Product not found'}, 404
             
             if product['stock'] < quantity:
-                products_conn.close()
                 return {'success': False, 'message': f'Insufficient stock. Available: {product["stock"]}'}, 400
             
-            products_conn.close()
-            
             # Add to cart or update existing item
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
             
             # Check if item already in cart
@@ -204,7 +201,7 @@ class CartResource(Resource):
             
             user_id = session['user_id']
             
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
             
             # Check if cart item exists
@@ -218,12 +215,7 @@ class CartResource(Resource):
                 return {'message': 'Cart item not found'}, 404
             
             # Check product stock
-            products_conn = get_products_db_connection()
-            product = products_conn.execute(
-                'SELECT stock FROM products WHERE id = ?',
-                (cart_item['product_id'],)
-            ).fetchone()
-            products_conn.close()
+            product = get_product(cart_item['product_id'])
             
             if not product or quantity > product['stock']:
                 conn.close()
@@ -255,7 +247,7 @@ class CartResource(Resource):
             
             user_id = session['user_id']
             
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
             
             # Check if cart item exists
@@ -291,7 +283,7 @@ class CartResource(Resource):
 def clear_cart_for_user(user_id):
     """Utility function to clear cart for a user (used after checkout)"""
     try:
-        conn = get_db_connection()
+        conn = get_user_db_connection(user_id, write=True)
         cursor = conn.cursor()
         cursor.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
         conn.commit()
@@ -304,7 +296,7 @@ def clear_cart_for_user(user_id):
 def get_cart_count_for_user(user_id):
     """Utility function to get cart item count for a user"""
     try:
-        conn = get_db_connection()
+        conn = get_user_db_connection(user_id)
         count = conn.execute(
             'SELECT SUM(quantity) FROM cart WHERE user_id = ?', (user_id,)
         ).fetchone()[0] or 0
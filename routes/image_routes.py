@@ -0,0 +1,92 @@
+import os
+import re
+from flask import request, session, send_file
+from flask_restful import Resource
+from utils.images import (IMAGE_MAX_BYTES, CONTENT_TYPES, VARIANT_SIZES, store_image, image_path, image_url,
+                          variant_urls, missing_variants, thumbnailer)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_DIGEST = re.compile(r'[0-9a-f]{64}')
+
+
+def send_image(digest, ext, size=None):
+    """Serve a stored file, or None if it does not exist.
+
+    Files never change, so the digest is a strong ETag and responses may be
+    cached for a year. send_file answers If-None-Match and Range requests and
+    hands the open file to the server's wsgi.file_wrapper (sendfile() under
+    gunicorn) instead of reading it into Python.
+    """
+    if not _DIGEST.fullmatch(digest) or ext not in CONTENT_TYPES:
+        return None
+    if size is not None and size not in VARIANT_SIZES:
+        return None
+    path = image_path(digest, ext, size)
+    final = True
+    if size is not None and not os.path.exists(path):
+        # Variant not generated yet: the original stands in, but must not
+        # be cached under this URL for good
+        path = image_path(digest, ext)
+        if not os.path.exists(path):
+            return None
+        thumbnailer.submit(digest, ext)
+        size, final = None, False
+    try:
+        response = send_file(os.path.abspath(path), mimetype=CONTENT_TYPES[ext], conditional=True,
+                             etag=digest if size is None else f'{digest}-{size}')
+    except FileNotFoundError:
+        return None
+    if final:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+class ImageFileResource(Resource):
+    def get(self, name, variant=None):
+        """An original (/images/<digest>.<ext>) or size variant (/images/<digest>/<size>.<ext>)"""
+        if variant is None:
+            digest, _, ext = name.partition('.')
+            response = send_image(digest, ext)
+        else:
+            size, _, ext = variant.partition('.')
+            response = send_image(name, ext, int(size)) if size.isdigit() else None
+        return response or ({'message': 'Image not found'}, 404)
+
+
+class ImagesResource(Resource):
+    def post(self):
+        """Upload a product image (multipart field 'image'); returns its URLs (admin only)"""
+        if not session.get('is_admin'):
+            return {'message': 'Admin access required'}, 403
+
+        if request.content_length and request.content_length > IMAGE_MAX_BYTES + 64 * 1024:
+            return {'message': f'Image too large (max {IMAGE_MAX_BYTES} bytes)'}, 413
+        upload = request.files.get('image')
+        if upload is None:
+            return {'message': 'image file is required'}, 400
+        data = upload.read(IMAGE_MAX_BYTES + 1)
+        if len(data) > IMAGE_MAX_BYTES:
+            return {'message': f'Image too large (max {IMAGE_MAX_BYTES} bytes)'}, 413
+
+        try:
+            digest, ext, width, height, created = store_image(data)
+        except RuntimeError as e:
+            return {'message': str(e)}, 501
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+        if missing_variants(digest, ext):
+            thumbnailer.submit(digest, ext)
+        return {
+            'success': True,
+            'hash': digest,
+            'url': image_url(digest, ext),
+            'variants': variant_urls(digest, ext),
+            'width': width,
+            'height': height,
+            'bytes': len(data),
+            'created': created,
+            'ready': not missing_variants(digest, ext)
+        }, 201 if created else 200
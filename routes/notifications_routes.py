@@ -1,7 +1,49 @@
 from flask import request, session
 from flask_restful import Resource
 from database.db_init import get_db_connection
+from database.store_shards import store_shards, get_user_db_connection
 import traceback
+from utils.fields import NOTIFICATION_FIELDS
+from utils.serialization import query_json
+
+def query_notifications(user_id, unread_only=False, limit=50, since_id=None, fields=None):
+    """A user's notifications, newest first, with the unread count.
+
+    since_id restricts the list to notifications newer than that id, which
+    lets pollers ask only for what they have not seen yet. `fields` is an
+    optional sparse fieldset of NOTIFICATION_FIELDS.
+    """
+    conn = get_user_db_connection(user_id)
+
+    where_clause = 'user_id = ?'
+    params = [user_id]
+
+    if unread_only:
+        where_clause += ' AND read = 0'
+
+    if since_id:
+        where_clause += ' AND id > ?'
+        params.append(since_id)
+
+    notifications, total = query_json(
+        conn,
+        f'SELECT {NOTIFICATION_FIELDS.sql(fields)} FROM notifications WHERE {where_clause} ORDER BY created_at DESC LIMIT ?',
+        params + [limit]
+    )
+
+    # Get unread count
+    unread_count = conn.execute(
+        'SELECT COUNT(*) FROM notifications WHERE user_id = ? AND read = 0',
+        (user_id,)
+    ).fetchone()[0]
+
+    conn.close()
+
+    return {
+        'notifications': notifications,
+        'unread_count': unread_count,
+        'total': total
+    }
 
 class NotificationsResource(Resource):
     def get(self, notification_id=None):
@@ -10,12 +52,18 @@ class NotificationsResource(Resource):
                 return {'message': 'Login required'}, 401
 
             user_id = session['user_id']
-            conn = get_db_connection()
+
+            try:
+                fields = NOTIFICATION_FIELDS.parse(request.args.get('fields'))
+            except ValueError as e:
+                return {'message': str(e)}, 400
 
             if notification_id:
+                conn = get_user_db_connection(user_id)
+
                 # Get specific notification
                 notification = conn.execute(
-                    'SELECT * FROM notifications WHERE id = ? AND user_id = ?',
+                    f'SELECT {NOTIFICATION_FIELDS.sql(fields)} FROM notifications WHERE id = ? AND user_id = ?',
                     (notification_id, user_id)
                 ).fetchone()
 
@@ -28,33 +76,13 @@ class NotificationsResource(Resource):
 
             else:
                 # Get all notifications for user
-                unread_only = request.args.get('unread_only', type=bool)
-                limit = request.args.get('limit', 50, type=int)
-
-                where_clause = 'user_id = ?'
-                params = [user_id]
-
-                if unread_only:
-                    where_clause += ' AND read = 0'
-
-                notifications = conn.execute(
-                    f'SELECT * FROM notifications WHERE {where_clause} ORDER BY created_at DESC LIMIT ?',
-                    params + [limit]
-                ).fetchall()
-
-                # Get unread count
-                unread_count = conn.execute(
-                    'SELECT COUNT(*) FROM notifications WHERE user_id = ? AND read = 0',
-                    (user_id,)
-                ).fetchone()[0]
-
-                conn.close()
-
-                return {
-                    'notifications': [dict(n) for n in notifications],
-                    'unread_count': unread_count,
-                    'total': len(notifications)
-                }
+                return query_notifications(
+                    user_id,
+                    unread_only=request.args.get('unread_only', type=bool),
+                    limit=request.args.get('limit', 50, type=int),
+                    since_id=request.args.get('since_id', type=int),
+                    fields=fields
+                )
 
         except Exception as e:
             print(f"Error in notifications GET: {e}")
@@ -82,7 +110,7 @@ class NotificationsResource(Resource):
             if not user_id or not title or not message:
                 return {'message': 'User ID, title, and message are required'}, 400
 
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
 
             cursor.execute(
@@ -125,7 +153,7 @@ class NotificationsResource(Resource):
 
             user_id = session['user_id']
 
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
 
             # Check if notification exists and belongs to user
@@ -165,22 +193,25 @@ class NotificationsResource(Resource):
 
             user_id = session['user_id']
 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
             # Check if notification exists and belongs to user (or admin)
             if session.get('is_admin'):
-                notification = cursor.execute('SELECT * FROM notifications WHERE id = ?', (notification_id,)).fetchone()
+                # Any user's notification: look in every shard
+                conn, notification = store_shards.locate('SELECT * FROM notifications WHERE id = ?',
+                                                         (notification_id,), write=True)
             else:
-                notification = cursor.execute(
+                conn = get_user_db_connection(user_id, write=True)
+                notification = conn.execute(
                     'SELECT * FROM notifications WHERE id = ? AND user_id = ?',
                     (notification_id, user_id)
                 ).fetchone()
 
             if not notification:
-                conn.close()
+                if conn:
+                    conn.close()
                 return {'message': 'Notification not found'}, 404
 
+            cursor = conn.cursor()
+
             cursor.execute('DELETE FROM notifications WHERE id = ?', (notification_id,))
             conn.commit()
             conn.close()
@@ -200,7 +231,7 @@ class NotificationsResource(Resource):
 def create_order_notification(user_id, order_id, total_amount):
     """Create notification when order is placed"""
     try:
-        conn = get_db_connection()
+        conn = get_user_db_connection(user_id, write=True)
         cursor = conn.cursor()
 
         cursor.execute(
@@ -221,19 +252,19 @@ def create_admin_notification(title, message):
     """Create notification for all admins"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-
         # Get all admin users
-        admins = cursor.execute('SELECT id FROM users WHERE is_admin = 1').fetchall()
+        admins = conn.execute('SELECT id FROM users WHERE is_admin = 1 AND deleted_at IS NULL').fetchall()
+        conn.close()
 
+        # Each admin's notification goes to that admin's shard
         for admin in admins:
-            cursor.execute(
+            conn = get_user_db_connection(admin['id'], write=True)
+            conn.execute(
                 'INSERT INTO notifications (user_id, title, message, type) VALUES (?, ?, ?, ?)',
                 (admin['id'], title, message, 'admin')
             )
-
-        conn.commit()
-        conn.close()
+            conn.commit()
+            conn.close()
         return True
     except Exception as e:
         print(f"Error creating admin notification: {e}")
@@ -1,10 +1,114 @@
-from flask import request, session
+from flask import g, request, session
 from flask_restful import Resource
-from database.db_init import get_db_connection, get_products_db_connection
+from database.db_init import get_products_db_connection
+from database.store_shards import store_shards, get_user_db_connection
+from database.catalog import bump_catalog_version
+from database.product_cache import get_products, invalidate_products
+from database.analytics import record_order_sales
+from database.stock_shards import sharded_stock, take_stock, restore_stock
+from database.wishlist_alerts import wishlist_alerter, out_of_stock_ids
+from database.recommendations import recommender
 import traceback
 from .notifications_routes import create_order_notification, create_admin_notification
+from utils.idempotency import idempotent
+from utils.fields import ORDER_FIELDS, ORDER_ITEM_FIELDS
+from utils.serialization import query_json, encode_rows
+from utils.images import image_url_for
+
+ORDERS_PER_PAGE = 20
+MAX_ORDERS_PER_PAGE = 100
+# Any of these selects the {orders, pagination} envelope; a bare GET /api/orders
+# keeps returning the legacy plain list of every order
+ORDER_LIST_PARAMS = ('page', 'per_page', 'status', 'include', 'envelope')
+
+
+def fetch_order_items(conn, order_ids, fields=None):
+    """Items for the given orders, grouped by order id.
+
+    Product details come from the snapshot columns written at checkout, so
+    this is a single query on the orders' store shard (conn), or on every
+    shard when conn is None; products.db is only consulted for rows the
+    snapshot backfill has not reached yet. `fields` is an optional sparse
+    fieldset of ORDER_ITEM_FIELDS.
+    """
+    if not order_ids:
+        return {}
+    placeholders = ','.join('?' * len(order_ids))
+    columns = ORDER_ITEM_FIELDS.sql(fields, extra=('order_id', 'product_id', 'product_name'))
+    query = f'SELECT {columns} FROM order_items WHERE order_id IN ({placeholders}) ORDER BY order_id, id'
+    if conn is None:
+        names, rows = store_shards.gather(query, list(order_ids))
+        items = [dict(zip(names, row)) for row in rows]
+    else:
+        items = [dict(item) for item in conn.execute(query, list(order_ids)).fetchall()]
+    
+    missing = [item for item in items if item['product_name'] is None]
+    products = get_products({item['product_id'] for item in missing}) if missing else {}
+    for item in missing:
+        product = products.get(item['product_id'])
+        if product:
+            item['product_name'] = product['name']
+            item['product_category'] = product['category']
+            item['product_brand'] = product['brand']
+            item['product_image'] = product['image_url']
+        else:
+            item['product_name'] = f'Product #{item["product_id"]} (Deleted)'
+            item['product_category'] = 'Unknown'
+            item['product_brand'] = 'Unknown'
+    
+    items_by_order = {}
+    for item in items:
+        item['name'] = item['product_name']  # For compatibility
+        if item.get('product_image'):
+            item['product_image'] = image_url_for(item['product_image'], 'thumb')
+        items_by_order.setdefault(item['order_id'], []).append(item if fields is None else fields.project(item))
+    return items_by_order
+
+
+def order_columns(fields):
+    """SELECT list and FROM clause for orders; users is only joined when username is wanted"""
+    columns = ORDER_FIELDS.sql(fields)
+    if fields is None or 'username' in fields.fields:
+        return columns, 'orders o JOIN users u ON o.user_id = u.id'
+    return columns, 'orders o'
+
+
+def checkout_response(order_id, total_amount, items_count):
+    return {
+        'success': True, 
+        'order_id': order_id, 
+        'total_amount': float(total_amount),
+        'message': 'Order placed successfully',
+        'items_count': items_count
+    }
+
+
+def give_back_shard_stock(order_id, shard_takes):
+    """Return units taken from stock shards by a checkout that did not commit"""
+    for product_id, taken in shard_takes:
+        sharded_stock.give_back(product_id, taken, order_id)
+    shard_takes.clear()
+
+
+def restore_order_stock(products_conn, order_items):
+    """Put an order's units back on the catalog or the shards; returns the product ids written in products.db"""
+    if not order_items:
+        return []
+    ids = [item['product_id'] for item in order_items]
+    placeholders = ','.join('?' * len(ids))
+    sharded = {row['id'] for row in products_conn.execute(
+        f'SELECT id FROM products WHERE id IN ({placeholders}) AND stock_sharded = 1', ids
+    )}
+    written = [item['product_id'] for item in order_items
+               if restore_stock(products_conn, item['product_id'], item['quantity'], item['product_id'] in sharded)]
+    if written:
+        bump_catalog_version(products_conn, written)
+    return written
+
 
 class OrdersResource(Resource):
+    method_decorators = {'post': [idempotent], 'put': [idempotent], 'delete': [idempotent]}
+
     def get(self, order_id=None):
         try:
             print(f"Orders GET - Session: {dict(session)}, order_id: {order_id}")
@@ -13,101 +117,76 @@ class OrdersResource(Resource):
                 print("No user_id in session for orders")
                 return {'message': 'Login required'}, 401
             
-            conn = get_db_connection()
-            products_conn = get_products_db_connection()
+            try:
+                fields = ORDER_FIELDS.parse(request.args.get('fields'))
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            columns, source = order_columns(fields)
+            conn = None
             
             if order_id:
                 # Get specific order with items - FIXED QUERY
                 if session.get('is_admin'):
-                    # Admin can view any order
-                    order = conn.execute('''
-                        SELECT o.*, u.username
-                        FROM orders o
-                        JOIN users u ON o.user_id = u.id
+                    # Admin can view any order, on whichever shard it lives
+                    conn, order = store_shards.locate(f'''
+                        SELECT {columns}
+                        FROM {source}
                         WHERE o.id = ?
-                    ''', (order_id,)).fetchone()
+                    ''', (order_id,))
                 else:
                     # Regular user can only view their own orders
-                    order = conn.execute('''
-                        SELECT o.*, u.username
-                        FROM orders o
-                        JOIN users u ON o.user_id = u.id
+                    conn = get_user_db_connection(session['user_id'])
+                    order = conn.execute(f'''
+                        SELECT {columns}
+                        FROM {source}
                         WHERE o.id = ? AND o.user_id = ?
                     ''', (order_id, session['user_id'])).fetchone()
                 
                 if not order:
-                    conn.close()
-                    products_conn.close()
+                    if conn:
+                        conn.close()
                     return {'message': 'Order not found'}, 404
                 
-                # Get order items with product details - FIXED to get from products database
-                print(f"Fetching order items for order {order_id}")
-                order_items = conn.execute('''
-                    SELECT oi.*, oi.product_id
-                    FROM order_items oi
-                    WHERE oi.order_id = ?
-                ''', (order_id,)).fetchall()
-                
-                print(f"Found {len(order_items)} order items")
-                
-                # Enhance order items with product details from products database
-                enhanced_items = []
-                for item in order_items:
-                    item_dict = dict(item)
-                    
-                    # Get product details from products database
-                    product = products_conn.execute(
-                        'SELECT name, description, category, brand FROM products WHERE id = ?',
-                        (item['product_id'],)
-                    ).fetchone()
-                    
-                    if product:
-                        item_dict['product_name'] = product['name']
-                        item_dict['name'] = product['name']  # For compatibility
-                        item_dict['product_category'] = product['category']
-                        item_dict['product_brand'] = product['brand']
-                        print(f"  - Found product: {product['name']}")
-                    else:
-                        item_dict['product_name'] = f'Product #{item["product_id"]} (Deleted)'
-                        item_dict['name'] = item_dict['product_name']
-                        item_dict['product_category'] = 'Unknown'
-                        item_dict['product_brand'] = 'Unknown'
-                        print(f"  - Product {item['product_id']} not found")
-                    
-                    enhanced_items.append(item_dict)
-                
-                conn.close()
-                products_conn.close()
-                
                 order_dict = dict(order)
-                order_dict['items'] = enhanced_items
+                if fields is None or fields.wants('items'):
+                    # Order items carry their own product snapshot, no products.db query
+                    print(f"Fetching order items for order {order_id}")
+                    item_fields = fields.embed('items') if fields else None
+                    order_dict['items'] = fetch_order_items(conn, [order_id], item_fields).get(order_id, [])
+                    print(f"Found {len(order_dict['items'])} order items")
                 
-                print(f"Returning order details with {len(enhanced_items)} items")
+                conn.close()
                 return order_dict
             
             else:
-                # Get all orders for user or admin
+                include = {part.strip() for part in request.args.get('include', '').split(',') if part.strip()}
+                # Asking for item fields implies include=items; a fieldset without them drops the embed
+                if fields is not None and fields.wants('items'):
+                    include.add('items')
+                if include or any(name in request.args for name in ORDER_LIST_PARAMS):
+                    include_items = 'items' in include and (fields is None or fields.wants('items'))
+                    return self._list_page(include_items, fields)
+                
+                # Legacy: all orders for user or admin as a plain list
                 if session.get('is_admin'):
                     print("Admin user - fetching all orders")
-                    orders = conn.execute('''
-                        SELECT o.*, u.username
-                        FROM orders o
-                        JOIN users u ON o.user_id = u.id
-                        ORDER BY o.created_at DESC
-                    ''').fetchall()
+                    names, rows = store_shards.gather(f'''
+                        SELECT o.created_at, o.id, {columns}
+                        FROM {source}
+                        ORDER BY o.created_at DESC, o.id DESC
+                    ''', sort_columns=2, descending=True)
+                    result, count = encode_rows(names, rows), len(rows)
                 else:
                     print(f"Regular user - fetching orders for user_id: {session['user_id']}")
-                    orders = conn.execute('''
-                        SELECT o.*, u.username
-                        FROM orders o
-                        JOIN users u ON o.user_id = u.id
+                    conn = get_user_db_connection(session['user_id'])
+                    result, count = query_json(conn, f'''
+                        SELECT {columns}
+                        FROM {source}
                         WHERE o.user_id = ? ORDER BY o.created_at DESC
-                    ''', (session['user_id'],)).fetchall()
+                    ''', (session['user_id'],))
+                    conn.close()
                 
-                conn.close()
-                products_conn.close()
-                result = [dict(order) for order in orders]
-                print(f"Found {len(result)} orders")
+                print(f"Found {count} orders")
                 return result
             
         except Exception as e:
@@ -115,11 +194,86 @@ class OrdersResource(Resource):
             print(f"Traceback: {traceback.format_exc()}")
             try:
                 conn.close()
-                products_conn.close()
             except:
                 pass
             return {'success': False, 'message': f'Server error: {str(e)}'}, 500
     
+    def _list_page(self, include_items, fields=None):
+        """One page of orders as {orders, pagination}, optionally with their items embedded.
+
+        Costs three queries (count, page, items) no matter how many orders
+        are on the page: on the user's store shard, or on every shard for
+        admins, where each shard returns up to page * per_page rows and the
+        newest are merged.
+        """
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', ORDERS_PER_PAGE, type=int), 1), MAX_ORDERS_PER_PAGE)
+        
+        where, params = [], []
+        if not session.get('is_admin'):
+            where.append('o.user_id = ?')
+            params.append(session['user_id'])
+        status = request.args.get('status')
+        if status:
+            where.append('o.status = ?')
+            params.append(status)
+        where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+        
+        columns, source = order_columns(fields)
+        offset = (page - 1) * per_page
+        item_fields = fields.embed('items') if fields else None
+        
+        if session.get('is_admin'):
+            total = store_shards.total(f'SELECT COUNT(*) FROM orders o {where_clause}', params)
+            names, rows = store_shards.gather(f'''
+                SELECT o.created_at, o.id, {columns}
+                FROM {source}
+                {where_clause}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT ?
+            ''', params + [offset + per_page], sort_columns=2, descending=True, limit=per_page, offset=offset)
+            if include_items:
+                orders = [dict(zip(names, row)) for row in rows]
+                items_by_order = fetch_order_items(None, [order['id'] for order in orders], item_fields)
+                for order in orders:
+                    order['items'] = items_by_order.get(order['id'], [])
+            else:
+                orders = encode_rows(names, rows)
+            count = len(rows)
+        else:
+            conn = get_user_db_connection(session['user_id'])
+            total = conn.execute(f'SELECT COUNT(*) FROM orders o {where_clause}', params).fetchone()[0]
+            query = f'''
+                SELECT {columns}
+                FROM {source}
+                {where_clause}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT ? OFFSET ?
+            '''
+            params += [per_page, offset]
+            
+            if include_items:
+                orders = [dict(order) for order in conn.execute(query, params).fetchall()]
+                items_by_order = fetch_order_items(conn, [order['id'] for order in orders], item_fields)
+                for order in orders:
+                    order['items'] = items_by_order.get(order['id'], [])
+                count = len(orders)
+            else:
+                # Without embeds the rows go straight to JSON
+                orders, count = query_json(conn, query, params)
+            conn.close()
+        
+        print(f"Returning page {page} with {count} of {total} orders")
+        return {
+            'orders': orders,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
+        }
+    
     def post(self):
         try:
             print(f"=== STARTING CHECKOUT PROCESS ===")
@@ -130,14 +284,32 @@ class OrdersResource(Resource):
                 return {'success': False, 'message': 'Login required'}, 401
             
             user_id = session['user_id']
+            idempotency_key = g.get('idempotency_key')
             print(f"Processing order for user_id: {user_id}")
             
             # Connect to both databases
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             products_conn = get_products_db_connection()
             cursor = conn.cursor()
+            shard_takes = []  # (product_id, takes) to give back if the order fails
+            order_id = None
             
             try:
+                # A retry whose first attempt placed the order but died before
+                # its response was stored: answer for that order, do not place
+                # another (the shard's write lock keeps this check and the
+                # insert below together)
+                if idempotency_key:
+                    placed = conn.execute(
+                        'SELECT id, total_amount FROM orders WHERE user_id = ? AND idempotency_key = ?',
+                        (user_id, idempotency_key)
+                    ).fetchone()
+                    if placed:
+                        items_count = conn.execute(
+                            'SELECT COUNT(*) FROM order_items WHERE order_id = ?', (placed['id'],)
+                        ).fetchone()[0]
+                        return checkout_response(placed['id'], placed['total_amount'], items_count), 200
+                
                 # Get cart items with detailed logging
                 print("Fetching cart items with products...")
                 cart_items = conn.execute('''
@@ -152,25 +324,25 @@ class OrdersResource(Resource):
                     print("ERROR: Cart is empty - cannot checkout")
                     return {'success': False, 'message': 'Cart is empty'}, 400
                 
-                # Get product details and validate
+                # Get product details and validate. Stock must be
+                # authoritative here, so this bypasses the product cache.
+                products = get_products(
+                    (cart_item['product_id'] for cart_item in cart_items),
+                    conn=products_conn, fresh=True
+                )
                 validated_items = []
                 total_amount = 0
                 
                 for cart_item in cart_items:
                     print(f"Processing cart item: {dict(cart_item)}")
                     
-                    # Get product details from products database
-                    product = products_conn.execute(
-                        'SELECT * FROM products WHERE id = ?',
-                        (cart_item['product_id'],)
-                    ).fetchone()
+                    product_dict = products.get(cart_item['product_id'])
                     
-                    if not product:
+                    if not product_dict:
                         conn.close()
                         products_conn.close()
                         return {'success': False, 'message': f'Product {cart_item["product_id"]} not found'}, 400
                     
-                    product_dict = dict(product)
                     print(f"Product details: {product_dict['name']} - Price: ${product_dict['price']} - Stock: {product_dict['stock']}")
                     
                     # Validate stock
@@ -191,6 +363,10 @@ class OrdersResource(Resource):
                         'quantity': cart_item['quantity'],
                         'price': product_dict['price'],
                         'name': product_dict['name'],
+                        'category': product_dict['category'],
+                        'brand': product_dict['brand'],
+                        'image_url': product_dict['image_url'],
+                        'stock_sharded': product_dict.get('stock_sharded'),
                         'subtotal': item_total
                     })
                     
@@ -202,29 +378,47 @@ class OrdersResource(Resource):
                 # Create order
                 print("Creating order record...")
                 cursor.execute(
-                    'INSERT INTO orders (user_id, total_amount, status, created_at) VALUES (?, ?, ?, datetime("now"))',
-                    (user_id, total_amount, 'pending')
+                    'INSERT INTO orders (user_id, total_amount, status, created_at, idempotency_key) '
+                    'VALUES (?, ?, ?, datetime("now"), ?)',
+                    (user_id, total_amount, 'pending', idempotency_key)
                 )
                 order_id = cursor.lastrowid
                 print(f"Order created with ID: {order_id}")
                 
                 # Process each validated item
                 print("Processing order items and updating stock...")
+                catalog_stock_ids = []
                 for item in validated_items:
-                    # Add to order_items table
+                    # Add to order_items table with a snapshot of the product as sold
                     cursor.execute('''
-                        INSERT INTO order_items (order_id, product_id, quantity, price)
-                        VALUES (?, ?, ?, ?)
-                    ''', (order_id, item['product_id'], item['quantity'], item['price']))
+                        INSERT INTO order_items (order_id, product_id, quantity, price,
+                                                 product_name, product_category, product_brand, product_image)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (order_id, item['product_id'], item['quantity'], item['price'],
+                          item['name'], item['category'], item['brand'], item['image_url']))
                     
-                    # Update product stock in products database
-                    products_conn.execute(
-                        'UPDATE products SET stock = stock - ?, updated_at = datetime("now") WHERE id = ?',
-                        (item['quantity'], item['product_id'])
-                    )
+                    # Update product stock in products database, or in the
+                    # stock shards for hot products
+                    taken = take_stock(products_conn, item['product_id'], item['quantity'],
+                                       item['stock_sharded'], order_id)
+                    if taken is None:
+                        conn.rollback()
+                        products_conn.rollback()
+                        give_back_shard_stock(order_id, shard_takes)
+                        error_msg = f'Insufficient stock for {item["name"]}'
+                        print(f"ERROR: {error_msg}")
+                        return {'success': False, 'message': error_msg}, 400
+                    if taken:
+                        shard_takes.append((item['product_id'], taken))
+                    else:
+                        catalog_stock_ids.append(item['product_id'])
                     
                     print(f"Added {item['name']} to order items and reduced stock by {item['quantity']}")
                 
+                if catalog_stock_ids:
+                    bump_catalog_version(products_conn, catalog_stock_ids)
+                record_order_sales(conn, order_id)
+                
                 # Clear user's cart
                 print("Clearing user's cart...")
                 cursor.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
@@ -233,6 +427,12 @@ class OrdersResource(Resource):
                 print("Committing all database changes...")
                 conn.commit()
                 products_conn.commit()
+                # The order is in: its shard takes are sold, not pending
+                settled, shard_takes = shard_takes, []
+                for product_id, taken in settled:
+                    sharded_stock.settle(order_id, taken)
+                invalidate_products(catalog_stock_ids)
+                recommender.wake()
                 
                 print(f"=== ORDER {order_id} COMPLETED SUCCESSFULLY ===")
                 print(f"Total amount: ${total_amount}")
@@ -245,15 +445,12 @@ class OrdersResource(Resource):
                     f'Order #{order_id} placed by user {user_id}. Total: ${total_amount:.2f}'
                 )
                 
-                return {
-                    'success': True, 
-                    'order_id': order_id, 
-                    'total_amount': float(total_amount),
-                    'message': 'Order placed successfully',
-                    'items_count': len(validated_items)
-                }, 200
+                return checkout_response(order_id, total_amount, len(validated_items)), 200
                 
             finally:
+                # Shard decrements are outside the transactions; undo them by
+                # hand (the reconciler does it if this process dies first)
+                give_back_shard_stock(order_id, shard_takes)
                 # Always close database connections
                 products_conn.close()
                 conn.close()
@@ -280,26 +477,26 @@ class OrdersResource(Resource):
             if not data:
                 return {'message': 'No data provided'}, 400
             
-            conn = get_db_connection()
             products_conn = get_products_db_connection()
-            cursor = conn.cursor()
             
             # Check if order exists and get current status
             if session.get('is_admin'):
-                order = cursor.execute(
-                    'SELECT * FROM orders WHERE id = ?', (order_id,)
-                ).fetchone()
+                conn, order = store_shards.locate('SELECT * FROM orders WHERE id = ?', (order_id,), write=True)
             else:
-                order = cursor.execute(
+                conn = get_user_db_connection(session['user_id'], write=True)
+                order = conn.execute(
                     'SELECT * FROM orders WHERE id = ? AND user_id = ?', 
                     (order_id, session['user_id'])
                 ).fetchone()
             
             if not order:
-                conn.close()
+                if conn:
+                    conn.close()
                 products_conn.close()
                 return {'message': 'Order not found'}, 404
             
+            cursor = conn.cursor()
+            
             # Handle different update scenarios
             if session.get('is_admin'):
                 # Admin can update status
@@ -309,6 +506,11 @@ class OrdersResource(Resource):
                         'UPDATE orders SET status = ? WHERE id = ?',
                         (new_status, order_id)
                     )
+                    # Sales rollups only count orders that are not cancelled
+                    if order['status'] != 'cancelled' and new_status == 'cancelled':
+                        record_order_sales(conn, order_id, -1)
+                    elif order['status'] == 'cancelled' and new_status != 'cancelled':
+                        record_order_sales(conn, order_id, +1)
                     conn.commit()
                     conn.close()
                     products_conn.close()
@@ -325,6 +527,7 @@ class OrdersResource(Resource):
                     'UPDATE orders SET status = ? WHERE id = ?',
                     ('cancelled', order_id)
                 )
+                record_order_sales(conn, order_id, -1)
                 
                 # Restore stock for cancelled items
                 order_items = cursor.execute(
@@ -332,16 +535,15 @@ class OrdersResource(Resource):
                     (order_id,)
                 ).fetchall()
                 
-                for item in order_items:
-                    products_conn.execute(
-                        'UPDATE products SET stock = stock + ? WHERE id = ?',
-                        (item['quantity'], item['product_id'])
-                    )
+                sold_out = out_of_stock_ids(products_conn, [item['product_id'] for item in order_items])
+                restored_ids = restore_order_stock(products_conn, order_items)
                 
                 conn.commit()
                 products_conn.commit()
                 conn.close()
                 products_conn.close()
+                invalidate_products(restored_ids)
+                wishlist_alerter.back_in_stock(sold_out)
                 return {'success': True, 'message': 'Order cancelled successfully'}
             
             conn.close()
@@ -365,29 +567,29 @@ class OrdersResource(Resource):
             if not session.get('user_id'):
                 return {'message': 'Login required'}, 401
             
-            conn = get_db_connection()
             products_conn = get_products_db_connection()
-            cursor = conn.cursor()
             
             # Check if order exists and permissions
             if session.get('is_admin'):
-                order = cursor.execute(
-                    'SELECT * FROM orders WHERE id = ?', (order_id,)
-                ).fetchone()
+                conn, order = store_shards.locate('SELECT * FROM orders WHERE id = ?', (order_id,), write=True)
             else:
-                order = cursor.execute(
+                conn = get_user_db_connection(session['user_id'], write=True)
+                order = conn.execute(
                     'SELECT * FROM orders WHERE id = ? AND user_id = ? AND status = ?', 
                     (order_id, session['user_id'], 'pending')
                 ).fetchone()
             
             if not order:
-                conn.close()
+                if conn:
+                    conn.close()
                 products_conn.close()
                 if session.get('is_admin'):
                     return {'message': 'Order not found'}, 404
                 else:
                     return {'message': 'Order not found or cannot be cancelled'}, 404
             
+            cursor = conn.cursor()
+            
             # Get order items to restore stock
             order_items = cursor.execute(
                 'SELECT product_id, quantity FROM order_items WHERE order_id = ?',
@@ -395,11 +597,11 @@ class OrdersResource(Resource):
             ).fetchall()
             
             # Restore stock
-            for item in order_items:
-                products_conn.execute(
-                    'UPDATE products SET stock = stock + ? WHERE id = ?',
-                    (item['quantity'], item['product_id'])
-                )
+            sold_out = out_of_stock_ids(products_conn, [item['product_id'] for item in order_items])
+            restored_ids = restore_order_stock(products_conn, order_items)
+            
+            if order['status'] != 'cancelled':
+                record_order_sales(conn, order_id, -1)
             
             if session.get('is_admin'):
                 # Admin can fully delete the order
@@ -416,6 +618,8 @@ class OrdersResource(Resource):
             products_conn.commit()
             conn.close()
             products_conn.close()
+            invalidate_products(restored_ids)
+            wishlist_alerter.back_in_stock(sold_out)
             
             return {'success': True, 'message': 'Order cancelled successfully'}
             
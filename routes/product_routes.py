@@ -1,116 +1,250 @@
 from flask import request, jsonify, session
 from flask_restful import Resource
-from database.db_init import get_products_db_connection
+from database.db_init import get_db_connection, get_products_db_connection
+from database.deletion import queue_deletion, deletion_reaper
+from database.wishlist_alerts import wishlist_alerter
+from database.recommendations import recommender, RELATED_TOP_K
+from database.tags import parse_tag_filter, tag_filter_sql, tag_facets, similar_products
+from database.suggest import suggester, SUGGEST_LIMIT
+from database.catalog import NOW_MS, bump_catalog_version, get_catalog_version
+from database.product_cache import get_product, get_products, invalidate_products
+from database.listing_cache import listing_cache
+from database.stock_shards import (sharded_stock, apply_sharded_stock, catalog_has_sharded_stock,
+                                   enable_sharding, disable_sharding)
+from utils.fields import PRODUCT_FIELDS
+from utils.serialization import RawJSON, encode_rows
+from utils.images import image_url_for, with_image_for, canonical_image_url
+from utils.http_cache import make_etag, parse_db_timestamp, cache_headers, is_not_modified, not_modified
+
+# Sort options accepted by the listing endpoint
+LISTING_ORDER_CLAUSES = {
+    'name': 'ORDER BY name ASC',
+    'price_asc': 'ORDER BY price ASC',
+    'price_desc': 'ORDER BY price DESC',
+    'newest': 'ORDER BY created_at DESC',
+    'featured': 'ORDER BY featured DESC, name ASC'
+}
+
+def parse_listing_args(args=None):
+    """Normalize listing query parameters into a hashable tuple.
+
+    Equivalent requests (different parameter order, unknown sort values,
+    out-of-range per_page) map to the same tuple, which is used both as the
+    response cache key and as part of the listing ETag. `args` defaults to
+    the current Flask request's query string. Raises ValueError for unknown
+    ?fields= names.
+    """
+    if args is None:
+        args = request.args
+    sort_by = args.get('sort', 'name')  # name, price_asc, price_desc, newest
+    if sort_by not in LISTING_ORDER_CLAUSES:
+        sort_by = 'name'
+    
+    per_page = args.get('per_page', 12, type=int)
+    if per_page > 50:  # Limit max per page
+        per_page = 50
+    
+    return (
+        ('search', args.get('search', '').strip()),
+        ('category', args.get('category', '').strip()),
+        ('brand', args.get('brand', '').strip()),
+        ('min_price', args.get('min_price', type=float)),
+        ('max_price', args.get('max_price', type=float)),
+        ('featured', args.get('featured', type=bool)),
+        ('tag', parse_tag_filter(args.getlist('tag'))),
+        ('sort', sort_by),
+        ('page', args.get('page', 1, type=int)),
+        ('per_page', per_page),
+        ('fields', PRODUCT_FIELDS.parse(args.get('fields'))),
+    )
+
+def query_product_listing(listing_args):
+    """Run the listing, count and facet queries for normalized listing args"""
+    args = dict(listing_args)
+    page = args['page']
+    per_page = args['per_page']
+    offset = (page - 1) * per_page
+    
+    # Build dynamic query
+    where_conditions = []
+    params = []
+    
+    if args['search']:
+        where_conditions.append('''
+            (name LIKE ? OR description LIKE ? OR category LIKE ? OR brand LIKE ? OR tags LIKE ?)
+        ''')
+        search_param = f'%{args["search"]}%'
+        params.extend([search_param] * 5)
+    
+    if args['category']:
+        where_conditions.append('category = ?')
+        params.append(args['category'])
+        
+    if args['brand']:
+        where_conditions.append('brand = ?')
+        params.append(args['brand'])
+        
+    if args['min_price'] is not None:
+        where_conditions.append('price >= ?')
+        params.append(args['min_price'])
+        
+    if args['max_price'] is not None:
+        where_conditions.append('price <= ?')
+        params.append(args['max_price'])
+        
+    if args['featured'] is not None:
+        where_conditions.append('featured = ?')
+        params.append(1 if args['featured'] else 0)
+    
+    # Tag groups are ANDed, tags within a group ORed; each is an index lookup
+    tag_conditions, tag_params = tag_filter_sql(args['tag'])
+    where_conditions.extend(tag_conditions)
+    params.extend(tag_params)
+    
+    # Build WHERE clause
+    where_clause = ''
+    if where_conditions:
+        where_clause = 'WHERE ' + ' AND '.join(where_conditions)
+    
+    order_clause = LISTING_ORDER_CLAUSES[args['sort']]
+    
+    conn = get_products_db_connection()
+    
+    # Only the requested columns are read, plus stock_sharded at the end so
+    # pages with hot products can get live stock in with_live_stock()
+    columns = PRODUCT_FIELDS.sql(args['fields'])
+    
+    # Execute query with pagination
+    query = f'SELECT {columns}, stock_sharded FROM products {where_clause} {order_clause} LIMIT ? OFFSET ?'
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(query, params + [per_page, offset]).fetchall()
+    names = [column[0] for column in cursor.description[:-1]]
+    
+    # Product cards show the card-sized variant of stored images
+    if 'image_url' in names:
+        at = names.index('image_url')
+        rows = [row[:at] + (image_url_for(row[at], 'card'),) + row[at + 1:] for row in rows]
+    
+    # The page is cached already encoded; only pages with sharded products
+    # stay dicts so the shard totals can be applied on every read
+    if any(row[-1] for row in rows):
+        products = [dict(zip(names, row[:-1]), stock_sharded=row[-1]) for row in rows]
+    else:
+        products = encode_rows(names, [row[:-1] for row in rows])
+    
+    # Get total count for pagination
+    count_query = f'SELECT COUNT(*) FROM products {where_clause}'
+    total_products = conn.execute(count_query, params).fetchone()[0]
+    
+    # Get filter options for frontend
+    categories = conn.execute('SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category').fetchall()
+    brands = conn.execute('SELECT DISTINCT brand FROM products WHERE brand IS NOT NULL ORDER BY brand').fetchall()
+    # Tag counts are narrowed to the current result set
+    tags = tag_facets(conn, where_clause, params)
+    
+    conn.close()
+    
+    return {
+        'products': products,
+        'filters': {
+            'categories': [cat['category'] for cat in categories],
+            'brands': [brand['brand'] for brand in brands],
+            'tags': tags
+        },
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total': total_products,
+            'total_pages': (total_products + per_page - 1) // per_page  # Ceiling division
+        }
+    }
+
+def with_live_stock(listing, fields=None):
+    """(listing, stock stamp): the listing with live stock for sharded products
+    (cached results stay untouched), and the ((id, stock), ...) it shows.
+    
+    The stamp only covers sharded products on this page whose stock is in
+    the response, so a checkout of a hot product changes the validators of
+    the pages showing it and no others. With a sparse fieldset,
+    stock_sharded was only read to find sharded products and is removed
+    unless it was asked for.
+    """
+    if isinstance(listing['products'], RawJSON):
+        return listing, ()  # no sharded products on this page
+    products = [dict(product) for product in listing['products']]
+    stamp = ()
+    if fields is None or 'stock' in fields.fields:
+        sharded = apply_sharded_stock([product for product in products if product['stock_sharded']])
+        stamp = tuple((product['id'], product['stock']) for product in sharded)
+    if fields is not None and 'stock_sharded' not in fields.fields:
+        for product in products:
+            del product['stock_sharded']
+    return dict(listing, products=products), stamp
+
+def stock_affects_listing(version, fields=None):
+    """True if live shard stock can change a listing's validators at this version"""
+    if fields is not None and 'stock' not in fields.fields:
+        return False
+    return catalog_has_sharded_stock(version)
+
+def listing_validators(version, version_updated_at, listing_args, stamp):
+    """(etag, last_modified) of a listing page; stamp is from with_live_stock().
+    
+    Sharded stock changes without bumping the catalog version, so a page
+    showing it has no Last-Modified: If-Modified-Since would 304 with stale
+    stock, and only the ETag can tell.
+    """
+    etag = make_etag('products', version, listing_args, stamp)
+    return etag, None if stamp else parse_db_timestamp(version_updated_at)
 
 class ProductsResource(Resource):
     def options(self, product_id=None):
         return jsonify({'status': 'OK'})
     
     def get(self, product_id=None):
-        conn = get_products_db_connection()
+        try:
+            fields = PRODUCT_FIELDS.parse(request.args.get('fields'))
+        except ValueError as e:
+            return {'message': str(e)}, 400
         
         if product_id:
-            product = conn.execute(
-                'SELECT * FROM products WHERE id = ?', (product_id,)
-            ).fetchone()
-            conn.close()
+            product = get_product(product_id)
             
             if product:
-                return dict(product)
+                # Validators derive from updated_at, which every write bumps;
+                # sharded stock changes without it, so stock is part of the tag
+                last_modified = parse_db_timestamp(product['updated_at'])
+                etag = make_etag('product', product['id'], product['updated_at'], product['stock'])
+                headers = cache_headers(etag, last_modified)
+                if is_not_modified(etag, last_modified):
+                    return not_modified(headers)
+                product = with_image_for(product, 'detail')
+                # Rows are cached whole, so a single product is trimmed after the lookup
+                if fields is not None:
+                    product = fields.project(product)
+                return product, 200, headers
             return {'message': 'Product not found'}, 404
         
-        # Handle search parameters
-        search_query = request.args.get('search', '').strip()
-        category = request.args.get('category', '').strip()
-        brand = request.args.get('brand', '').strip()
-        min_price = request.args.get('min_price', type=float)
-        max_price = request.args.get('max_price', type=float)
-        featured = request.args.get('featured', type=bool)
-        sort_by = request.args.get('sort', 'name')  # name, price_asc, price_desc, newest
-        
-        # Pagination parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 12, type=int)
-        if per_page > 50:  # Limit max per page
-            per_page = 50
-        offset = (page - 1) * per_page
-        
-        # Build dynamic query
-        where_conditions = []
-        params = []
-        
-        if search_query:
-            where_conditions.append('''
-                (name LIKE ? OR description LIKE ? OR category LIKE ? OR brand LIKE ? OR tags LIKE ?)
-            ''')
-            search_param = f'%{search_query}%'
-            params.extend([search_param] * 5)
-        
-        if category:
-            where_conditions.append('category = ?')
-            params.append(category)
-            
-        if brand:
-            where_conditions.append('brand = ?')
-            params.append(brand)
-            
-        if min_price is not None:
-            where_conditions.append('price >= ?')
-            params.append(min_price)
-            
-        if max_price is not None:
-            where_conditions.append('price <= ?')
-            params.append(max_price)
-            
-        if featured is not None:
-            where_conditions.append('featured = ?')
-            params.append(1 if featured else 0)
-        
-        # Build WHERE clause
-        where_clause = ''
-        if where_conditions:
-            where_clause = 'WHERE ' + ' AND '.join(where_conditions)
-        
-        # Build ORDER BY clause
-        order_clause = {
-            'name': 'ORDER BY name ASC',
-            'price_asc': 'ORDER BY price ASC',
-            'price_desc': 'ORDER BY price DESC',
-            'newest': 'ORDER BY created_at DESC',
-            'featured': 'ORDER BY featured DESC, name ASC'
-        }.get(sort_by, 'ORDER BY name ASC')
-        
-        # Execute query with pagination
-        query = f'SELECT * FROM products {where_clause} {order_clause} LIMIT ? OFFSET ?'
-        params.append(per_page)
-        params.append(offset)
-        products = conn.execute(query, params).fetchall()
-        
-        # Get total count for pagination
-        count_query = f'SELECT COUNT(*) FROM products {where_clause}'
-        total_products = conn.execute(count_query, params[:-2]).fetchone()[0]  # Remove LIMIT and OFFSET params
-        
-        # Get filter options for frontend
-        categories = conn.execute('SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category').fetchall()
-        brands = conn.execute('SELECT DISTINCT brand FROM products WHERE brand IS NOT NULL ORDER BY brand').fetchall()
-        
-        conn.close()
-        
-        result = {
-            'products': [dict(product) for product in products],
-            'filters': {
-                'categories': [cat['category'] for cat in categories],
-                'brands': [brand['brand'] for brand in brands]
-            },
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total_products,
-                'total_pages': (total_products + per_page - 1) // per_page  # Ceiling division
-            }
-        }
-        
-        return result
+        listing_args = parse_listing_args()
+        
+        # Listings are validated against the catalog-wide version counter, so
+        # a revalidation is one lookup without the listing queries. Only when
+        # sharded stock can show does the tag need the page's live stock.
+        version, version_updated_at = get_catalog_version()
+        if not stock_affects_listing(version, fields):
+            etag, last_modified = listing_validators(version, version_updated_at, listing_args, ())
+            if is_not_modified(etag, last_modified):
+                return not_modified(cache_headers(etag, last_modified))
+        result = listing_cache.get_or_compute(
+            version, listing_args, lambda: query_product_listing(listing_args)
+        )
+        listing, stamp = with_live_stock(result, fields)
+        etag, last_modified = listing_validators(version, version_updated_at, listing_args, stamp)
+        headers = cache_headers(etag, last_modified)
+        if is_not_modified(etag, last_modified):
+            return not_modified(headers)
+        return listing, 200, headers
     
     def post(self):
         if not session.get('is_admin'):
@@ -129,9 +263,9 @@ class ProductsResource(Resource):
         conn = get_products_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        cursor.execute(f'''
             INSERT INTO products (name, description, price, stock, category, brand, tags, image_url, featured, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {NOW_MS})
         ''', (
             data['name'],
             data.get('description', ''),
@@ -140,13 +274,15 @@ class ProductsResource(Resource):
             data.get('category', ''),
             data.get('brand', ''),
             data.get('tags', ''),
-            data.get('image_url', ''),
+            canonical_image_url(data.get('image_url', '')),
             data.get('featured', 0)
         ))
         
         product_id = cursor.lastrowid
+        bump_catalog_version(conn, [product_id])
         conn.commit()
         conn.close()
+        invalidate_products([product_id])
         
         return {'success': True, 'id': product_id, 'message': 'Product created successfully'}
     
@@ -162,10 +298,15 @@ class ProductsResource(Resource):
         cursor = conn.cursor()
         
         # Check if product exists
-        existing = cursor.execute('SELECT id FROM products WHERE id = ?', (product_id,)).fetchone()
+        existing = cursor.execute(
+            'SELECT id, price, stock, stock_sharded FROM products WHERE id = ?', (product_id,)
+        ).fetchone()
         if not existing:
             conn.close()
             return {'message': 'Product not found'}, 404
+        old_stock = existing['stock']
+        if existing['stock_sharded']:
+            old_stock = sharded_stock.totals([product_id]).get(product_id, 0)
         
         # Build update query dynamically
         update_fields = []
@@ -175,21 +316,40 @@ class ProductsResource(Resource):
         for field in updatable_fields:
             if field in data:
                 update_fields.append(f'{field} = ?')
-                update_values.append(data[field])
+                # The admin form sends back the variant URL it was shown
+                update_values.append(canonical_image_url(data[field]) if field == 'image_url' else data[field])
         
-        if not update_fields:
+        if not update_fields and 'stock_sharded' not in data:
             conn.close()
             return {'message': 'No valid fields to update'}, 400
         
-        update_fields.append('updated_at = datetime("now")')
+        update_fields.append(f'updated_at = {NOW_MS}')
         update_values.append(product_id)
         
         cursor.execute(
             f'UPDATE products SET {", ".join(update_fields)} WHERE id = ?',
             update_values
         )
-        conn.commit()
+        
+        # Hot products keep their stock in the shards; a new stock level
+        # replaces what the shards hold
+        if existing['stock_sharded'] and 'stock' in data:
+            sharded_stock.distribute(product_id, data['stock'])
+        if data.get('stock_sharded'):
+            enable_sharding(conn, product_id)
+        bump_catalog_version(conn, [product_id])
+        if 'stock_sharded' in data and not data['stock_sharded']:
+            disable_sharding(conn, product_id)  # commits, with the shards locked
+        else:
+            conn.commit()
         conn.close()
+        invalidate_products([product_id])
+        
+        # Wishlist price-drop / back-in-stock notifications go out in the background
+        if 'price' in data:
+            wishlist_alerter.price_changed(product_id, existing['price'], data['price'])
+        if 'stock' in data:
+            wishlist_alerter.stock_changed(product_id, old_stock, data['stock'])
         
         return {'success': True, 'message': 'Product updated successfully'}
     
@@ -201,13 +361,64 @@ class ProductsResource(Resource):
         cursor = conn.cursor()
         
         # Check if product exists
-        existing = cursor.execute('SELECT id FROM products WHERE id = ?', (product_id,)).fetchone()
+        existing = cursor.execute('SELECT id, stock_sharded FROM products WHERE id = ?', (product_id,)).fetchone()
         if not existing:
             conn.close()
             return {'message': 'Product not found'}, 404
         
         cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
+        if existing['stock_sharded']:
+            sharded_stock.remove(product_id)
+        bump_catalog_version(conn, [product_id])
         conn.commit()
         conn.close()
+        invalidate_products([product_id])
+        
+        # Cart, wishlist and review rows in store.db are reaped in the background
+        store_conn = get_db_connection()
+        job_id = queue_deletion(store_conn, 'product', product_id)
+        store_conn.commit()
+        store_conn.close()
+        deletion_reaper.wake()
         
-        return {'success': True, 'message': 'Product deleted successfully'}
\ No newline at end of file
+        return {'success': True, 'message': 'Product deleted successfully', 'deletion_job': job_id}
+
+class RelatedProductsResource(Resource):
+    def get(self, product_id):
+        """Products most often bought together with this one"""
+        limit = min(max(request.args.get('limit', RELATED_TOP_K, type=int), 1), RELATED_TOP_K)
+        try:
+            related = recommender.related(product_id)
+        except RuntimeError as e:
+            return {'message': str(e)}, 501
+        # Deleted products linger in the table until the next full build
+        products = get_products(other_id for other_id, _ in related)
+        items = []
+        for other_id, score in related:
+            product = products.get(other_id)
+            if product:
+                items.append(dict(with_image_for(product, 'card'), score=round(score, 4)))
+        return {'product_id': product_id, 'related': items[:limit], 'ready': recommender.ready}
+
+
+class SimilarProductsResource(Resource):
+    def get(self, product_id):
+        """Products with the most tags in common (Jaccard similarity of tag sets)"""
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        similar = similar_products(product_id, limit)
+        products = get_products(other_id for other_id, _ in similar)
+        items = [dict(with_image_for(products[other_id], 'card'), similarity=round(score, 4))
+                 for other_id, score in similar if other_id in products]
+        return {'product_id': product_id, 'similar': items}
+
+
+class SuggestResource(Resource):
+    def get(self):
+        """Search-box suggestions for a prefix: popular products plus matching brands, categories and tags"""
+        query = request.args.get('q', '')
+        limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), 20)
+        try:
+            result = suggester.suggest(query, limit)
+        except RuntimeError as e:
+            return {'message': str(e)}, 501
+        return dict(result, query=query)
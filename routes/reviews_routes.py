@@ -1,24 +1,71 @@
 from flask import request, session
 from flask_restful import Resource
-from database.db_init import get_db_connection
+from database.store_shards import store_shards, get_user_db_connection
 import traceback
+from utils.idempotency import idempotent
+from utils.fields import REVIEW_FIELDS
+from utils.serialization import encode_rows
+
+def review_columns(fields):
+    """SELECT list and FROM clause for reviews; users is only joined when username is wanted"""
+    columns = REVIEW_FIELDS.sql(fields)
+    if fields is None or 'username' in fields.fields:
+        return columns, 'reviews r JOIN users u ON r.user_id = u.id'
+    return columns, 'reviews r'
+
+def gather_reviews(fields, where='', params=()):
+    """(RawJSON array, count) of reviews from every store shard, newest first"""
+    columns, source = review_columns(fields)
+    names, rows = store_shards.gather(
+        f'SELECT r.created_at, r.id, {columns} FROM {source} {where} ORDER BY r.created_at DESC, r.id DESC',
+        params, sort_columns=2, descending=True
+    )
+    return encode_rows(names, rows), len(rows)
+
+def query_product_reviews(product_id, fields=None):
+    """Reviews for one product with the average rating, as returned by GET /api/reviews?product_id="""
+    # Reviewers are spread over the store shards
+    reviews, total = gather_reviews(fields, 'WHERE r.product_id = ?', (product_id,))
+
+    # Calculate average rating
+    _, sums = store_shards.gather(
+        'SELECT SUM(rating), COUNT(*) FROM reviews WHERE product_id = ?', (product_id,)
+    )
+    rating_sum = sum(row[0] or 0 for row in sums)
+    total_reviews = sum(row[1] for row in sums)
+
+    result = {
+        'reviews': reviews,
+        'total': total
+    }
+
+    if total_reviews > 0:
+        result['average_rating'] = round(rating_sum / total_reviews, 1)
+        result['total_reviews'] = total_reviews
+
+    return result
 
 class ReviewsResource(Resource):
+    method_decorators = {'post': [idempotent]}
+
     def get(self, review_id=None):
         try:
             print(f"Reviews GET - Session: {dict(session)}, review_id: {review_id}")
 
-            conn = get_db_connection()
+            try:
+                fields = REVIEW_FIELDS.parse(request.args.get('fields'))
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            columns, source = review_columns(fields)
 
             if review_id:
                 # Get specific review
-                review = conn.execute(
-                    'SELECT r.*, u.username FROM reviews r JOIN users u ON r.user_id = u.id WHERE r.id = ?',
+                conn, review = store_shards.locate(
+                    f'SELECT {columns} FROM {source} WHERE r.id = ?',
                     (review_id,)
-                ).fetchone()
+                )
 
                 if not review:
-                    conn.close()
                     return {'message': 'Review not found'}, 404
 
                 conn.close()
@@ -30,40 +77,18 @@ class ReviewsResource(Resource):
 
                 if product_id:
                     # Get reviews for specific product
-                    reviews = conn.execute(
-                        'SELECT r.*, u.username FROM reviews r JOIN users u ON r.user_id = u.id WHERE r.product_id = ? ORDER BY r.created_at DESC',
-                        (product_id,)
-                    ).fetchall()
-
-                    # Calculate average rating
-                    avg_rating = conn.execute(
-                        'SELECT AVG(rating) as avg_rating, COUNT(*) as total_reviews FROM reviews WHERE product_id = ?',
-                        (product_id,)
-                    ).fetchone()
-
-                else:
-                    # Get all reviews (admin only)
-                    if not session.get('is_admin'):
-                        conn.close()
-                        return {'message': 'Admin access required'}, 403
-
-                    reviews = conn.execute(
-                        'SELECT r.*, u.username FROM reviews r JOIN users u ON r.user_id = u.id ORDER BY r.created_at DESC'
-                    ).fetchall()
-                    avg_rating = None
+                    return query_product_reviews(product_id, fields)
 
-                conn.close()
-
-                result = {
-                    'reviews': [dict(review) for review in reviews],
-                    'total': len(reviews)
-                }
+                # Get all reviews (admin only)
+                if not session.get('is_admin'):
+                    return {'message': 'Admin access required'}, 403
 
-                if avg_rating and avg_rating['total_reviews'] > 0:
-                    result['average_rating'] = round(avg_rating['avg_rating'], 1)
-                    result['total_reviews'] = avg_rating['total_reviews']
+                reviews, total = gather_reviews(fields)
 
-                return result
+                return {
+                    'reviews': reviews,
+                    'total': total
+                }
 
         except Exception as e:
             print(f"Error in reviews GET: {e}")
@@ -97,7 +122,7 @@ class ReviewsResource(Resource):
 
             user_id = session['user_id']
 
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
 
             # Check if user has purchased this product (optional - for validation)
@@ -156,22 +181,23 @@ class ReviewsResource(Resource):
 
             user_id = session['user_id']
 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
             # Check if review exists and belongs to user (or admin)
             if session.get('is_admin'):
-                review = cursor.execute('SELECT * FROM reviews WHERE id = ?', (review_id,)).fetchone()
+                conn, review = store_shards.locate('SELECT * FROM reviews WHERE id = ?', (review_id,), write=True)
             else:
-                review = cursor.execute(
+                conn = get_user_db_connection(user_id, write=True)
+                review = conn.execute(
                     'SELECT * FROM reviews WHERE id = ? AND user_id = ?',
                     (review_id, user_id)
                 ).fetchone()
 
             if not review:
-                conn.close()
+                if conn:
+                    conn.close()
                 return {'message': 'Review not found'}, 404
 
+            cursor = conn.cursor()
+
             # Build update query
             update_fields = []
             update_values = []
@@ -216,22 +242,23 @@ class ReviewsResource(Resource):
 
             user_id = session['user_id']
 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
             # Check if review exists and belongs to user (or admin)
             if session.get('is_admin'):
-                review = cursor.execute('SELECT * FROM reviews WHERE id = ?', (review_id,)).fetchone()
+                conn, review = store_shards.locate('SELECT * FROM reviews WHERE id = ?', (review_id,), write=True)
             else:
-                review = cursor.execute(
+                conn = get_user_db_connection(user_id, write=True)
+                review = conn.execute(
                     'SELECT * FROM reviews WHERE id = ? AND user_id = ?',
                     (review_id, user_id)
                 ).fetchone()
 
             if not review:
-                conn.close()
+                if conn:
+                    conn.close()
                 return {'message': 'Review not found'}, 404
 
+            cursor = conn.cursor()
+
             cursor.execute('DELETE FROM reviews WHERE id = ?', (review_id,))
             conn.commit()
             conn.close()
@@ -1,7 +1,9 @@
 from flask import request, session
 from flask_restful import Resource
 from database.db_init import get_db_connection, hash_password
+from database.deletion import tombstone_user, deletion_reaper
 import sqlite3
+from utils.serialization import query_json
 
 class UsersResource(Resource):
     def get(self, user_id=None):
@@ -14,7 +16,7 @@ class UsersResource(Resource):
             # Get specific user
             if session.get('is_admin') or session['user_id'] == user_id:
                 user = conn.execute(
-                    'SELECT id, username, email, is_admin, created_at FROM users WHERE id = ?',
+                    'SELECT id, username, email, is_admin, created_at FROM users WHERE id = ? AND deleted_at IS NULL',
                     (user_id,)
                 ).fetchone()
                 
@@ -32,12 +34,12 @@ class UsersResource(Resource):
         if not session.get('is_admin'):
             return {'message': 'Admin access required'}, 403
         
-        users = conn.execute(
-            'SELECT id, username, email, is_admin, created_at FROM users'
-        ).fetchall()
+        users, _ = query_json(
+            conn, 'SELECT id, username, email, is_admin, created_at FROM users WHERE deleted_at IS NULL'
+        )
         conn.close()
         
-        return [dict(user) for user in users]
+        return users
     
     def post(self):
         """Create new user (admin only or public registration)"""
@@ -152,18 +154,16 @@ class UsersResource(Resource):
         cursor = conn.cursor()
         
         # Check if user exists
-        user = cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        user = cursor.execute('SELECT * FROM users WHERE id = ? AND deleted_at IS NULL', (user_id,)).fetchone()
         if not user:
             conn.close()
             return {'message': 'User not found'}, 404
         
-        # Delete user (this will cascade delete related cart items, orders, etc.)
-        cursor.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
-        cursor.execute('DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE user_id = ?)', (user_id,))
-        cursor.execute('DELETE FROM orders WHERE user_id = ?', (user_id,))
-        cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        # Tombstone now; cart, orders, reviews etc. are reaped in the background
+        job_id = tombstone_user(conn, user_id)
         
         conn.commit()
         conn.close()
+        deletion_reaper.wake()
         
-        return {'success': True, 'message': 'User deleted successfully'}
\ No newline at end of file
+        return {'success': True, 'message': 'User deleted successfully', 'deletion_job': job_id}
\ No newline at end of file
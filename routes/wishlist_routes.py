@@ -1,9 +1,15 @@
 from flask import request, session
 from flask_restful import Resource
-from database.db_init import get_db_connection, get_products_db_connection
+from database.store_shards import get_user_db_connection
+from database.product_cache import get_product, get_products
 import traceback
+from utils.idempotency import idempotent
+from utils.fields import WISHLIST_FIELDS
+from utils.images import with_image_for
 
 class WishlistResource(Resource):
+    method_decorators = {'post': [idempotent]}
+
     def get(self, wishlist_id=None):
         try:
             print(f"Wishlist GET - Session: {dict(session)}, wishlist_id: {wishlist_id}")
@@ -15,67 +21,74 @@ class WishlistResource(Resource):
             user_id = session['user_id']
             print(f"Getting wishlist for user_id: {user_id}")
 
-            conn = get_db_connection()
-            products_conn = get_products_db_connection()
+            try:
+                fields = WISHLIST_FIELDS.parse(request.args.get('fields'))
+            except ValueError as e:
+                return {'message': str(e)}, 400
+            # Products are only looked up when a product field was asked for
+            with_product = fields is None or fields.wants('product')
+            columns = WISHLIST_FIELDS.sql(fields, extra=('product_id',) if with_product else ())
+
+            conn = get_user_db_connection(user_id)
 
             if wishlist_id:
                 # Get specific wishlist item
                 wishlist_item = conn.execute(
-                    'SELECT * FROM wishlist WHERE id = ? AND user_id = ?',
+                    f'SELECT {columns} FROM wishlist WHERE id = ? AND user_id = ?',
                     (wishlist_id, user_id)
                 ).fetchone()
 
                 if not wishlist_item:
                     conn.close()
-                    products_conn.close()
                     return {'message': 'Wishlist item not found'}, 404
 
-                # Get product details
-                product = products_conn.execute(
-                    'SELECT * FROM products WHERE id = ?',
-                    (wishlist_item['product_id'],)
-                ).fetchone()
-
                 conn.close()
-                products_conn.close()
 
                 result = dict(wishlist_item)
-                if product:
-                    result['product'] = dict(product)
+                if with_product:
+                    # Get product details
+                    product = get_product(wishlist_item['product_id'])
+                    if product:
+                        result['product'] = with_image_for(product, 'thumb')
 
-                return result
+                return result if fields is None else fields.project(result)
 
             else:
                 # Get all wishlist items for user
                 print("Fetching all wishlist items for user")
                 wishlist_items = conn.execute(
-                    'SELECT * FROM wishlist WHERE user_id = ? ORDER BY added_at DESC',
+                    f'SELECT {columns} FROM wishlist WHERE user_id = ? ORDER BY added_at DESC',
                     (user_id,)
                 ).fetchall()
 
                 print(f"Found {len(wishlist_items)} wishlist items")
 
+                if not with_product:
+                    conn.close()
+                    result = [fields.project(dict(item)) for item in wishlist_items]
+                    return {
+                        'items': result,
+                        'count': len(result)
+                    }
+
+                # Get product details for all wishlist items in one lookup
+                products = get_products(item['product_id'] for item in wishlist_items)
+
                 result = []
                 for item in wishlist_items:
-                    # Get product details for each wishlist item
-                    product = products_conn.execute(
-                        'SELECT * FROM products WHERE id = ?',
-                        (item['product_id'],)
-                    ).fetchone()
+                    product_dict = products.get(item['product_id'])
 
                     wishlist_item = dict(item)
-                    if product:
-                        product_dict = dict(product)
-                        wishlist_item['product'] = product_dict
+                    if product_dict:
+                        wishlist_item['product'] = with_image_for(product_dict, 'thumb')
                         print(f"  - Found product: {product_dict['name']}")
                     else:
                         print(f"  - Product {item['product_id']} not found")
                         wishlist_item['product'] = None
 
-                    result.append(wishlist_item)
+                    result.append(wishlist_item if fields is None else fields.project(wishlist_item))
 
                 conn.close()
-                products_conn.close()
 
                 print(f"Wishlist total items: {len(result)}")
                 return {
@@ -88,7 +101,6 @@ class WishlistResource(Resource):
             print(f"Traceback: {traceback.format_exc()}")
             try:
                 conn.close()
-                products_conn.close()
             except:
                 pass
             return {'success': False, 'message': 'Server error'}, 500
@@ -115,20 +127,13 @@ class WishlistResource(Resource):
             user_id = session['user_id']
 
             # Check if product exists
-            products_conn = get_products_db_connection()
-            product = products_conn.execute(
-                'SELECT * FROM products WHERE id = ?',
-                (product_id,)
-            ).fetchone()
+            product = get_product(product_id)
 
             if not product:
-                products_conn.close()
                 return {'success': False, 'message': 'Product not found'}, 404
 
-            products_conn.close()
-
             # Add to wishlist or check if already exists
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
 
             # Check if item already in wishlist
@@ -174,7 +179,7 @@ class WishlistResource(Resource):
 
             user_id = session['user_id']
 
-            conn = get_db_connection()
+            conn = get_user_db_connection(user_id, write=True)
             cursor = conn.cursor()
 
             # Check if wishlist item exists
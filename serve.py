@@ -0,0 +1,140 @@
+"""Production launcher built on gunicorn (pure-Python WSGI server).
+
+    APP_ENV=production python serve.py
+
+Runs WEB_WORKERS processes with WEB_THREADS threads each. With PRELOAD_APP
+the application (and database initialization) is loaded once in the master
+and shared copy-on-write; every worker then drops process-wide connections
+after fork via database.db_init.reset_connections() and starts its own
+background threads (reaper, reconciler, recommender, ...). The master runs
+none, so nothing is held mid-run when it forks a replacement worker.
+
+Signals (sent to the master process):
+    HUP   graceful reload: start new workers, then retire the old ones
+    TERM  graceful shutdown: stop accepting, drain in-flight requests for
+          up to GRACEFUL_TIMEOUT seconds
+    TTIN / TTOU  add / remove a worker
+
+With WEB_THREADS > 1, the gthread worker stamps each request with
+X-Request-Start when it queues it for a thread, so admission control can
+shed on time spent waiting for a thread. A value sent by the client is
+always replaced (it could opt out of shedding with a future time), unless
+TRUST_REQUEST_START says a front proxy sets it.
+
+When PRELOAD_APP is on, HUP re-forks workers from the already loaded app, so
+code changes need a full restart. Set PRELOAD_APP=0 to let HUP pick them up.
+"""
+import sys
+import time
+from gunicorn.app.base import BaseApplication
+from gunicorn.workers.gthread import ThreadWorker
+from gunicorn.workers.sync import SyncWorker
+from config import get_config
+
+LAUNCH_TIME = time.monotonic()
+
+
+def post_fork(server, worker):
+    from database.db_init import reset_connections
+    reset_connections()
+    if server.cfg.preload_app:
+        # Loaded in the master without its threads; without preload, load()
+        # runs in the worker and starts them itself
+        from app import start_background_workers
+        start_background_workers(server.app.wsgi().config)
+
+
+def when_ready(server):
+    """Check the startup-time budget once the master is ready to serve"""
+    config = server.app.app_config  # the config StoreServer was started with
+    elapsed = time.monotonic() - LAUNCH_TIME
+    if elapsed <= config.STARTUP_BUDGET:
+        server.log.info(f"Startup took {elapsed:.2f}s (budget {config.STARTUP_BUDGET:.1f}s)")
+        return
+    message = f"Startup took {elapsed:.2f}s, over the {config.STARTUP_BUDGET:.1f}s budget"
+    if config.STARTUP_BUDGET_STRICT:
+        server.log.error(message + "; shutting down (STARTUP_BUDGET_STRICT)")
+        # halt() stops the arbiter and exits with this code
+        server.halt(reason=message, exit_status=3)
+    server.log.warning(message)
+
+
+def stamp_request_start(req, queued_at, trusted):
+    """Replace a request's X-Request-Start with queued_at (None: just drop it)"""
+    if trusted and any(name == 'X-REQUEST-START' for name, _ in req.headers):
+        return
+    req.headers = [(name, value) for name, value in req.headers if name != 'X-REQUEST-START']
+    if queued_at is not None:
+        req.headers.append(('X-REQUEST-START', f't={queued_at:.6f}'))
+
+
+class QueueStampingWorker(ThreadWorker):
+    """gthread worker that records when each request started waiting for a thread"""
+    trust_request_start = False
+
+    def enqueue_req(self, conn):
+        conn.queued_at = time.time()
+        super().enqueue_req(conn)
+
+    def handle_request(self, req, conn):
+        stamp_request_start(req, getattr(conn, 'queued_at', None), self.trust_request_start)
+        return super().handle_request(req, conn)
+
+
+class RequestStartSyncWorker(SyncWorker):
+    """sync worker: requests do not queue inside it, so only untrusted stamps are dropped"""
+    trust_request_start = False
+
+    def handle_request(self, listener, req, client, addr):
+        stamp_request_start(req, None, self.trust_request_start)
+        return super().handle_request(listener, req, client, addr)
+
+
+def worker_int(worker):
+    worker.log.info(f"Worker {worker.pid} interrupted, draining")
+
+
+class StoreServer(BaseApplication):
+    def __init__(self, config_name=None):
+        self.config_name = config_name
+        self.app_config = get_config(config_name)
+        super().__init__()
+
+    def load_config(self):
+        c = self.app_config
+        worker_class = QueueStampingWorker if c.WEB_THREADS > 1 else RequestStartSyncWorker
+        worker_class.trust_request_start = c.TRUST_REQUEST_START
+        options = {
+            'bind': c.BIND,
+            'workers': c.WEB_WORKERS,
+            'threads': c.WEB_THREADS,
+            'worker_class': worker_class,
+            'preload_app': c.PRELOAD_APP,
+            'graceful_timeout': c.GRACEFUL_TIMEOUT,
+            'timeout': c.REQUEST_TIMEOUT,
+            'keepalive': c.KEEPALIVE,
+            'max_requests': c.MAX_REQUESTS,
+            'max_requests_jitter': c.MAX_REQUESTS // 10 if c.MAX_REQUESTS else 0,
+            'post_fork': post_fork,
+            'when_ready': when_ready,
+            'worker_int': worker_int,
+            'accesslog': '-',
+        }
+        for key, value in options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import create_app
+        return create_app(self.config_name, start_workers=not self.cfg.preload_app)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # gunicorn parses sys.argv itself; keep only our optional config name
+    config_name = argv[0] if argv else None
+    sys.argv = sys.argv[:1]
+    StoreServer(config_name).run()
+
+
+if __name__ == '__main__':
+    main()
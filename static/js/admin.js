@@ -31,6 +31,16 @@ async function loadAdminData() {
     loadAdminProducts();
 }
 
+// Dashboard totals come from server-side counters; null falls back to counting the loaded list
+async function loadAdminStats() {
+    try {
+        return await apiCall('/admin/stats');
+    } catch (error) {
+        console.error('Error loading admin stats:', error);
+        return null;
+    }
+}
+
 async function loadAdminProducts() {
     console.log('Loading admin products...');
     
@@ -40,7 +50,7 @@ async function loadAdminProducts() {
     }
     
     try {
-        const result = await apiCall('/products?sort=newest');
+        const [result, stats] = await Promise.all([apiCall('/products?sort=newest'), loadAdminStats()]);
         const products = result.products || result; // Handle both response formats
         const container = document.getElementById('admin-products-list');
         
@@ -49,7 +59,7 @@ async function loadAdminProducts() {
             return;
         }
         
-        displayAdminProducts(products, container);
+        displayAdminProducts(products, container, stats);
         
     } catch (error) {
         console.error('Error loading admin products:', error);
@@ -60,29 +70,36 @@ async function loadAdminProducts() {
     }
 }
 
-function displayAdminProducts(products, container) {
+function displayAdminProducts(products, container, stats = null) {
     if (!products || products.length === 0) {
         container.innerHTML = '<div class="no-data">No products found</div>';
         return;
     }
     
+    const productStats = stats ? stats.products : {
+        total: products.length,
+        in_stock: products.filter(p => p.stock > 0).length,
+        featured: products.filter(p => p.featured).length,
+        out_of_stock: products.filter(p => p.stock === 0).length
+    };
+    
     let html = `
         <div class="admin-stats">
             <div class="stats-grid">
                 <div class="stat-item">
-                    <span class="stat-number">${products.length}</span>
+                    <span class="stat-number">${productStats.total}</span>
                     <span class="stat-label">Total Products</span>
                 </div>
                 <div class="stat-item">
-                    <span class="stat-number">${products.filter(p => p.stock > 0).length}</span>
+                    <span class="stat-number">${productStats.in_stock}</span>
                     <span class="stat-label">In Stock</span>
                 </div>
                 <div class="stat-item">
-                    <span class="stat-number">${products.filter(p => p.featured).length}</span>
+                    <span class="stat-number">${productStats.featured}</span>
                     <span class="stat-label">Featured</span>
                 </div>
                 <div class="stat-item">
-                    <span class="stat-number">${products.filter(p => p.stock === 0).length}</span>
+                    <span class="stat-number">${productStats.out_of_stock}</span>
                     <span class="stat-label">Out of Stock</span>
                 </div>
             </div>
@@ -152,7 +169,7 @@ async function loadAdminOrders() {
     }
     
     try {
-        const orders = await apiCall('/orders');
+        const [orders, stats] = await Promise.all([fetchAllOrders(), loadAdminStats()]);
         const container = document.getElementById('admin-orders-list');
         
         if (!container) {
@@ -160,7 +177,7 @@ async function loadAdminOrders() {
             return;
         }
         
-        displayAdminOrders(orders, container);
+        displayAdminOrders(orders, container, stats);
         
     } catch (error) {
         console.error('Error loading admin orders:', error);
@@ -171,25 +188,28 @@ async function loadAdminOrders() {
     }
 }
 
-function displayAdminOrders(orders, container) {
+function displayAdminOrders(orders, container, stats = null) {
     if (!orders || orders.length === 0) {
         container.innerHTML = '<div class="no-data">No orders found</div>';
         return;
     }
     
+    const byStatus = stats ? stats.orders.by_status : {};
+    const countStatus = status => stats ? (byStatus[status] || 0) : orders.filter(o => o.status === status).length;
+    const totalOrders = stats ? stats.orders.total : orders.length;
     const statusCounts = {
-        pending: orders.filter(o => o.status === 'pending').length,
-        processing: orders.filter(o => o.status === 'processing').length,
-        shipped: orders.filter(o => o.status === 'shipped').length,
-        delivered: orders.filter(o => o.status === 'delivered').length,
-        cancelled: orders.filter(o => o.status === 'cancelled').length
+        pending: countStatus('pending'),
+        processing: countStatus('processing'),
+        shipped: countStatus('shipped'),
+        delivered: countStatus('delivered'),
+        cancelled: countStatus('cancelled')
     };
     
     let html = `
         <div class="admin-stats">
             <div class="stats-grid">
                 <div class="stat-item">
-                    <span class="stat-number">${orders.length}</span>
+                    <span class="stat-number">${totalOrders}</span>
                     <span class="stat-label">Total Orders</span>
                 </div>
                 <div class="stat-item status-pending">
@@ -273,7 +293,7 @@ async function loadAdminUsers() {
     }
     
     try {
-        const users = await apiCall('/users');
+        const [users, stats] = await Promise.all([apiCall('/users'), loadAdminStats()]);
         const container = document.getElementById('admin-users-list');
         
         if (!container) {
@@ -281,7 +301,7 @@ async function loadAdminUsers() {
             return;
         }
         
-        displayAdminUsers(users, container);
+        displayAdminUsers(users, container, stats);
         
     } catch (error) {
         console.error('Error loading admin users:', error);
@@ -292,14 +312,15 @@ async function loadAdminUsers() {
     }
 }
 
-function displayAdminUsers(users, container) {
+function displayAdminUsers(users, container, stats = null) {
     if (!users || users.length === 0) {
         container.innerHTML = '<div class="no-data">No users found</div>';
         return;
     }
     
-    const adminCount = users.filter(u => u.is_admin).length;
-    const regularCount = users.filter(u => !u.is_admin).length;
+    const totalUsers = stats ? stats.users.total : users.length;
+    const adminCount = stats ? stats.users.admins : users.filter(u => u.is_admin).length;
+    const regularCount = stats ? stats.users.regular : users.filter(u => !u.is_admin).length;
     
     let html = `
         <div class="admin-actions">
@@ -310,7 +331,7 @@ function displayAdminUsers(users, container) {
         <div class="admin-stats">
             <div class="stats-grid">
                 <div class="stat-item">
-                    <span class="stat-number">${users.length}</span>
+                    <span class="stat-number">${totalUsers}</span>
                     <span class="stat-label">Total Users</span>
                 </div>
                 <div class="stat-item admin-role">
@@ -543,6 +564,42 @@ function validateProductData(data) {
     return errors;
 }
 
+// Uploads go to the local image store; the returned URL is saved with the product
+async function uploadProductImage(input) {
+    const file = input.files && input.files[0];
+    const status = document.getElementById('product-image-status');
+    if (!file) return;
+    
+    const formData = new FormData();
+    formData.append('image', file);
+    if (status) status.textContent = 'Uploading...';
+    
+    try {
+        // Not apiCall(): the browser must set the multipart Content-Type itself
+        const response = await fetch(`${API_BASE}/images`, {
+            method: 'POST',
+            credentials: 'include',
+            body: formData
+        });
+        const result = await response.json();
+        
+        if (!response.ok) {
+            if (status) status.textContent = '';
+            showProductModalError(result.message || 'Image upload failed');
+            return;
+        }
+        
+        document.getElementById('product-image-url').value = result.url;
+        if (status) status.textContent = `Uploaded ${result.width}x${result.height}`;
+    } catch (error) {
+        console.error('Image upload failed:', error);
+        if (status) status.textContent = '';
+        showProductModalError('Image upload failed: ' + error.message);
+    } finally {
+        input.value = '';
+    }
+}
+
 function showProductModalError(message) {
     const errorDiv = document.getElementById('product-modal-error');
     if (errorDiv) {
@@ -1086,7 +1143,7 @@ function debugAdminPanel() {
             .catch(err => console.error('Products API test failed:', err));
             
         // Test orders API
-        apiCall('/orders')
+        apiCall('/orders?page=1')
             .then(result => console.log('Orders API test:', result))
             .catch(err => console.error('Orders API test failed:', err));
             
@@ -1353,7 +1410,7 @@ function debugAdminOrders() {
     
     if (currentUser && currentUser.is_admin) {
         console.log('Testing admin orders API...');
-        apiCall('/orders')
+        fetchAllOrders()
             .then(orders => {
                 console.log('Admin orders API test successful:', orders);
                 console.log(`Found ${orders.length} total orders`);
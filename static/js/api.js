@@ -23,6 +23,26 @@ async function apiCall(url, options = {}) {
     }
 }
 
+// Every order the user can see, walking the paginated {orders, pagination} listing
+async function fetchAllOrders() {
+    const orders = [];
+    for (let page = 1; ; page++) {
+        const result = await apiCall(`/orders?page=${page}&per_page=100`);
+        if (!result.orders) {
+            throw new Error(result.message || 'Failed to load orders');
+        }
+        orders.push(...result.orders);
+        if (page >= result.pagination.pages) {
+            return orders;
+        }
+    }
+}
+
+// Stored images come as /images/... paths on the API server; remote URLs pass through
+function imageSrc(url) {
+    return url ? new URL(url, API_BASE).href : '';
+}
+
 // Test connection function
 async function testConnection() {
     try {
@@ -1,5 +1,8 @@
 // Cart Functions with Enhanced Error Handling and Bug Fixes
 
+// Only what the cart view renders (sparse fieldset, see utils/fields.py)
+const CART_VIEW_FIELDS = 'quantity,subtotal,product.name,product.brand,product.price,product.stock';
+
 // Fixed Unicode issue in success message
 async function addToCart(productId) {
     console.log('Adding product to cart:', productId);
@@ -67,7 +70,7 @@ async function loadCart() {
     }
     
     try {
-        const cartData = await apiCall('/cart');
+        const cartData = await apiCall(`/cart?fields=${CART_VIEW_FIELDS}`);
         console.log('Cart data received:', cartData);
         
         displayCart(cartData);
@@ -281,7 +284,7 @@ async function updateCartCount() {
     }
     
     try {
-        const cartData = await apiCall('/cart');
+        const cartData = await apiCall('/cart?fields=quantity');
         console.log('Cart count data:', cartData);
         
         const count = cartData && cartData.items ? 
@@ -295,6 +298,29 @@ async function updateCartCount() {
     }
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Retry a request that failed at the network level (timeouts, dropped
+// connections); only safe for idempotent calls or ones sending an Idempotency-Key
+async function withRetries(request, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await request();
+        } catch (error) {
+            if (attempt >= attempts || error.name !== 'TypeError') {
+                throw error;
+            }
+            console.warn(`Request failed (attempt ${attempt}), retrying...`, error);
+            await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+        }
+    }
+}
+
 // FIXED CHECKOUT FUNCTION with better error handling
 async function checkout() {
     console.log('=== STARTING CHECKOUT PROCESS ===');
@@ -343,12 +369,16 @@ async function checkout() {
     
     try {
         console.log('Making checkout API call to /orders...');
-        const result = await apiCall('/orders', {
+        // Every retry of this checkout carries the same key, so the server
+        // replays the first order instead of placing a duplicate
+        const idempotencyKey = newIdempotencyKey();
+        const result = await withRetries(() => apiCall('/orders', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'Idempotency-Key': idempotencyKey
             }
-        });
+        }));
         
         console.log('Checkout result:', result);
         
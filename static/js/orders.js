@@ -14,7 +14,7 @@ async function loadOrders() {
     
     try {
         console.log('Making API call to /orders...');
-        const orders = await apiCall('/orders');
+        const orders = await fetchAllOrders();
         console.log('Orders loaded:', orders);
         displayOrders(orders);
     } catch (error) {
@@ -495,7 +495,7 @@ function debugOrders() {
     // Test API connectivity for orders
     console.log('Testing orders API...');
     if (currentUser) {
-        apiCall('/orders')
+        fetchAllOrders()
             .then(orders => {
                 console.log('Orders API test successful:', orders);
                 console.log(`Found ${orders.length} orders`);
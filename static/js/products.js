@@ -144,6 +144,10 @@ function displayProducts(products) {
             const category = product.category || 'Uncategorized';
             const brand = product.brand || '';
             const featured = product.featured || false;
+            // image_url is already the card-sized variant for uploaded images
+            const image = product.image_url
+                ? `<img class="product-image" src="${imageSrc(product.image_url)}" alt="" loading="lazy" decoding="async">`
+                : '';
             
             const featuredBadge = featured ? '<span class="featured-badge">Featured</span>' : '';
             const stockStatus = stock === 0 ? 'out-of-stock' : stock < 10 ? 'low-stock' : '';
@@ -151,6 +155,7 @@ function displayProducts(products) {
             
             card.innerHTML = `
                 ${featuredBadge}
+                ${image}
                 <div class="product-header">
                     <h3>${name}</h3>
                     ${brand ? `<span class="product-brand">${brand}</span>` : ''}
@@ -235,6 +240,32 @@ function updateProductStats() {
     }
 }
 
+// Search-box suggestions from the prefix index (/api/products/suggest)
+let suggestRequest = 0;
+
+async function loadSuggestions(query) {
+    const list = document.getElementById('product-suggestions');
+    if (!list) return;
+    const request = ++suggestRequest;
+    if (!query.trim()) {
+        list.innerHTML = '';
+        return;
+    }
+    try {
+        const result = await apiCall(`/products/suggest?q=${encodeURIComponent(query)}`);
+        if (request !== suggestRequest || !result) return;  // a newer keystroke won
+        const options = [
+            ...(result.products || []).map(p => p.name),
+            ...(result.terms || []).map(t => t.text)
+        ];
+        list.innerHTML = [...new Set(options)]
+            .map(text => `<option value="${text.replace(/&/g, '&amp;').replace(/"/g, '&quot;').replace(/</g, '&lt;')}">`)
+            .join('');
+    } catch (error) {
+        console.warn('Error loading suggestions:', error);
+    }
+}
+
 // Enhanced search and filter functions
 function searchProducts() {
     console.log('Search triggered');
@@ -286,9 +317,12 @@ function initializeProductsSection() {
     const searchInput = document.getElementById('product-search');
     if (searchInput) {
         let searchTimeout;
+        let suggestTimeout;
         searchInput.addEventListener('input', function() {
             clearTimeout(searchTimeout);
+            clearTimeout(suggestTimeout);
             searchTimeout = setTimeout(searchProducts, 500); // Debounce search
+            suggestTimeout = setTimeout(() => loadSuggestions(searchInput.value), 100);
         });
     }
     
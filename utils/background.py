@@ -0,0 +1,78 @@
+"""Daemon-thread workers for maintenance that must stay off the request path.
+
+PeriodicWorker runs run_once() every `interval` seconds on its own thread,
+and immediately when wake() is called (e.g. right after a request queued
+work for it). Threads do not survive fork, so each worker registers a
+post-fork hook that recreates its locks (the parent's thread may have held
+one at that moment) and starts a fresh thread if the parent had one.
+Subclasses create their own locks in _init_locks().
+
+    class Reaper(PeriodicWorker):
+        name = 'reaper'
+
+        def run_once(self):
+            ...
+
+    reaper = Reaper()
+    reaper.start(interval=5)
+    reaper.wake()
+"""
+import threading
+import traceback
+from database.db_init import register_post_fork
+
+
+class PeriodicWorker:
+    name = 'periodic-worker'
+
+    def __init__(self):
+        self.interval = 0
+        self._thread = None
+        self._init_locks()
+        register_post_fork(self.reset)
+
+    def _init_locks(self):
+        """Create the locks and events shared with the worker thread"""
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def start(self, interval):
+        self.interval = interval
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Run as soon as possible instead of at the next interval"""
+        self._wake.set()
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def reset(self):
+        """After fork: fresh locks, and a fresh thread if the parent was running one"""
+        self._thread = None
+        self._init_locks()
+        self.start(self.interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"{self.name} failed: {e}")
+                print(f"Traceback: {traceback.format_exc()}")
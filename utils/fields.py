@@ -0,0 +1,136 @@
+"""Sparse fieldsets: ?fields=id,name,price or ?fields=quantity,product.name
+
+Every read endpoint returns whole rows by default. With ?fields= the client
+names the fields it renders; they are checked against the resource's
+whitelist (a Fieldset) and pushed down into the SELECT list, so long
+descriptions, tags and timestamps are neither read from SQLite nor
+serialized. Embedded objects (a cart item's product, an order's items) are
+asked for with a dotted prefix, or by their bare name for all of their
+fields, and are not fetched at all when none of their fields is requested.
+
+`id` is always included. Unknown field names are rejected with ValueError,
+which the resources turn into a 400.
+"""
+from collections import namedtuple
+
+
+class Selection(namedtuple('Selection', 'fields embeds')):
+    """Parsed ?fields=: own field names plus (name, Selection) per embed; hashable"""
+
+    def wants(self, name):
+        return name in self.fields or any(embed == name for embed, _ in self.embeds)
+
+    def embed(self, name):
+        """Selection for an embedded object, or None when it was not asked for"""
+        for embed, selection in self.embeds:
+            if embed == name:
+                return selection
+        return None
+
+    def project(self, item):
+        """Copy of a full dict restricted to the selection (recursing into embeds)"""
+        result = {field: item[field] for field in self.fields if field in item}
+        for name, selection in self.embeds:
+            value = item.get(name)
+            if isinstance(value, list):
+                value = [selection.project(child) for child in value]
+            elif value is not None:
+                value = selection.project(value)
+            result[name] = value
+        return result
+
+
+class Fieldset:
+    """Whitelist of one resource's fields.
+
+    columns maps a field to the SQL expression that reads it; computed fields
+    are derived in Python and need no column; embeds maps an embedded
+    object's name to its own Fieldset.
+    """
+
+    def __init__(self, columns, computed=(), embeds=None):
+        self.columns = dict(columns)
+        self.computed = tuple(computed)
+        self.embeds = dict(embeds or {})
+        self.names = tuple(self.columns) + self.computed
+
+    def all(self):
+        return Selection(self.names, tuple((name, fieldset.all()) for name, fieldset in self.embeds.items()))
+
+    def parse(self, value):
+        """?fields= value -> Selection, or None when absent (the full representation)"""
+        if value is None or not value.strip():
+            return None
+        names = [part.strip() for part in value.split(',') if part.strip()]
+        selection, unknown = self._select(names)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return selection
+
+    def _select(self, names):
+        own, nested, unknown = {'id'}, {}, []
+        for name in names:
+            head, _, rest = name.partition('.')
+            if head in self.embeds:
+                nested.setdefault(head, []).append(rest)
+            elif name in self.names:
+                own.add(name)
+            else:
+                unknown.append(name)
+        embeds = []
+        for head, fieldset in self.embeds.items():
+            if head in nested:
+                if '' in nested[head]:
+                    selection, missing = fieldset.all(), []
+                else:
+                    selection, missing = fieldset._select(nested[head])
+                unknown.extend(f'{head}.{name}' for name in missing)
+                embeds.append((head, selection))
+        # Whitelist order, so equivalent requests produce the same Selection
+        return Selection(tuple(name for name in self.names if name in own), tuple(embeds)), unknown
+
+    def sql(self, selection, extra=()):
+        """SELECT list for the selection's stored fields plus `extra` ones the caller needs"""
+        names = self.names if selection is None else set(selection.fields) | set(extra)
+        return ', '.join(
+            expression if expression.rpartition('.')[2] == field else f'{expression} AS {field}'
+            for field, expression in self.columns.items() if field in names
+        )
+
+
+PRODUCT_FIELDS = Fieldset({
+    name: name for name in ('id', 'name', 'description', 'price', 'stock', 'category', 'brand', 'tags',
+                            'image_url', 'featured', 'stock_sharded', 'created_at', 'updated_at')
+})
+
+CART_FIELDS = Fieldset(
+    {name: name for name in ('id', 'user_id', 'product_id', 'quantity')},
+    computed=('subtotal',),
+    embeds={'product': PRODUCT_FIELDS},
+)
+
+WISHLIST_FIELDS = Fieldset(
+    {name: name for name in ('id', 'user_id', 'product_id', 'added_at')},
+    embeds={'product': PRODUCT_FIELDS},
+)
+
+ORDER_ITEM_FIELDS = Fieldset(
+    {name: name for name in ('id', 'order_id', 'product_id', 'quantity', 'price', 'product_name',
+                             'product_category', 'product_brand', 'product_image')},
+    computed=('name',),
+)
+
+ORDER_FIELDS = Fieldset(
+    {'id': 'o.id', 'user_id': 'o.user_id', 'total_amount': 'o.total_amount', 'status': 'o.status',
+     'created_at': 'o.created_at', 'username': 'u.username'},
+    embeds={'items': ORDER_ITEM_FIELDS},
+)
+
+REVIEW_FIELDS = Fieldset(
+    {'id': 'r.id', 'user_id': 'r.user_id', 'product_id': 'r.product_id', 'rating': 'r.rating',
+     'comment': 'r.comment', 'created_at': 'r.created_at', 'username': 'u.username'},
+)
+
+NOTIFICATION_FIELDS = Fieldset(
+    {name: name for name in ('id', 'user_id', 'title', 'message', 'type', 'read', 'created_at')},
+)
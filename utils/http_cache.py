@@ -0,0 +1,79 @@
+"""Helpers for HTTP conditional requests (ETag / Last-Modified / 304)."""
+import hashlib
+import os
+from datetime import datetime, timezone
+from flask import request, Response
+from werkzeug.http import http_date, quote_etag
+
+# Seconds browsers and proxies may reuse a catalog response without
+# revalidating. 0 means "cache, but always revalidate" (cheap 304s).
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '0'))
+
+
+def make_etag(*parts):
+    """Build an opaque (unquoted) ETag value from the given parts"""
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def parse_db_timestamp(value):
+    """Parse a SQLite 'YYYY-MM-DD HH:MM:SS[.fff]' UTC timestamp"""
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def _settled(last_modified, now=None):
+    """True once the second of last_modified is over.
+
+    Last-Modified has one-second resolution: until then, another write in
+    the same second would carry the same value, and a client holding the
+    earlier version would be told it is current.
+    """
+    now = now or datetime.now(timezone.utc)
+    return last_modified.replace(microsecond=0) < now.replace(microsecond=0)
+
+
+def cache_headers(etag, last_modified=None, max_age=None):
+    """Validator and Cache-Control headers for a cacheable public response.
+
+    Last-Modified is left out while the resource changed in the current
+    second (the ETag still validates it).
+    """
+    if max_age is None:
+        max_age = CATALOG_MAX_AGE
+    headers = {
+        'ETag': quote_etag(etag),
+        'Cache-Control': f'public, max-age={max_age}, must-revalidate',
+    }
+    if last_modified and _settled(last_modified):
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def validators_match(etag, last_modified, if_none_match, if_modified_since):
+    """True if parsed request validators match the current representation.
+
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110), which
+    is not trusted for a resource changed in the current second.
+    """
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if last_modified and if_modified_since and _settled(last_modified):
+        return last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def is_not_modified(etag, last_modified=None):
+    """True if the current Flask request's validators match"""
+    return validators_match(etag, last_modified, request.if_none_match, request.if_modified_since)
+
+
+def not_modified(headers):
+    """Empty 304 response carrying the same validators as a 200 would"""
+    return Response(status=304, headers=headers)
@@ -0,0 +1,121 @@
+"""Idempotency-Key support for mutating Flask-RESTful methods.
+
+A client that may retry a POST/PUT/DELETE sends the same Idempotency-Key
+header on every attempt. The first attempt runs the handler and its response
+is stored (database/idempotency.py); retries get that response back with an
+Idempotent-Replayed: true header instead of running the handler again. A
+retry that arrives while the first attempt is still running waits for it
+(up to IDEMPOTENCY_WAIT seconds, then 409). Reusing a key for a different
+request body or endpoint is rejected with 422.
+
+Requests without the header, and anonymous requests, run as before.
+Server errors (5xx) are not stored, so the client can retry them. The
+handler finds the key in g.idempotency_key, to record it with its own
+writes (checkout stores it on the order).
+
+    class OrdersResource(Resource):
+        method_decorators = {'post': [idempotent]}
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import g, request, session, Response
+from database import idempotency
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 30))
+MAX_KEY_LENGTH = 255
+
+# Requests this process is running, so local duplicates can wait on an event
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.query_string, request.get_data()):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def split_response(result):
+    """(data, code, headers) from whatever a Resource method returned"""
+    if isinstance(result, tuple):
+        data, code, headers = (tuple(result) + (200, None))[:3]
+        return data, code, headers
+    return result, 200, None
+
+
+def _wait_for(scope, key, fingerprint):
+    """Poll the key until the in-flight request finishes or the wait runs out"""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    delay = 0.02
+    while True:
+        with _in_flight_lock:
+            event = _in_flight.get((scope, key))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return idempotency.IN_FLIGHT, None
+        if event is not None:
+            event.wait(remaining)
+        else:
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+        outcome = idempotency.claim(scope, key, fingerprint)
+        if outcome[0] != idempotency.IN_FLIGHT:
+            return outcome
+
+
+def _replay(stored):
+    status_code, body = stored
+    return json.loads(body), status_code, {'Idempotent-Replayed': 'true'}
+
+
+def idempotent(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        user_id = session.get('user_id')
+        if not key or not user_id:
+            return method(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return {'success': False, 'message': f'{IDEMPOTENCY_HEADER} is too long'}, 400
+
+        scope = f'{user_id}:{request.method}:{request.endpoint}'
+        fingerprint = request_fingerprint()
+        state, stored = idempotency.claim(scope, key, fingerprint)
+        if state == idempotency.IN_FLIGHT:
+            state, stored = _wait_for(scope, key, fingerprint)
+        if state == idempotency.REPLAY:
+            return _replay(stored)
+        if state == idempotency.MISMATCH:
+            return {'success': False,
+                    'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'}, 422
+        if state == idempotency.IN_FLIGHT:
+            return {'success': False,
+                    'message': 'A request with this Idempotency-Key is still being processed'}, 409
+
+        event = threading.Event()
+        with _in_flight_lock:
+            _in_flight[(scope, key)] = event
+        stored_response = False
+        g.idempotency_key = key
+        try:
+            result = method(*args, **kwargs)
+            if not isinstance(result, Response):
+                data, code, _ = split_response(result)
+                if code < 500:
+                    idempotency.complete(scope, key, code, json.dumps(data))
+                    stored_response = True
+            return result
+        finally:
+            if not stored_response:
+                idempotency.release(scope, key)
+            with _in_flight_lock:
+                _in_flight.pop((scope, key), None)
+            event.set()
+    return wrapper
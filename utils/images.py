@@ -0,0 +1,237 @@
+"""Content-addressed product image store.
+
+Uploaded images are stored byte-for-byte under the SHA-256 of their content,
+so uploading the same file twice keeps one copy and a file never changes
+once written:
+
+    <IMAGE_DIR>/ab/ab12...ef.jpg        original, served at /images/ab12...ef.jpg
+    <IMAGE_DIR>/ab/ab12...ef_400.jpg    400px variant, /images/ab12...ef/400.jpg
+
+Variants are scaled to fit a square box (never upscaled, EXIF orientation
+applied, metadata dropped) for each size in IMAGE_SIZES, which names the
+size used per view ('thumb:160,card:400,detail:960'). They are generated by
+the thumbnailer pool off the request path; a variant that is not there yet
+is served as the original (not cached long) and queued again, so a crash or
+a new size heals on first request.
+
+products.image_url keeps the original's URL; image_url_for() turns it into
+the variant URL of a view. Remote URLs are left as they are.
+
+Pillow is optional; without it uploads return 501. Stored files are still
+served.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from database.db_init import register_post_fork
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+PILLOW_REQUIRED = 'Pillow is required for image uploads (pip install Pillow)'
+IMAGE_DIR = os.environ.get('IMAGE_DIR', 'images')
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 2 ** 20))
+IMAGE_URL_PREFIX = '/images/'
+# Pillow format -> file extension, content type
+IMAGE_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'WEBP': ('webp', 'image/webp'),
+    'GIF': ('gif', 'image/gif'),
+}
+CONTENT_TYPES = dict(IMAGE_FORMATS.values())
+SAVE_OPTIONS = {
+    'jpg': {'quality': 85, 'optimize': True, 'progressive': True},
+    'webp': {'quality': 80, 'method': 4},
+    'png': {},
+    'gif': {},
+}
+
+_LOCAL_URL = re.compile(r'/images/([0-9a-f]{64})(?:/\d+)?\.(jpg|png|webp|gif)')
+
+
+def parse_sizes(value):
+    """'thumb:160,card:400' -> {'thumb': 160, 'card': 400}"""
+    sizes = {}
+    for part in value.split(','):
+        view, _, px = part.partition(':')
+        if view.strip() and px.strip():
+            sizes[view.strip()] = int(px)
+    return sizes
+
+
+IMAGE_SIZES = parse_sizes(os.environ.get('IMAGE_SIZES', 'thumb:160,card:400,detail:960'))
+VARIANT_SIZES = frozenset(IMAGE_SIZES.values())
+
+
+def image_path(digest, ext, size=None):
+    name = digest if size is None else f'{digest}_{size}'
+    return os.path.join(IMAGE_DIR, digest[:2], f'{name}.{ext}')
+
+
+def image_url(digest, ext, size=None):
+    if size is None:
+        return f'{IMAGE_URL_PREFIX}{digest}.{ext}'
+    return f'{IMAGE_URL_PREFIX}{digest}/{size}.{ext}'
+
+
+def parse_image_url(url):
+    """(digest, ext) of a stored image's original or variant URL, else None"""
+    if not url or not url.startswith(IMAGE_URL_PREFIX):
+        return None
+    match = _LOCAL_URL.fullmatch(url)
+    return match.groups() if match else None
+
+
+def canonical_image_url(url):
+    """The original's URL for any URL of a stored image (admin forms send back variant URLs)"""
+    parsed = parse_image_url(url)
+    return image_url(*parsed) if parsed else url
+
+
+def image_url_for(url, view):
+    """The URL to render `url` with in a view (a key of IMAGE_SIZES)"""
+    parsed = parse_image_url(url)
+    if not parsed or view not in IMAGE_SIZES:
+        return url
+    return image_url(*parsed, IMAGE_SIZES[view])
+
+
+def with_image_for(product, view):
+    """Product dict with image_url pointing at the view's variant (copied only if it changes)"""
+    url = product.get('image_url')
+    resized = image_url_for(url, view)
+    if resized == url:
+        return product
+    return dict(product, image_url=resized)
+
+
+def variant_urls(digest, ext):
+    return {view: image_url(digest, ext, size) for view, size in IMAGE_SIZES.items()}
+
+
+def _write_atomic(path, data_or_image, ext=None):
+    """Write to a temporary file beside `path` and rename, so readers never see a partial file"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(data_or_image, bytes):
+                f.write(data_or_image)
+            else:
+                data_or_image.save(f, format=ext.replace('jpg', 'jpeg'), **SAVE_OPTIONS[ext])
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def store_image(data):
+    """Store uploaded image bytes; returns (digest, ext, width, height, created).
+
+    Raises RuntimeError without Pillow and ValueError for data that is not
+    a JPEG, PNG, WebP or GIF image.
+    """
+    if Image is None:
+        raise RuntimeError(PILLOW_REQUIRED)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except Exception:  # Pillow raises a variety of errors for bad data
+        raise ValueError('Not a valid image')
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Unsupported image format {image_format}, expected JPEG, PNG, WebP or GIF')
+    ext = IMAGE_FORMATS[image_format][0]
+    digest = hashlib.sha256(data).hexdigest()
+    path = image_path(digest, ext)
+    created = not os.path.exists(path)
+    if created:
+        _write_atomic(path, data)
+    return digest, ext, width, height, created
+
+
+def missing_variants(digest, ext):
+    return sorted((size for size in VARIANT_SIZES if not os.path.exists(image_path(digest, ext, size))),
+                  reverse=True)
+
+
+def make_variants(digest, ext, sizes=None):
+    """Write the missing size variants of a stored image; returns the sizes written"""
+    sizes = missing_variants(digest, ext) if sizes is None else sorted(sizes, reverse=True)
+    if not sizes:
+        return []
+    with Image.open(image_path(digest, ext)) as image:
+        # JPEG can decode straight to a reduced scale (1/2 .. 1/8), which
+        # skips most of the work for large photos
+        image.draft('RGB', (sizes[0], sizes[0]))
+        image = ImageOps.exif_transpose(image)
+        if image.mode == 'P' or (ext == 'jpg' and image.mode not in ('RGB', 'L')):
+            image = image.convert('RGBA' if ext != 'jpg' else 'RGB')
+        # Largest first, each size from the one before: every step shrinks
+        # an already small image
+        for size in sizes:
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            _write_atomic(image_path(digest, ext, size), image, ext)
+    return sizes
+
+
+class Thumbnailer:
+    """Generates size variants on a thread pool (Pillow releases the GIL while resizing).
+
+    With no workers, variants are made during the upload request instead.
+    """
+    name = 'thumbnailer'
+
+    def __init__(self):
+        self.workers = 0
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        register_post_fork(self.reset)
+
+    def start(self, workers):
+        self.workers = workers
+
+    def submit(self, digest, ext):
+        """Queue variant generation for a stored image (once, however often it is asked for)"""
+        if Image is None:
+            return
+        if self.workers <= 0:
+            self._run(digest, ext)
+            return
+        with self._lock:
+            if digest in self._pending:
+                return
+            self._pending.add(digest)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        self._executor.submit(self._run, digest, ext)
+
+    def reset(self):
+        """After fork: the parent's pool threads do not exist in the child, nor does a holder of its lock"""
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _run(self, digest, ext):
+        try:
+            make_variants(digest, ext)
+        except Exception as e:
+            print(f"{self.name} failed for {digest}.{ext}: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+
+thumbnailer = Thumbnailer()
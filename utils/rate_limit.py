@@ -0,0 +1,326 @@
+"""Per-client rate limiting and admission control.
+
+Every API request is charged against a token bucket: the user's bucket when
+logged in, otherwise the client IP's. Behind reverse proxies, set
+TRUSTED_PROXIES to how many of them append to X-Forwarded-For so the IP is
+the client's rather than the proxy's (app.py installs ProxyFix; asgi.py
+resolves it with forwarded_client()). Buckets refill at RATE_LIMIT_RATE
+tokens per second up to RATE_LIMIT_BURST. Expensive requests cost more than
+one token (ENDPOINT_COSTS): catalog search, the unpaginated admin order and
+user listings, and login/register, which hash passwords. A client out of
+tokens gets 429 with Retry-After set to when its bucket will cover the
+request again.
+
+Independently, each worker process sheds load when it is saturated:
+    MAX_QUEUE_MS       time the request waited before reaching the app;
+                       above it the request gets 503 instead of adding to
+                       the backlog. Measured from the X-Request-Start
+                       header, which serve.py's worker stamps when it hands
+                       the connection to its thread pool, replacing any
+                       value the client sent. With TRUST_REQUEST_START, a
+                       front proxy's stamp is kept instead (e.g. nginx with
+                       `proxy_set_header X-Request-Start "t=${msec}"`), which
+                       also covers time queued in front of gunicorn
+    SHED_LATENCY_MS    moving average of response times; above it, requests
+                       costing more than one token get 503 so cheap reads
+                       keep flowing while the backlog drains
+
+Counting requests in flight would not work here: a gthread worker runs at
+most WEB_THREADS requests, and the rest wait in gunicorn before any app
+code sees them.
+
+Buckets live in process memory, one set per worker process. Each process
+refills at RATE_LIMIT_RATE / RATE_LIMIT_WORKERS (the number of worker
+processes, WEB_WORKERS in production), so a client whose requests spread
+over the workers gets RATE_LIMIT_RATE in total; a client pinned to one
+worker by a keep-alive connection gets that worker's share. Each process
+keeps the full RATE_LIMIT_BURST, so page loads are not cut short. With
+RATE_LIMIT_DB set, buckets are also saved to that SQLite file every
+RATE_LIMIT_PERSIST_INTERVAL seconds and loaded on start, so restarts and
+reloads do not hand every client a full burst again.
+
+asgi.py charges the same buckets for the reads it serves itself; those skip
+the queue check, since the async path is already bounded by
+ASYNC_DB_MAX_CONCURRENCY.
+"""
+import math
+import sqlite3
+import threading
+import time
+import traceback
+from flask import request, session
+from database.db_init import register_post_fork
+
+# (endpoint, method) -> cost; a callable is given the query args and view args.
+# (`in` before indexing: a missing-key lookup on request.args builds an exception.)
+ENDPOINT_COSTS = {
+    ('productsresource', 'GET'): lambda args, view_args: 5 if 'search' in args and args['search'] else 1,
+    ('authresource', 'POST'): 10,
+    ('ordersresource', 'GET'): lambda args, view_args: 1 if view_args.get('order_id') or 'page' in args else 5,
+    ('usersresource', 'GET'): lambda args, view_args: 1 if view_args.get('user_id') else 5,
+    ('salesanalyticsresource', 'GET'): 5,
+    ('topsellersresource', 'GET'): 5,
+    ('inventoryforecastresource', 'GET'): 20,
+    ('similarproductsresource', 'GET'): 2,
+}
+# Image files are immutable and mostly served from browser caches, like static files
+EXEMPT_ENDPOINTS = {'index', 'static', 'imagefileresource'}
+MAX_BUCKETS = 100_000
+LATENCY_SMOOTHING = 0.1  # weight of the newest sample in the moving average
+
+
+class RateLimiter:
+    """Token buckets keyed by client; thread-safe"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # key -> [tokens, last refill (monotonic)]
+        self._lock = threading.Lock()
+
+    def acquire(self, key, cost=1, now=None):
+        """Take `cost` tokens; returns 0 on success, else seconds until they are available"""
+        now = time.monotonic() if now is None else now
+        cost = min(cost, self.burst)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._evict_idle(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0
+            return (cost - bucket[0]) / self.rate
+
+    def refund(self, key, cost=1):
+        """Give back tokens for a request that was charged but handled elsewhere"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + cost)
+
+    def _evict_idle(self, now):
+        """Drop buckets that have refilled completely (they behave like new ones)"""
+        full_after = self.burst / self.rate
+        idle = [key for key, (_, last) in self._buckets.items() if now - last >= full_after]
+        for key in idle or list(self._buckets)[:len(self._buckets) // 10]:
+            del self._buckets[key]
+
+    def snapshot(self):
+        """[(key, tokens, age seconds)] for persistence"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, tokens, now - last) for key, (tokens, last) in self._buckets.items()]
+
+    def restore(self, rows):
+        now = time.monotonic()
+        with self._lock:
+            for key, tokens, age in rows:
+                self._buckets[key] = [min(tokens, self.burst), now - age]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def queue_time(request_start, now=None):
+    """Seconds since an X-Request-Start value ('t=<epoch seconds, ms or us>'), 0 if absent or invalid"""
+    if not request_start:
+        return 0.0
+    try:
+        started = float(request_start.strip().removeprefix('t='))
+    except ValueError:
+        return 0.0
+    while started > 1e11:  # milliseconds or microseconds since the epoch
+        started /= 1000
+    return max((time.time() if now is None else now) - started, 0.0)
+
+
+class AdmissionController:
+    """Sheds on queueing delay and smoothed latency for one process"""
+
+    def __init__(self, max_queue_ms, shed_latency_ms):
+        self.max_queue = max_queue_ms / 1000.0
+        self.shed_latency = shed_latency_ms / 1000.0
+        self.latency = 0.0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def admit(self, cost, queued=0.0):
+        """queued: seconds the request waited before reaching the app"""
+        overloaded = (
+            (self.max_queue and queued > self.max_queue)
+            or (self.shed_latency and cost > 1 and self.latency > self.shed_latency)
+        )
+        if overloaded:
+            with self._lock:
+                self.shed += 1
+            return False
+        return True
+
+    def finish(self, elapsed):
+        with self._lock:
+            self.latency += LATENCY_SMOOTHING * (elapsed - self.latency)
+
+
+class BucketStore:
+    """Optional SQLite persistence of bucket state, flushed by a daemon thread"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.path = None
+        self.interval = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        return conn
+
+    def load(self):
+        conn = self._connect()
+        try:
+            now = time.time()
+            rows = conn.execute('SELECT key, tokens, updated_at FROM rate_limit_buckets').fetchall()
+            self.limiter.restore((key, tokens, max(now - updated_at, 0)) for key, tokens, updated_at in rows)
+        finally:
+            conn.close()
+
+    def save(self):
+        now = time.time()
+        rows = [(key, tokens, now - age) for key, tokens, age in self.limiter.snapshot()
+                if tokens < self.limiter.burst]  # full buckets need no record
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?',
+                         (now - self.limiter.burst / self.limiter.rate,))
+            conn.executemany('INSERT OR REPLACE INTO rate_limit_buckets VALUES (?, ?, ?)', rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def start(self, path, interval):
+        self.path, self.interval = path, interval
+        if not path or interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rate-limit-store', daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        """After fork: threads do not survive, start a fresh one in the child"""
+        self._thread = None
+        self.start(self.path, self.interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Saving rate limit buckets failed: {e}")
+                print(f"Traceback: {traceback.format_exc()}")
+
+
+def request_cost(endpoint, method, args, view_args):
+    cost = ENDPOINT_COSTS.get((endpoint, method), 1)
+    return cost(args, view_args or {}) if callable(cost) else cost
+
+
+def forwarded_client(forwarded_for, remote_addr, trusted_proxies):
+    """Client address as ProxyFix resolves it: the entry `trusted_proxies` from the right of X-Forwarded-For"""
+    if trusted_proxies and forwarded_for:
+        values = [value.strip() for value in forwarded_for.split(',')]
+        if len(values) >= trusted_proxies:
+            return values[-trusted_proxies]
+    return remote_addr
+
+
+def client_key(user_id, remote_addr):
+    if user_id:
+        return f'user:{user_id}'
+    return f'ip:{remote_addr}'
+
+
+class RequestGate:
+    """Rate limit plus admission check shared by the Flask hooks and asgi.py"""
+
+    def __init__(self, limiter, admission):
+        self.limiter = limiter
+        self.admission = admission
+
+    def limit(self, key, cost):
+        """Rate limit only: None if the client has the tokens, else (status, body, headers)"""
+        retry_after = self.limiter.acquire(key, cost)
+        if retry_after:
+            return self._reject(429, retry_after, 'Too many requests, please slow down')
+        return None
+
+    def enter(self, key, cost, queued=0.0):
+        """None if admitted (call leave() when done), else (status, body, headers)"""
+        rejected = self.limit(key, cost)
+        if rejected:
+            return rejected
+        if not self.admission.admit(cost, queued):
+            return self._reject(503, 1, 'Server is busy, please retry shortly')
+        return None
+
+    def leave(self, elapsed):
+        self.admission.finish(elapsed)
+
+    @staticmethod
+    def _reject(status, retry_after, message):
+        headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+        return status, {'success': False, 'message': message}, headers
+
+
+def init_rate_limiting(app):
+    """Install the request gate as before/teardown hooks; also kept in app.extensions"""
+    config = app.config
+    if not config['RATE_LIMIT_ENABLED']:
+        return None
+    limiter = RateLimiter(config['RATE_LIMIT_RATE'] / max(config['RATE_LIMIT_WORKERS'], 1),
+                          config['RATE_LIMIT_BURST'])
+    gate = RequestGate(limiter, AdmissionController(config['MAX_QUEUE_MS'], config['SHED_LATENCY_MS']))
+    if config['RATE_LIMIT_DB']:
+        store = BucketStore(limiter)
+        store.path = config['RATE_LIMIT_DB']
+        store.load()
+        store.start(store.path, config['RATE_LIMIT_PERSIST_INTERVAL'])
+        register_post_fork(store.reset)
+    app.extensions['rate_limit'] = gate
+
+    @app.before_request
+    def admit_request():
+        req = request._get_current_object()  # one proxy lookup instead of several
+        endpoint, method = req.endpoint, req.method
+        if method == 'OPTIONS' or endpoint in EXEMPT_ENDPOINTS:
+            return None
+        cost = ENDPOINT_COSTS.get((endpoint, method), 1)
+        if callable(cost):
+            cost = cost(req.args, req.view_args or {})
+        rejected = gate.enter(client_key(session.get('user_id'), req.remote_addr), cost,
+                              queue_time(req.environ.get('HTTP_X_REQUEST_START')))
+        if rejected:
+            status, body, headers = rejected
+            return body, status, headers
+        req.environ['rate_limit.admitted_at'] = time.perf_counter()
+        return None
+
+    @app.teardown_request
+    def release_request(exc=None):
+        started = request.environ.pop('rate_limit.admitted_at', None)
+        if started is not None:
+            gate.leave(time.perf_counter() - started)
+
+    return gate
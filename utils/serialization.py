@@ -0,0 +1,146 @@
+"""JSON serialization shared by the Flask-RESTful API and the ASGI read path.
+
+The encoder is orjson when it is installed and the standard library json
+module otherwise (JSON_BACKEND=json forces the fallback). Both write compact
+UTF-8 JSON, so a body does not depend on which server sends it.
+
+Large result sets skip the Row -> dict -> JSON round trip: encode_rows()
+turns query rows into a RawJSON fragment using keys encoded once per column
+list, and dumps() copies fragments into the response unchanged. A fragment
+can be the whole response or a value inside (nested) dicts; lists are not
+searched for fragments.
+"""
+import json
+import os
+import sqlite3
+from functools import lru_cache
+from json.encoder import encode_basestring
+from flask import make_response, current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'orjson')
+if JSON_BACKEND not in ('orjson', 'json'):
+    raise ValueError(f"Unknown JSON_BACKEND '{JSON_BACKEND}', expected orjson or json")
+if orjson is None:
+    JSON_BACKEND = 'json'
+
+
+class RawJSON(bytes):
+    """Already-encoded JSON that dumps() copies into the output as-is"""
+
+
+def _default(obj):
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if JSON_BACKEND == 'orjson':
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def _encode(data):
+        return orjson.dumps(data, default=_default, option=_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def _encode(data):
+        return _encoder.encode(data).encode()
+
+
+def _contains_raw(obj):
+    return any(isinstance(value, RawJSON) or (type(value) is dict and _contains_raw(value))
+               for value in obj.values())
+
+
+def _splice(obj):
+    if isinstance(obj, RawJSON):
+        return obj
+    if type(obj) is dict and _contains_raw(obj):
+        return b'{' + b','.join(_encode(str(key)) + b':' + _splice(value) for key, value in obj.items()) + b'}'
+    return _encode(obj)
+
+
+def dumps(data):
+    """Encode a response body as bytes; both servers produce byte-identical JSON"""
+    return _splice(data) + b'\n'
+
+
+# Standard-library row encoding: one C call per value, chosen by type. Like
+# orjson, non-finite floats become null rather than invalid NaN/Infinity.
+_INF = float('inf')
+_VALUE_ENCODERS = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: lambda value: float.__repr__(value) if -_INF < value < _INF else 'null',
+    type(None): lambda value: 'null',
+}
+
+
+def _encode_value(value):
+    encoder = _VALUE_ENCODERS.get(type(value))
+    return encoder(value) if encoder else _encode(value).decode()
+
+
+class RowEncoder:
+    """Encodes rows of one column list as a JSON array of objects"""
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        # '{"id":%s,"name":%s}': keys escaped once, values filled in per row
+        self.template = '{' + ','.join(
+            encode_basestring(column).replace('%', '%%') + ':%s' for column in self.columns
+        ) + '}'
+        self.byte_template = self.template.encode()
+
+    def encode(self, rows):
+        """RawJSON for rows given as tuples (or sqlite3.Row) in column order"""
+        if JSON_BACKEND == 'orjson':
+            # Each value through orjson straight into the byte template
+            dumps, template = orjson.dumps, self.byte_template
+            return RawJSON(b'[' + b','.join([template % tuple([dumps(value) for value in row])
+                                             for row in rows]) + b']')
+        template = self.template
+        try:
+            body = ','.join([template % tuple([_VALUE_ENCODERS[type(value)](value) for value in row])
+                             for row in rows])
+        except KeyError:  # a value of another type (blob, bool); take the general path
+            body = ','.join([template % tuple([_encode_value(value) for value in row]) for row in rows])
+        return RawJSON(('[' + body + ']').encode())
+
+
+@lru_cache(maxsize=256)
+def row_encoder(columns):
+    return RowEncoder(columns)
+
+
+def encode_rows(columns, rows):
+    """RawJSON array with one object per row, keyed by column name"""
+    return row_encoder(tuple(columns)).encode(rows)
+
+
+def query_json(conn, sql, params=()):
+    """Run a query and return (RawJSON array of row objects, row count).
+
+    Rows are fetched as plain tuples, so neither sqlite3.Row objects nor
+    dicts are built for them.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(sql, params).fetchall()
+    return encode_rows([column[0] for column in cursor.description], rows), len(rows)
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for application/json"""
+    body = dumps(data)
+    if current_app.debug:
+        # Indented for reading in a browser; debug only, it decodes the body again
+        body = json.dumps(json.loads(body), indent=4, ensure_ascii=False) + '\n'
+    resp = make_response(body, code)
+    resp.headers.extend(headers or {})
+    resp.headers['Content-Type'] = 'application/json'
+    return resp
@@ -0,0 +1,6 @@
+"""WSGI entry point: `gunicorn wsgi:app` (serve.py wraps this with tuned settings)"""
+import os
+from app import create_app
+
+# Served processes default to production config (keeps the existing catalog)
+app = create_app(os.environ.get('APP_ENV', 'production'))